@@ -0,0 +1,272 @@
+# The MIT License
+#
+# Copyright (c) 2010 Ryan Bergstrom
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import hashlib
+import os
+import os.path
+import tempfile
+import threading
+
+from collections import OrderedDict
+
+from http import etag_matches
+
+__all__ = ['ArtworkCache']
+
+class _Entry(object):
+    def __init__(self, data, etag, content_type):
+        self.data = data
+        self.etag = etag
+        self.content_type = content_type
+
+class _Miss(object):
+    """A load in progress, shared by every caller asking for the same key."""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.entry = None
+        self.error = None
+
+class ArtworkCache(object):
+    """
+    Cache for artwork images (nowplayingartwork and item artwork), keyed by
+    (miid, revision) or any other hashable key that changes with the image.
+
+    Images are held in memory up to max_bytes, least recently used first out.
+    If a directory is given, evicted images are written there and read back
+    on the next request instead of being loaded again, up to max_disk_bytes
+    (again least recently used first out, with files left by an earlier run
+    counted oldest first). Concurrent requests
+    for an image that is not cached share a single load.
+
+    Each image gets an ETag from its content, so conditional requests can be
+    answered with 304 Not Modified (see respond).
+
+    Example:
+        cache = ArtworkCache(8 * 1024 * 1024, '/var/cache/dacpy/artwork')
+        status, headers, body = cache.respond((miid, revision), load,
+                                              request.headers.get('if-none-match'))
+    """
+
+    def __init__(self, max_bytes=8 * 1024 * 1024, directory=None,
+                 max_disk_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self.size = 0
+        self.disk_size = 0
+        self._entries = OrderedDict()
+        self._files = OrderedDict()
+        self._misses = {}
+        self._lock = threading.Lock()
+        if directory:
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            self._scan()
+
+    def _scan(self):
+        """Registers the files already in the directory, oldest first."""
+        files = []
+        for name in os.listdir(self.directory):
+            if len(name) != 40:
+                continue
+            try:
+                st = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            files.append((st.st_mtime, name, st.st_size))
+        files.sort()
+        for mtime, name, size in files:
+            self._files[name] = size
+            self.disk_size += size
+        self._trim()
+
+    def _name(self, key):
+        return hashlib.sha1(repr(key)).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, self._name(key))
+
+    def _trim(self):
+        """Removes the least recently used files over max_disk_bytes."""
+        removed = []
+        with self._lock:
+            while self.disk_size > self.max_disk_bytes and self._files:
+                name, size = self._files.popitem(last=False)
+                self.disk_size -= size
+                removed.append(name)
+        for name in removed:
+            try:
+                os.unlink(os.path.join(self.directory, name))
+            except OSError:
+                pass
+
+    def _store(self, key, entry):
+        """Adds an entry to the memory tier, spilling older entries to disk."""
+        spilled = []
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old.data)
+            if len(entry.data) <= self.max_bytes:
+                self._entries[key] = entry
+                self.size += len(entry.data)
+            while self.size > self.max_bytes:
+                oldkey, old = self._entries.popitem(last=False)
+                self.size -= len(old.data)
+                spilled.append((oldkey, old))
+            if len(entry.data) > self.max_bytes:
+                spilled.append((key, entry))
+        if self.directory:
+            for oldkey, old in spilled:
+                self._write(oldkey, old)
+
+    def _write(self, key, entry):
+        name = self._name(key)
+        if name in self._files:
+            return
+        head = '%s\n%s\n' % (entry.etag, entry.content_type)
+        fd, tmppath = tempfile.mkstemp(dir=self.directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(head)
+                f.write(entry.data)
+            os.rename(tmppath, self._path(key))
+        except (IOError, OSError):
+            try:
+                os.unlink(tmppath)
+            except OSError:
+                pass
+            return
+        with self._lock:
+            size = len(head) + len(entry.data)
+            self.disk_size += size - self._files.pop(name, 0)
+            self._files[name] = size
+        self._trim()
+
+    def _read(self, key):
+        if not self.directory:
+            return None
+        name = self._name(key)
+        with self._lock:
+            size = self._files.pop(name, None)
+            if size is None:
+                return None
+            self._files[name] = size
+        try:
+            with open(self._path(key), 'rb') as f:
+                etag = f.readline().rstrip('\n')
+                content_type = f.readline().rstrip('\n')
+                return _Entry(f.read(), etag, content_type)
+        except IOError:
+            with self._lock:
+                self.disk_size -= self._files.pop(name, 0)
+            return None
+
+    def _lookup(self, key):
+        with self._lock:
+            try:
+                entry = self._entries.pop(key)
+            except KeyError:
+                return None
+            self._entries[key] = entry
+            return entry
+
+    def get(self, key, loader):
+        """
+        Returns (data, etag, content_type) for the key, calling loader() to
+        get (data, content_type) if the image is not cached. Returns None if
+        the loader returns None (no artwork).
+        """
+        entry = self._lookup(key)
+        if entry is None:
+            entry = self._load(key, loader)
+        if entry is None:
+            return None
+        return entry.data, entry.etag, entry.content_type
+
+    def _load(self, key, loader):
+        with self._lock:
+            miss = self._misses.get(key)
+            owner = miss is None
+            if owner:
+                miss = self._misses[key] = _Miss()
+
+        if not owner:
+            miss.event.wait()
+            if miss.error is not None:
+                raise miss.error
+            return miss.entry
+
+        try:
+            entry = self._read(key)
+            if entry is None:
+                result = loader()
+                if result is not None:
+                    data, content_type = result
+                    etag = '"%s"' % hashlib.md5(data).hexdigest()
+                    entry = _Entry(data, etag, content_type)
+            if entry is not None:
+                self._store(key, entry)
+            miss.entry = entry
+            return entry
+        except Exception, e:
+            miss.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._misses[key]
+            miss.event.set()
+
+    def respond(self, key, loader, if_none_match=None):
+        """
+        Returns (status, headers, body) for an artwork request: 200 with the
+        image, 304 if if_none_match matches its ETag, or 204 if there is no
+        artwork.
+        """
+        result = self.get(key, loader)
+        if result is None:
+            return 204, {}, ''
+        data, etag, content_type = result
+        headers = {'ETag': etag}
+        if etag_matches(if_none_match, etag):
+            return 304, headers, ''
+        headers['Content-Type'] = content_type
+        return 200, headers, data
+
+    def discard(self, key):
+        """Removes an image from both tiers."""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self.size -= len(entry.data)
+        if self.directory:
+            with self._lock:
+                self.disk_size -= self._files.pop(self._name(key), 0)
+            try:
+                os.unlink(self._path(key))
+            except OSError:
+                pass
+
+    def __contains__(self, key):
+        return key in self._entries
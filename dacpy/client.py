@@ -0,0 +1,352 @@
+# The MIT License
+#
+# Copyright (c) 2010 Ryan Bergstrom
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import errno
+import socket
+import threading
+import urllib
+
+from http import HTTPError, ResponseParser
+from types import Node
+
+__all__ = ['ConnectionPool', 'DACPClient', 'HTTPError']
+
+DEFAULT_TIMEOUT = 10.0
+
+class _Connection(object):
+    """A persistent HTTP connection to a single host."""
+
+    def __init__(self, address, timeout):
+        self.address = address
+        self.sock = socket.create_connection(address, timeout)
+        self.buffer = ''
+        self.responses = 0
+        # Bytes received since the current read_response() began
+        self.received = 0
+
+    @property
+    def closed(self):
+        return self.sock is None
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def send(self, data):
+        self.sock.sendall(data)
+
+    def read_response(self, head=False):
+        """Reads the next response, keeping any data that follows it."""
+        parser = ResponseParser(head)
+        data, self.buffer = self.buffer, ''
+        self.received = len(data)
+        while True:
+            if data:
+                extra = parser.feed(data)
+                if parser.complete:
+                    self.buffer = extra
+                    break
+            data = self.sock.recv(65536)
+            self.received += len(data)
+            if not data:
+                self.close()
+                parser.finish()
+                break
+        self.responses += 1
+        return parser
+
+def _closed(error):
+    """Returns whether a read error means the server closed the connection."""
+    if isinstance(error, HTTPError):
+        return True
+    return error.args and error.args[0] in (errno.ECONNRESET, errno.EPIPE)
+
+class ConnectionPool(object):
+    """
+    Thread-safe pool of keep-alive HTTP connections, keyed by host and port.
+
+    Requests reuse an idle connection to the host when there is one, and
+    connections are returned to the pool afterwards unless the server asked
+    for them to be closed. Once a host has answered with a persistent
+    HTTP/1.1 response, batches of requests to it are pipelined on one
+    connection.
+
+    max_idle = number of idle connections kept for each host
+    timeout = socket timeout in seconds for new connections
+    """
+
+    def __init__(self, max_idle=4, timeout=DEFAULT_TIMEOUT):
+        self.max_idle = max_idle
+        self.timeout = timeout
+        self._idle = {}
+        self._pipelining = {}
+        self._lock = threading.Lock()
+
+    def _acquire(self, address):
+        with self._lock:
+            try:
+                return self._idle[address].pop()
+            except (KeyError, IndexError):
+                pass
+        return _Connection(address, self.timeout)
+
+    def _release(self, conn):
+        if conn.closed:
+            return
+        with self._lock:
+            idle = self._idle.setdefault(conn.address, [])
+            if len(idle) < self.max_idle:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def close(self):
+        """Closes all idle connections."""
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.itervalues():
+            for conn in conns:
+                conn.close()
+
+    def supports_pipelining(self, host, port):
+        return self._pipelining.get((host, port), False)
+
+    def request(self, host, port, path, headers=None, method='GET', timeout=None):
+        """Sends a request and returns the completed ResponseParser."""
+        return self.pipeline(host, port, [path], headers, method, timeout)[0]
+
+    def pipeline(self, host, port, paths, headers=None, method='GET', timeout=None):
+        """
+        Sends several requests to the same host and returns their completed
+        ResponseParsers in order. The requests are pipelined if the host is
+        known to allow it, and sent one after another otherwise.
+        """
+        address = (host, port)
+        lines = ['Host: %s:%d' % address]
+        lines.extend(['%s: %s' % x for x in (headers or {}).iteritems()])
+        template = '%s %%s HTTP/1.1\r\n%s\r\n\r\n' % (method, '\r\n'.join(lines))
+        head = method == 'HEAD'
+
+        results = []
+        pending = list(paths)
+        while pending:
+            conn = self._acquire(address)
+            if timeout is not None:
+                conn.sock.settimeout(timeout)
+            reused = conn.responses > 0
+            if self._pipelining.get(address):
+                batch = pending
+            else:
+                batch = pending[:1]
+
+            done = 0
+            sent = False
+            try:
+                conn.send(''.join([template % x for x in batch]))
+                sent = True
+                for path in batch:
+                    parser = conn.read_response(head)
+                    results.append(parser)
+                    done += 1
+                    if not parser.keep_alive():
+                        conn.close()
+                        break
+            except socket.timeout:
+                # The server may be acting on the request; never send it twice
+                conn.close()
+                raise
+            except (socket.error, HTTPError), e:
+                conn.close()
+                # An idle connection the server has since closed fails to
+                # send, or is closed or reset before any response data
+                # arrives; only then is it safe to retry on a new connection.
+                if reused and done == 0 and (not sent or (conn.received == 0 and _closed(e))):
+                    continue
+                raise
+            finally:
+                if timeout is not None and not conn.closed:
+                    conn.sock.settimeout(self.timeout)
+
+            self._pipelining[address] = parser.version == 'HTTP/1.1' and parser.keep_alive()
+            self._release(conn)
+            pending = pending[done:]
+        return results
+
+class DACPClient(object):
+    """
+    Client for the DACP/DAAP interface of a media server, such as iTunes.
+
+    Connections are kept alive and shared through a ConnectionPool. After
+    login(), the session id (mlid) is added to every request, and if the
+    server reports that the session has expired the client logs in again
+    with the same pairing GUID. DMAP responses are returned as Nodes,
+    decoded within limits (DecodeLimits) if given.
+
+    Example:
+        client = DACPClient('192.168.0.2')
+        client.login(0x0123456789ABCDEF)
+        status = client.playstatusupdate()
+        client.ctrl_int('playpause')
+    """
+
+    default_headers = {
+        'Client-DAAP-Version': '3.10',
+        'Viewer-Only-Client': '1',
+    }
+
+    def __init__(self, host, port=3689, pool=None, timeout=DEFAULT_TIMEOUT, headers=None,
+                 limits=None):
+        self.host = host
+        self.limits = limits
+        self.port = port
+        self.pool = pool or ConnectionPool(timeout=timeout)
+        self.headers = dict(self.default_headers)
+        self.headers.update(headers or {})
+        self.session_id = None
+        self.pairing_guid = None
+
+    def url(self, path, params=None):
+        """Builds a request path, adding the session id if logged in."""
+        if hasattr(params, 'items'):
+            params = params.items()
+        params = list(params or [])
+        if self.session_id is not None and 'session-id' not in dict(params):
+            params.append(('session-id', self.session_id))
+        if not params:
+            return path
+        query = '&'.join(['%s=%s' % (k, urllib.quote(unicode(v).encode('utf-8'), ",:'*!()"))
+                          for (k, v) in params])
+        return '%s?%s' % (path, query)
+
+    def _check(self, parser):
+        if parser.status >= 400:
+            raise HTTPError('%s:%d returned %d %s' % (
+                self.host, self.port, parser.status, parser.reason
+            ), parser.status)
+        return parser
+
+    def fetch(self, path, params=None, timeout=None):
+        """Sends a request and returns the completed ResponseParser."""
+        parser = self.pool.request(self.host, self.port, self.url(path, params),
+                                   self.headers, timeout=timeout)
+        if parser.status == 403 and self.session_id is not None and self.pairing_guid is not None:
+            self.login(self.pairing_guid)
+            parser = self.pool.request(self.host, self.port, self.url(path, params),
+                                       self.headers, timeout=timeout)
+        return self._check(parser)
+
+    def _decode(self, parser):
+        body = parser.body
+        if not body:
+            return None
+        return Node.deserialize(body, self.limits)
+
+    def request(self, path, params=None, timeout=None):
+        """Sends a request and returns the response as a Node (or None if empty)."""
+        return self._decode(self.fetch(path, params, timeout))
+
+    def pipeline(self, requests):
+        """
+        Sends several (path, params) requests, pipelined where the server
+        allows it, and returns the responses as Nodes.
+        """
+        paths = [self.url(path, params) for (path, params) in requests]
+        parsers = self.pool.pipeline(self.host, self.port, paths, self.headers)
+        return [self._decode(self._check(x)) for x in parsers]
+
+    def login(self, pairing_guid=None):
+        """Logs in (with a GUID from TouchRemote.pair) and returns the session id."""
+        self.session_id = None
+        params = []
+        if pairing_guid is not None:
+            params.append(('pairing-guid', '0x%016X' % pairing_guid))
+        node = self.request('/login', params)
+        self.session_id = node.mlid[0]
+        self.pairing_guid = pairing_guid
+        return self.session_id
+
+    def logout(self):
+        if self.session_id is not None:
+            try:
+                self.fetch('/logout')
+            finally:
+                self.session_id = None
+
+    def server_info(self):
+        return self.request('/server-info')
+
+    def databases(self):
+        return self.request('/databases')
+
+    def items(self, database_id, meta=None, query=None, index=None):
+        """
+        Lists items in a database (adbs response).
+
+        meta = sequence of property names to return, e.g. ('dmap.itemname',)
+        query = DAAP query string, e.g. "'com.apple.itunes.mediakind:1'"
+        index = (start, end) item range for paging
+        """
+        params = []
+        if meta:
+            params.append(('meta', ','.join(meta)))
+        params.append(('type', 'music'))
+        if query:
+            params.append(('query', query))
+        if index:
+            params.append(('index', '%d-%d' % index))
+        return self.request('/databases/%d/items' % database_id, params)
+
+    def containers(self, database_id, meta=None):
+        params = []
+        if meta:
+            params.append(('meta', ','.join(meta)))
+        return self.request('/databases/%d/containers' % database_id, params)
+
+    def ctrl_int(self, command, params=None, timeout=None):
+        """Sends a /ctrl-int/1/ command, e.g. 'playpause' or 'nextitem'."""
+        return self.request('/ctrl-int/1/%s' % command, params, timeout)
+
+    def getproperty(self, *properties):
+        return self.ctrl_int('getproperty', [('properties', ','.join(properties))])
+
+    def setproperty(self, properties):
+        """
+        Sets player properties, given as a dict or (name, value) pairs,
+        e.g. {'dmcp.volume': 50}.
+        """
+        if hasattr(properties, 'items'):
+            properties = properties.items()
+        return self.ctrl_int('setproperty', list(properties))
+
+    def playstatusupdate(self, revision=1, timeout=None):
+        """
+        Returns the player status (cmst). Any revision other than 1 is a
+        long-poll that returns once the status differs from that revision.
+        """
+        return self.ctrl_int('playstatusupdate', [('revision-number', revision)], timeout)
+
+    def nowplaying_artwork(self, width=320, height=320):
+        """Returns the image data for the current track's artwork, or None."""
+        parser = self.fetch('/ctrl-int/1/nowplayingartwork', [('mw', width), ('mh', height)])
+        return parser.body or None
@@ -0,0 +1,156 @@
+# The MIT License
+#
+# Copyright (c) 2010 Ryan Bergstrom
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import threading
+import time
+
+__all__ = ['Coalescer']
+
+def _call(callback):
+    callback()
+
+class Coalescer(object):
+    """
+    Merges bursts of ctrl-int setproperty commands, such as those sent while
+    a volume or position slider is dragged.
+
+    Properties submitted within window seconds of the last command sent are
+    merged, the latest value of each winning, and sent together with a
+    single call to send(params) once the window has passed. Every caller in
+    the batch is then given the same result, so each one sees the state the
+    player actually confirmed. Batches are sent one at a time and in order.
+
+    The timer only decides when to send: the send itself and the callbacks
+    are run through call(callback), e.g. DACPServer.call_soon to keep them
+    in the server loop.
+
+    Example:
+        coalescer = Coalescer(lambda params: client.ctrl_int('setproperty', params.items()))
+        coalescer.apply({'dmcp.volume': 40})
+    """
+
+    # Properties that are worth merging (set continuously by sliders)
+    properties = frozenset(['dmcp.volume', 'dacp.playingtime'])
+
+    def __init__(self, send, window=0.1, call=None):
+        self.send = send
+        self.window = window
+        self.sent = 0
+        self.coalesced = 0
+        self._call = call or _call
+        self._params = {}
+        self._callbacks = []
+        self._scheduled = False
+        self._busy = False
+        self._last = None
+        self._lock = threading.Lock()
+
+    def coalescable(self, params):
+        """Returns whether a setproperty with these params can be merged."""
+        return bool(params) and self.properties.issuperset(params)
+
+    def submit(self, params, callback):
+        """
+        Adds properties to the next batch. callback(result, error) is called
+        once it has been sent, with send's result or the exception it raised.
+        """
+        with self._lock:
+            if self._callbacks:
+                self.coalesced += 1
+            self._params.update(params)
+            self._callbacks.append(callback)
+            now = self._schedule()
+        if now:
+            self._call(self._flush)
+
+    def after(self, callback):
+        """
+        Calls callback() once the commands submitted so far have been sent,
+        or right away if there are none. Use it for other commands, so they
+        are not run ahead of (or read state older than) pending properties.
+        """
+        with self._lock:
+            waiting = self._callbacks or self._busy
+            if waiting:
+                self._callbacks.append(lambda result, error: callback())
+                now = self._schedule()
+        if not waiting:
+            callback()
+        elif now:
+            self._call(self._flush)
+
+    def apply(self, params):
+        """Submits properties and waits for the batch; returns send's result."""
+        done = threading.Event()
+        outcome = []
+        def finished(result, error):
+            outcome.extend((result, error))
+            done.set()
+        self.submit(params, finished)
+        done.wait()
+        result, error = outcome
+        if error is not None:
+            raise error
+        return result
+
+    def _schedule(self):
+        # Called with the lock held; returns True if the caller should
+        # flush right away (after releasing the lock)
+        if self._scheduled or self._busy:
+            return False
+        self._scheduled = True
+        delay = 0
+        if self._params and self._last is not None:
+            delay = self._last + self.window - time.time()
+        if delay <= 0:
+            return True
+        timer = threading.Timer(delay, self._call, (self._flush,))
+        timer.daemon = True
+        timer.start()
+        return False
+
+    def _flush(self):
+        with self._lock:
+            params, self._params = self._params, {}
+            callbacks, self._callbacks = self._callbacks, []
+            self._scheduled = False
+            self._busy = True
+            if params:
+                self._last = time.time()
+
+        result = error = None
+        try:
+            if params:
+                try:
+                    result = self.send(params)
+                except Exception, e:
+                    error = e
+                self.sent += 1
+            for callback in callbacks:
+                callback(result, error)
+        finally:
+            with self._lock:
+                self._busy = False
+                now = self._callbacks and self._schedule()
+        if now:
+            self._call(self._flush)
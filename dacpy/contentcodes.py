@@ -0,0 +1,143 @@
+# The MIT License
+#
+# Copyright (c) 2010 Ryan Bergstrom
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import json
+import os
+import os.path
+import re
+import struct
+import tempfile
+
+import tags
+
+__all__ = [
+    'ContentCodesCache',
+
+    'parse_content_codes', 'register_content_codes', 'server_key',
+]
+
+def parse_content_codes(node):
+    """
+    Returns the (tag, name, typename) definitions from a /content-codes
+    response (mccr) node. Value types without a matching dacpy type are
+    reported as Binary.
+    """
+    codes = []
+    for entry in node.mdcl:
+        try:
+            number = entry.mcnm[0]
+            name = entry.mcna[0].encode('utf-8')
+            typecode = entry.mcty[0]
+        except IndexError:
+            continue
+        tag = struct.pack('>L', number)
+        codes.append((tag, name, tags.CONTENT_TYPES.get(typecode, 'Binary')))
+    return codes
+
+def register_content_codes(codes, override=False):
+    """
+    Registers (tag, name, typename) definitions, or the definitions in a
+    /content-codes response node, with dacpy.tags. Tags that are already
+    known keep their definition unless override is True.
+
+    Returns the number of definitions added.
+    """
+    if hasattr(codes, 'tag'):
+        codes = parse_content_codes(codes)
+    return len([x for x in codes if tags.register(*x, override=override)])
+
+def server_key(node):
+    """
+    Returns a string identifying a server and its protocol versions, from a
+    /server-info response (msrv) node, for use as a ContentCodesCache key.
+    """
+    parts = []
+    for tag in ('minm', 'mpro', 'apro', 'aeSV'):
+        for value in getattr(node, tag):
+            if isinstance(value, tuple):
+                value = '.'.join([str(x) for x in value])
+            parts.append(unicode(value))
+    return u'-'.join(parts)
+
+class ContentCodesCache(object):
+    """
+    On-disk cache of /content-codes definitions, with one file per server key
+    (see server_key), so they can be registered when reconnecting to a server
+    without fetching /content-codes again.
+
+    Example:
+        cache = ContentCodesCache('~/.cache/dacpy')
+        key = server_key(serverinfo)
+        if not cache.load(key):
+            cache.store(key, fetch('/content-codes'))
+    """
+
+    def __init__(self, directory):
+        self.directory = os.path.expanduser(directory)
+
+    def path(self, key):
+        """Returns the file used to cache the definitions for a server key."""
+        if isinstance(key, unicode):
+            key = key.encode('utf-8')
+        filename = re.sub(r'[^A-Za-z0-9._-]', '_', key)
+        return os.path.join(self.directory, 'content-codes-%s.json' % filename)
+
+    def get(self, key):
+        """Returns the cached definitions for a server key, or None."""
+        try:
+            with open(self.path(key), 'rb') as f:
+                entries = json.load(f)
+        except (IOError, ValueError):
+            return None
+        return [(str(t), n and n.encode('utf-8'), str(y)) for (t, n, y) in entries]
+
+    def load(self, key, override=False):
+        """
+        Registers the cached definitions for a server key. Returns False if
+        nothing is cached for the key.
+        """
+        codes = self.get(key)
+        if codes is None:
+            return False
+        register_content_codes(codes, override)
+        return True
+
+    def store(self, key, codes, override=False):
+        """
+        Registers the definitions from a /content-codes response node (or a
+        list of definitions) and writes them to the cache for the server key.
+        """
+        if hasattr(codes, 'tag'):
+            codes = parse_content_codes(codes)
+        register_content_codes(codes, override)
+
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        fd, tmppath = tempfile.mkstemp(dir=self.directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                json.dump(codes, f)
+            os.rename(tmppath, self.path(key))
+        except Exception:
+            os.unlink(tmppath)
+            raise
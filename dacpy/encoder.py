@@ -0,0 +1,138 @@
+# The MIT License
+#
+# Copyright (c) 2010 Ryan Bergstrom
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import struct
+
+import tags
+
+from types import Numeric, String, UnknownTagError, tag_type
+
+__all__ = ['ListingEncoder']
+
+_LENGTH = struct.Struct('>l')
+
+class ListingEncoder(object):
+    """
+    Encodes rows (tuples, lists or dicts) straight into the bytes of an
+    mlcl listing of mlit items, without building Nodes.
+
+    The spec is a sequence of (field, tag) pairs, where field is the index
+    or key of the value in each row. Numeric fields are packed with a
+    precomputed struct; strings are written as utf-8 (str values must
+    already be utf-8); other types go through their DAAP type. Fields whose
+    value is None are left out of the item. Container lengths are written
+    as placeholders and patched once each item or listing is complete.
+
+    Example:
+        encoder = ListingEncoder([(0, 'miid'), (1, 'minm'), (2, 'asar')])
+        body = encoder.response(cursor.execute('SELECT id, name, artist ...'))
+    """
+
+    def __init__(self, spec, item_tag='mlit'):
+        self.item_tag = item_tag
+        self.fields = []
+        for field, tag in spec:
+            if tag not in tags.TAGS:
+                raise UnknownTagError(tag)
+            tagtype = tag_type(tag)
+            if issubclass(tagtype, Numeric):
+                packer = struct.Struct('>4sl%s' % tagtype.format_code).pack
+            else:
+                packer = None
+            self.fields.append((field, tag, packer, tagtype))
+
+    def encode_items(self, rows, out):
+        """
+        Appends an mlit item for each row to the bytearray out, and returns
+        the number of rows. Each item is only appended once it has been
+        encoded, so if a row fails out ends with the previous complete item.
+        """
+        item_header = self.item_tag + '\x00\x00\x00\x00'
+        fields = self.fields
+        pack_into = _LENGTH.pack_into
+        pack = _LENGTH.pack
+        count = 0
+        for row in rows:
+            item = bytearray(item_header)
+            for field, tag, packer, tagtype in fields:
+                value = row[field]
+                if value is None:
+                    continue
+                if packer is not None:
+                    try:
+                        item += packer(tag, tagtype.length, value)
+                    except struct.error:
+                        # Let the type report the bad value
+                        tagtype(value)
+                        raise
+                elif tagtype is String:
+                    if isinstance(value, unicode):
+                        value = value.encode('utf-8')
+                    item += tag
+                    item += pack(len(value))
+                    item += value
+                else:
+                    data = tagtype(value).serialize()
+                    item += tag
+                    item += pack(len(data))
+                    item += data
+            pack_into(item, 4, len(item) - 8)
+            out += item
+            count += 1
+        return count
+
+    def listing(self, rows, out=None):
+        """
+        Encodes the rows as an mlcl listing, appending to the bytearray out
+        if one is given (out is left as it was if a row fails). Returns
+        (out, number of rows).
+        """
+        if out is None:
+            out = bytearray()
+        start = len(out)
+        out += 'mlcl\x00\x00\x00\x00'
+        try:
+            count = self.encode_items(rows, out)
+        except Exception:
+            del out[start:]
+            raise
+        _LENGTH.pack_into(out, start + 4, len(out) - start - 8)
+        return out, count
+
+    def response(self, rows, tag='adbs', total=None):
+        """
+        Returns a complete listing response (e.g. adbs or apso) for the rows
+        as a string. The total (mtco) defaults to the number of rows.
+        """
+        out = bytearray(tag + '\x00\x00\x00\x00')
+        out += struct.pack('>4sll', 'mstt', 4, 200)
+        out += struct.pack('>4slB', 'muty', 1, 0)
+        counts = len(out)
+        out += struct.pack('>4sll4sll', 'mtco', 4, 0, 'mrco', 4, 0)
+        out, count = self.listing(rows, out)
+        if total is None:
+            total = count
+        struct.pack_into('>l', out, counts + 8, total)
+        struct.pack_into('>l', out, counts + 20, count)
+        _LENGTH.pack_into(out, 4, len(out) - 8)
+        return str(out)
@@ -0,0 +1,186 @@
+# The MIT License
+#
+# Copyright (c) 2010 Ryan Bergstrom
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import json
+import struct
+
+from datetime import datetime
+
+import tags
+
+from types import Container, MultiNumeric, String, Version, tag_type
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+__all__ = ['export_msgpack', 'export_ndjson', 'iter_records']
+
+# Containers whose children are exported as records
+LISTING_TAGS = ('mlcl', 'abar', 'abal', 'abgn', 'abcp')
+
+class _BufferReader(object):
+    """File-like reader over a str, buffer or mmap that copies only what is read."""
+
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+
+    def read(self, size):
+        data = self.data[self.pos:self.pos + size]
+        self.pos += len(data)
+        return data
+
+def _read(fileobj, size):
+    data = fileobj.read(size)
+    while len(data) < size:
+        more = fileobj.read(size - len(data))
+        if not more:
+            raise ValueError('Not enough data (%d/%d bytes)' % (len(data), size))
+        data += more
+    return data
+
+def _skip(fileobj, size):
+    while size > 0:
+        size -= len(_read(fileobj, min(size, 65536)))
+
+def _header(fileobj):
+    tag, size = struct.unpack('>4sl', _read(fileobj, 8))
+    if size < 0:
+        raise ValueError('Bad length for \'%s\': %d' % (tag, size))
+    return tag, size
+
+def _name(tag):
+    try:
+        return tags.TAGS[tag][0] or tag
+    except KeyError:
+        return tag
+
+def _fields(data):
+    """Decodes a run of serialized nodes into a dict, or returns None."""
+    record = {}
+    pos = 0
+    while pos < len(data):
+        if pos + 8 > len(data):
+            return None
+        tag, size = struct.unpack_from('>4sl', data, pos)
+        if size < 0 or pos + 8 + size > len(data):
+            return None
+        value = _value(tag, data[pos + 8:pos + 8 + size])
+        name = _name(tag)
+        if name not in record:
+            record[name] = value
+        elif isinstance(record[name], list):
+            record[name].append(value)
+        else:
+            record[name] = [record[name], value]
+        pos += 8 + size
+    return record
+
+def _value(tag, data):
+    """Decodes a value as a plain Python value."""
+    tagtype = tag_type(tag)
+    if tagtype is Container:
+        record = _fields(data)
+        if record is None:
+            return String.deserialize(data).value
+        return record
+    value = tagtype.deserialize(data)
+    if isinstance(value, Version):
+        return '%d.%d.%d.%d' % value.value
+    if isinstance(value, MultiNumeric):
+        return [x.value for x in value.value]
+    return value.value
+
+def iter_records(source, listings=LISTING_TAGS):
+    """
+    Yields a dict for each item of the listings (mlcl and browse lists) in
+    a DMAP response, keyed by property name (e.g. 'dmap.itemname').
+
+    The source can be a file-like object or a str, buffer or mmap. Only one
+    item is held in memory at a time, so a library of any size can be
+    exported from a file or socket.
+    """
+    if not hasattr(source, 'read'):
+        source = _BufferReader(source)
+
+    # Stack of bytes left to read in each enclosing container
+    tag, size = _header(source)
+    if tag_type(tag) is not Container:
+        return
+    stack = [(tag in listings, size)]
+    while stack:
+        in_listing, remaining = stack.pop()
+        if remaining <= 0:
+            continue
+        tag, size = _header(source)
+        if size + 8 > remaining:
+            raise ValueError('Length of \'%s\' exceeds its container' % tag)
+        stack.append((in_listing, remaining - 8 - size))
+        if in_listing:
+            record = _value(tag, _read(source, size))
+            if not isinstance(record, dict):
+                # e.g. the mlit strings of a browse listing
+                record = {_name(tag): record}
+            yield record
+        elif tag_type(tag) is Container:
+            stack.append((tag in listings, size))
+        else:
+            _skip(source, size)
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(repr(value))
+
+def export_ndjson(source, fileobj, listings=LISTING_TAGS):
+    """
+    Writes the items in a DMAP response to a file as newline-delimited JSON,
+    one object per item (see iter_records). Returns the number of items.
+
+    Dates are written in ISO 8601 format, and binary values as strings of
+    the characters U+0000 to U+00FF.
+    """
+    count = 0
+    for record in iter_records(source, listings):
+        fileobj.write(json.dumps(record, separators=(',', ':'), default=_default,
+                                 encoding='latin-1'))
+        fileobj.write('\n')
+        count += 1
+    return count
+
+def export_msgpack(source, fileobj, listings=LISTING_TAGS):
+    """
+    Writes the items in a DMAP response to a file as a stream of msgpack
+    maps, one per item (see iter_records). Returns the number of items.
+    Dates are written in ISO 8601 format. Requires the msgpack package.
+    """
+    if msgpack is None:
+        raise ImportError('export_msgpack requires the msgpack package')
+    packer = msgpack.Packer(default=_default, use_bin_type=True)
+    count = 0
+    for record in iter_records(source, listings):
+        fileobj.write(packer.pack(record))
+        count += 1
+    return count
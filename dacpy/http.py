@@ -0,0 +1,192 @@
+# The MIT License
+#
+# Copyright (c) 2010 Ryan Bergstrom
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+__all__ = ['HTTPError', 'ResponseParser', 'etag_matches']
+
+class HTTPError(IOError):
+    """HTTP protocol error, or error status (as status) from a server."""
+
+    def __init__(self, message, status=None):
+        IOError.__init__(self, message)
+        self.status = status
+
+def etag_matches(if_none_match, etag):
+    """Returns whether an If-None-Match header value matches an ETag."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    return etag in [x.strip() for x in if_none_match.split(',')]
+
+class ResponseParser(object):
+    """
+    Incremental parser for a single HTTP/1.x response, for use with
+    non-blocking sockets. Data is passed to feed() as it arrives, and the
+    status line, headers and body are available as soon as they are read.
+
+    The body is delimited by Content-Length, chunked transfer encoding, or
+    the end of the connection (signalled by calling finish()).
+    """
+
+    def __init__(self, head=False):
+        self.head = head
+        self.version = None
+        self.status = None
+        self.reason = None
+        self.headers = {}
+        self.headers_complete = False
+        self.complete = False
+        self._buffer = ''
+        self._body = []
+        self._body_length = 0
+        self._remaining = None
+        self._chunked = False
+        self._trailers = False
+
+    @property
+    def body(self):
+        """The body data read so far."""
+        if len(self._body) > 1:
+            self._body = [''.join(self._body)]
+        return self._body and self._body[0] or ''
+
+    def keep_alive(self):
+        """Returns True if the connection can be reused after this response."""
+        connection = self.headers.get('connection', '').lower()
+        if self.version == 'HTTP/1.0':
+            return connection == 'keep-alive' and self._remaining is not None
+        return connection != 'close' and (self._remaining is not None or self._chunked)
+
+    def feed(self, data):
+        """
+        Parses the next piece of the response. Returns any data received after
+        the end of the response (e.g. the start of a pipelined response).
+        """
+        if self.complete:
+            return data
+        self._buffer += data
+        if not self.headers_complete:
+            self._parse_headers()
+        if self.headers_complete:
+            self._parse_body()
+        if self.complete:
+            extra, self._buffer = self._buffer, ''
+            return extra
+        return ''
+
+    def finish(self):
+        """Called when the connection is closed by the server."""
+        if self.complete:
+            return
+        if self.headers_complete and self._remaining is None and not self._chunked:
+            self.complete = True
+        else:
+            raise HTTPError('Connection closed before the response was complete')
+
+    def _parse_headers(self):
+        end = self._buffer.find('\r\n\r\n')
+        if end < 0:
+            return
+        lines = self._buffer[:end].split('\r\n')
+        self._buffer = self._buffer[end + 4:]
+
+        parts = lines[0].split(' ', 2)
+        try:
+            self.version = parts[0]
+            self.status = int(parts[1])
+            self.reason = len(parts) > 2 and parts[2] or ''
+        except (IndexError, ValueError):
+            raise HTTPError('Bad status line: %r' % lines[0])
+        for line in lines[1:]:
+            try:
+                name, value = line.split(':', 1)
+            except ValueError:
+                raise HTTPError('Bad header line: %r' % line)
+            self.headers[name.strip().lower()] = value.strip()
+        self.headers_complete = True
+
+        if self.head or self.status in (204, 304) or 100 <= self.status < 200:
+            self._remaining = 0
+        elif self.headers.get('transfer-encoding', '').lower() == 'chunked':
+            self._chunked = True
+        elif 'content-length' in self.headers:
+            try:
+                self._remaining = int(self.headers['content-length'])
+            except ValueError:
+                raise HTTPError('Bad Content-Length: %r' % self.headers['content-length'])
+
+    def _append(self, data):
+        if data:
+            self._body.append(data)
+            self._body_length += len(data)
+
+    def _parse_body(self):
+        if self._chunked:
+            self._parse_chunks()
+        elif self._remaining is None:
+            self._append(self._buffer)
+            self._buffer = ''
+        else:
+            data = self._buffer[:self._remaining]
+            self._buffer = self._buffer[self._remaining:]
+            self._remaining -= len(data)
+            self._append(data)
+            if self._remaining == 0:
+                self.complete = True
+
+    def _parse_chunks(self):
+        while True:
+            if self._trailers:
+                end = self._buffer.find('\r\n')
+                if end < 0:
+                    return
+                line, self._buffer = self._buffer[:end], self._buffer[end + 2:]
+                if not line:
+                    self.complete = True
+                    return
+            elif self._remaining:
+                data = self._buffer[:self._remaining]
+                self._buffer = self._buffer[self._remaining:]
+                self._remaining -= len(data)
+                self._append(data)
+                if self._remaining:
+                    return
+            elif self._remaining == 0:
+                # end of chunk data
+                if len(self._buffer) < 2:
+                    return
+                self._buffer = self._buffer[2:]
+                self._remaining = None
+            else:
+                end = self._buffer.find('\r\n')
+                if end < 0:
+                    return
+                line, self._buffer = self._buffer[:end], self._buffer[end + 2:]
+                try:
+                    size = int(line.split(';', 1)[0], 16)
+                except ValueError:
+                    raise HTTPError('Bad chunk size: %r' % line)
+                if size == 0:
+                    self._trailers = True
+                else:
+                    self._remaining = size
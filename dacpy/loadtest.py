@@ -0,0 +1,339 @@
+# The MIT License
+#
+# Copyright (c) 2010 Ryan Bergstrom
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import logging
+import math
+import optparse
+import random
+import socket
+import sys
+import threading
+import time
+
+from client import ConnectionPool, DACPClient
+from pairing import generate_code
+from server import Backend, DACPServer
+from types import build_node
+
+__all__ = ['LoadTest', 'Stats', 'SyntheticBackend', 'main']
+
+_WORDS = ('love', 'night', 'blue', 'heart', 'road', 'fire', 'rain', 'gold')
+
+class Stats(object):
+    """Thread-safe latency samples and error counts per operation."""
+
+    def __init__(self):
+        self._samples = {}
+        self._errors = {}
+        self._lock = threading.Lock()
+
+    def record(self, operation, seconds):
+        with self._lock:
+            self._samples.setdefault(operation, []).append(seconds)
+
+    def error(self, operation):
+        with self._lock:
+            self._errors[operation] = self._errors.get(operation, 0) + 1
+
+    def summary(self, elapsed):
+        """
+        Returns {operation: {'count', 'errors', 'rate', 'p50', 'p95', 'p99'}}
+        with latencies in seconds, plus a 'total' entry for all operations.
+        """
+        with self._lock:
+            samples = dict([(k, list(v)) for (k, v) in self._samples.iteritems()])
+            errors = dict(self._errors)
+        samples['total'] = sum(samples.values(), [])
+        errors['total'] = sum(errors.values())
+        result = {}
+        for operation in set(samples) | set(errors):
+            values = sorted(samples.get(operation, []))
+            entry = {
+                'count': len(values),
+                'errors': errors.get(operation, 0),
+                'rate': len(values) / elapsed if elapsed else 0.0,
+            }
+            for name, fraction in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99)):
+                entry[name] = percentile(values, fraction)
+            result[operation] = entry
+        return result
+
+    def report(self, elapsed):
+        """Returns the summary as a table, with latencies in milliseconds."""
+        summary = self.summary(elapsed)
+        lines = ['%-16s %8s %7s %9s %8s %8s %8s' % (
+            'operation', 'count', 'errors', 'ops/s', 'p50 ms', 'p95 ms', 'p99 ms')]
+        for operation in sorted(summary, key=lambda x: (x == 'total', x)):
+            entry = summary[operation]
+            lines.append('%-16s %8d %7d %9.1f %8.2f %8.2f %8.2f' % (
+                operation, entry['count'], entry['errors'], entry['rate'],
+                entry['p50'] * 1000, entry['p95'] * 1000, entry['p99'] * 1000))
+        return '\n'.join(lines)
+
+def percentile(values, fraction):
+    """Returns the nearest-rank percentile of a sorted list (0.0 if empty)."""
+    if not values:
+        return 0.0
+    rank = max(int(math.ceil(fraction * len(values))) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+class SyntheticBackend(Backend):
+    """Backend with a generated library, for running load tests locally."""
+
+    name = 'dacpy load test'
+    passcode = '1234'
+    pair_id = '0000000000000001'
+    guid = 0x0123456789ABCDEF
+
+    def __init__(self, count=10000):
+        rand = random.Random(count)
+        self._items = [build_node(('mlit', [
+            ('miid', x + 1),
+            ('minm', '%s %s %d' % (rand.choice(_WORDS), rand.choice(_WORDS), x)),
+            ('asar', 'Artist %d' % (x % 500)),
+            ('asal', 'Album %d' % (x % 2000)),
+            ('astm', rand.randint(60000, 600000)),
+        ])) for x in range(count)]
+        self.volume = 50
+
+    def pair(self, pairingcode, servicename):
+        if pairingcode == generate_code(self.passcode, self.pair_id):
+            return self.guid
+        return None
+
+    def items(self, database_id):
+        if database_id != 1:
+            raise KeyError(database_id)
+        return self._items
+
+    def ctrl_int(self, command, params):
+        if command == 'getproperty':
+            return ('cmgt', [('mstt', 200), ('cmvo', self.volume)])
+        elif command == 'setproperty':
+            if 'dmcp.volume' in params:
+                self.volume = int(params['dmcp.volume'])
+            return None
+        elif command in ('playpause', 'nextitem', 'previtem'):
+            return None
+        raise KeyError(command)
+
+class _Remote(object):
+    """One simulated Remote app: a browsing thread and a long-poll thread."""
+
+    meta = ('dmap.itemid', 'dmap.itemname', 'daap.songartist', 'daap.songalbum')
+    commands = ('playpause', 'nextitem', 'previtem')
+
+    def __init__(self, test, number):
+        self.test = test
+        self.number = number
+        self.random = random.Random(number)
+        self.client = DACPClient(test.host, test.port, ConnectionPool(timeout=test.timeout))
+        self.revision = 1
+        self.ready = threading.Event()
+
+    def timed(self, operation, function, *args, **kwargs):
+        start = time.time()
+        try:
+            result = function(*args, **kwargs)
+        except (IOError, ValueError), e:
+            self.test.stats.error(operation)
+            logging.debug('Remote %d: %s failed: %r' % (self.number, operation, e))
+            return None
+        self.test.stats.record(operation, time.time() - start)
+        return result
+
+    def connect(self):
+        test = self.test
+        guid = None
+        if test.passcode is not None:
+            code = self.timed('generate_code', generate_code, test.passcode, test.pair_id)
+            node = self.timed('pair', self.client.request, '/pair', [
+                ('pairingcode', code), ('servicename', '%016X' % self.number),
+            ])
+            if node is not None:
+                guid = node.cmpg[0]
+        return self.timed('login', self.client.login, guid) is not None
+
+    def browse(self):
+        test = self.test
+        stop = test.stopping
+        if not self.connect():
+            return
+        self.timed('server-info', self.client.server_info)
+        self.timed('databases', self.client.databases)
+        self.ready.set()
+        start = 0
+        total = None
+        while not stop.is_set():
+            index = (start, start + test.page_size - 1)
+            node = self.timed('items', self.client.items, 1, self.meta, index=index)
+            if node is not None:
+                total = node.mtco[0]
+            start += test.page_size
+            if total is not None and start >= total:
+                start = 0
+            query = "'dmap.itemname:*%s*'" % self.random.choice(_WORDS)
+            self.timed('search', self.client.items, 1, self.meta, query=query,
+                       index=(0, test.page_size - 1))
+            self.timed('getproperty', self.client.getproperty, 'dmcp.volume')
+            self.timed('setproperty', self.client.setproperty,
+                       {'dmcp.volume': self.random.randint(0, 100)})
+            command = self.random.choice(self.commands)
+            self.timed(command, self.client.ctrl_int, command)
+            self.timed('playstatus', self.client.playstatusupdate, 1)
+            if test.think_time:
+                stop.wait(self.random.uniform(0, 2 * test.think_time))
+        self.client.logout()
+
+    def poll(self):
+        test = self.test
+        self.ready.wait(test.timeout)
+        while not test.stopping.is_set() and self.client.session_id is not None:
+            start = time.time()
+            try:
+                node = self.client.playstatusupdate(self.revision, test.poll_timeout)
+            except socket.timeout:
+                continue
+            except (IOError, ValueError):
+                if test.stopping.is_set():
+                    break
+                test.stats.error('long-poll')
+                test.stopping.wait(1)
+                continue
+            test.stats.record('long-poll', time.time() - start)
+            self.revision = node.cmsr[0]
+
+class LoadTest(object):
+    """
+    Simulates a number of Remote apps against a DACP server.
+
+    Each Remote pairs (if a passcode is given; the pairing code is made with
+    generate_code and sent to /pair), logs in, and then until the test ends
+    pages through the library, searches, reads and sets the volume, sends
+    a playpause, nextitem or previtem and reads the player status, while
+    keeping a playstatusupdate long-poll open on a second connection.
+    Latencies are collected per operation in stats.
+
+    Example:
+        test = LoadTest('127.0.0.1', 3689, remotes=50)
+        elapsed = test.run(30)
+        print test.stats.report(elapsed)
+    """
+
+    def __init__(self, host, port=3689, remotes=10, passcode=None, pair_id=None,
+                 timeout=10.0, page_size=50, think_time=0.0, poll_timeout=5.0):
+        if passcode is not None and pair_id is None:
+            raise ValueError('Pairing with a passcode needs a pair id')
+        self.host = host
+        self.port = port
+        self.remotes = remotes
+        self.passcode = passcode
+        self.pair_id = pair_id
+        self.timeout = timeout
+        self.page_size = page_size
+        self.think_time = think_time
+        self.poll_timeout = poll_timeout
+        self.stats = Stats()
+        self.stopping = threading.Event()
+
+    def run(self, duration):
+        """Runs the test for duration seconds and returns the elapsed time."""
+        self.stopping.clear()
+        threads = []
+        for number in range(self.remotes):
+            remote = _Remote(self, number)
+            for target in (remote.browse, remote.poll):
+                thread = threading.Thread(target=target)
+                thread.daemon = True
+                threads.append(thread)
+        start = time.time()
+        for thread in threads:
+            thread.start()
+        self.stopping.wait(duration)
+        self.stopping.set()
+        elapsed = time.time() - start
+        for thread in threads:
+            thread.join(self.timeout + self.poll_timeout)
+        return elapsed
+
+def run_local(remotes=10, duration=10.0, items=10000, status_interval=1.0, **options):
+    """
+    Runs a LoadTest against a DACPServer with a SyntheticBackend in this
+    process, publishing a new player status every status_interval seconds.
+    Other keyword arguments are passed to LoadTest. Returns (stats, elapsed).
+    """
+    backend = SyntheticBackend(items)
+    server = DACPServer(backend, ('127.0.0.1', 0))
+    serving = threading.Thread(target=server.serve_forever)
+    serving.daemon = True
+    serving.start()
+
+    test = LoadTest('127.0.0.1', server.address[1], remotes, backend.passcode,
+                    backend.pair_id, **options)
+    def tick():
+        while not test.stopping.wait(status_interval):
+            backend.volume = (backend.volume + 1) % 100
+            server.status_changed()
+    ticker = threading.Thread(target=tick)
+    ticker.daemon = True
+    ticker.start()
+    try:
+        elapsed = test.run(duration)
+    finally:
+        server.shutdown()
+        serving.join()
+        server.server_close()
+    return test.stats, elapsed
+
+def main(argv=None):
+    parser = optparse.OptionParser(
+        usage='%prog [options] [host [port]]',
+        description='Simulates many Remote apps against a DACP server, or against '
+                    'a local server with a generated library if no host is given.')
+    parser.add_option('-r', '--remotes', type='int', default=10)
+    parser.add_option('-d', '--duration', type='float', default=10.0)
+    parser.add_option('-i', '--items', type='int', default=10000,
+                      help='library size for the local server')
+    parser.add_option('-p', '--passcode', help='passcode to pair with')
+    parser.add_option('--pair', help='Pair id sent along with the passcode')
+    parser.add_option('--page-size', type='int', default=50)
+    parser.add_option('--think-time', type='float', default=0.0)
+    options, args = parser.parse_args(argv)
+    if options.passcode is not None and options.pair is None:
+        parser.error('--passcode needs --pair')
+
+    settings = {'page_size': options.page_size, 'think_time': options.think_time}
+    if args:
+        port = len(args) > 1 and int(args[1]) or 3689
+        test = LoadTest(args[0], port, options.remotes, options.passcode, options.pair,
+                        **settings)
+        elapsed = test.run(options.duration)
+        stats = test.stats
+    else:
+        stats, elapsed = run_local(options.remotes, options.duration, options.items,
+                                   **settings)
+    print stats.report(elapsed)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -20,15 +20,36 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
+import hashlib
+import asyncore
 import logging
 import os.path
+import Queue
 import socket
 import struct
-import urllib2
+import sys
+import threading
+import time
+import urllib
 
+from http import HTTPError, ResponseParser
 from types import Node
+from util import LRUCache
 
-__all__  = ['generate_code', 'TouchRemote', 'TouchRemoteListener']
+__all__  = [
+    'generate_code', 'generate_codes', 'pair_all', 'PairingError',
+    'TouchRemote', 'TouchRemoteListener',
+]
+
+DEFAULT_TIMEOUT = 10.0
+DEFAULT_RETRIES = 2
+DEFAULT_TTL = 120
+
+# Recorder for pairing statistics, set by dacpy.stats.enable()
+_probe = None
+
+class PairingError(IOError):
+    pass
 
 class TouchRemote(object):
     """Simple class to interact with DACP remotes discovered by Zeroconf."""
@@ -39,99 +60,292 @@ class TouchRemote(object):
         self.port = port
         self.pairid = pairid
 
-    def pair(self, passcode, servicename):
+    def pair(self, passcode, servicename, timeout=DEFAULT_TIMEOUT,
+             retries=DEFAULT_RETRIES):
         """
         Pairs the remote with the specified DACP service.
         
         passcode = 4-digit code (in string format) from the remote
         servicename = name of the _touch_able service being paired with
+        timeout = seconds to wait for each attempt before giving up
+        retries = number of times to retry after a network error or timeout
         
         Returns the GUID that the remote will use to login in the future.
         """
 
-        hashcode = generate_code(passcode, self.pairid)
-        logging.info('Attempting to pair with %s:%d with code %s' % (
-            self.address, self.port, hashcode
-        ))
-
-        try:
-            resp = urllib2.urlopen('http://%s:%d/pair?pairingcode=%s&servicename=%s' % (
-                self.address, self.port, hashcode, servicename
-            ))
-            node = Node.deserialize(resp.read())
-
-            logging.info('Pairing successful with GUID %016X' % node.cmpg[0])
-
-            return node.cmpg[0]
-        except Exception, e:
-            logging.warning('Pairing failed: %s' % e)
-            raise
+        result = pair_all([(self, passcode)], servicename, timeout, retries)[0]
+        if isinstance(result, Exception):
+            raise result
+        return result
 
     def __unicode__(self):
         return '%(name)s @ %(address)s:%(port)d' % self.__dict__
 
 
 class TouchRemoteListener(object):
-    """Listener class to pass to Zeroconf to find DACP remotes."""
-    def __init__(self):
+    """
+    Listener class to pass to Zeroconf to find DACP remotes.
+
+    Services are resolved by a fixed number of worker threads rather than in
+    the Zeroconf callback, so announcements keep being processed while slow
+    remotes resolve. Repeated announcements of a name that is already being
+    resolved, or that was resolved less than ttl seconds ago, are ignored.
+    Call expire() periodically (DACPServer does, if given the listener) to
+    drop the remotes that have not been resolved again within ttl seconds.
+
+    workers = number of resolver threads
+    ttl = seconds a resolved remote is trusted before it is resolved again
+    timeout = milliseconds to wait for each service to resolve
+    """
+
+    def __init__(self, workers=4, ttl=DEFAULT_TTL, timeout=3000):
         self.remotes = {}
+        self.ttl = ttl
+        self.timeout = timeout
+        self._resolved = {}
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._queue = Queue.Queue()
+        self._workers = []
+        for i in range(workers):
+            worker = threading.Thread(target=self._work, name='TouchRemoteListener-%d' % i)
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
 
     def removeService(self, mdns, service_type, name):
         """Called by Zeroconf when a remote stops broadcasting."""
-        try:
-            logging.info('Remote lost: %s' % unicode(self.remotes[name]))
-            del self.remotes[name]
-        except KeyError:
-            pass
+        with self._lock:
+            self._pending.discard(name)
+            self._resolved.pop(name, None)
+            remote = self.remotes.pop(name, None)
+        if remote is not None:
+            logging.info('Remote lost: %s' % unicode(remote))
 
     def addService(self, mdns, service_type, name):
         """Called by Zeroconf when a new remote is found."""
-        info = mdns.getServiceInfo(service_type, name)
-        props = info.getProperties()
-        self.remotes[name] = TouchRemote(
-            props['DvNm'],
-            str(socket.inet_ntoa(info.getAddress())),
-            info.getPort(),
-            props['Pair'],
-        )
-        logging.info('New remote found: %s' % unicode(self.remotes[name]))
-
-class UInt32(object):
-    """
-    Simple 32-bit fixed with integer type for bitwise operations.
-    
-    This is NOT meant to be efficient, simply as a way to do fixed width
-    operations without requiring a C module or numpy.
-    """
-    def __init__(self, value, base=10):
+        with self._lock:
+            if name in self._pending:
+                return
+            if time.time() < self._resolved.get(name, 0) + self.ttl:
+                return
+            self._pending.add(name)
+        self._queue.put((mdns, service_type, name))
+
+    def expire(self):
+        """Removes the remotes resolved more than ttl seconds ago and returns their names."""
+        with self._lock:
+            deadline = time.time() - self.ttl
+            expired = [x for (x, t) in self._resolved.iteritems() if t <= deadline]
+            for name in expired:
+                del self._resolved[name]
+                self.remotes.pop(name, None)
+        return expired
+
+    def join(self):
+        """Blocks until all announced services have been resolved."""
+        self._queue.join()
+
+    def close(self):
+        """Stops the resolver threads once queued services are resolved."""
+        for worker in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            worker.join()
+        self._workers = []
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            try:
+                if job is None:
+                    return
+                self._resolve(*job)
+            except Exception, e:
+                logging.warning('Failed to resolve remote %s: %s' % (job[2], e))
+                with self._lock:
+                    self._pending.discard(job[2])
+            finally:
+                self._queue.task_done()
+
+    def _resolve(self, mdns, service_type, name):
+        info = mdns.getServiceInfo(service_type, name, self.timeout)
+        remote = None
+        if info is not None:
+            props = info.getProperties()
+            remote = TouchRemote(
+                props['DvNm'],
+                str(socket.inet_ntoa(info.getAddress())),
+                info.getPort(),
+                props['Pair'],
+            )
+
+        with self._lock:
+            if name not in self._pending:
+                # removed while it was being resolved
+                return
+            self._pending.discard(name)
+            if remote is None:
+                return
+            self._resolved[name] = time.time()
+            self.remotes[name] = remote
+        logging.info('New remote found: %s' % unicode(remote))
+
+class _PairingRequest(asyncore.dispatcher):
+    """A single non-blocking /pair request to a remote."""
+
+    def __init__(self, remote, hashcode, servicename, socket_map):
+        asyncore.dispatcher.__init__(self, map=socket_map)
+        self.guid = None
+        self.error = None
+        self.retryable = True
+        self.parser = ResponseParser()
+        self.outbuf = (
+            'GET /pair?pairingcode=%s&servicename=%s HTTP/1.1\r\n'
+            'Host: %s:%d\r\n'
+            'Connection: close\r\n\r\n'
+        ) % (hashcode, urllib.quote(servicename), remote.address, remote.port)
+
+        self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
         try:
-            self.real = 0xffffffff & value
-        except TypeError:
-            self.real = 0xffffffff & int(value, base)
+            self.connect((remote.address, remote.port))
+        except socket.error, e:
+            self.fail(e)
+
+    @property
+    def finished(self):
+        return self.guid is not None or self.error is not None
+
+    def fail(self, error, retryable=True):
+        if not self.finished:
+            self.error = error
+            self.retryable = retryable
+        self.close()
 
-    def __add__(self, other):
-        return UInt32(self.real + other.real)
+    def writable(self):
+        return not self.connected or bool(self.outbuf)
 
-    def __sub__(self, other):
-        return UInt32(self.real - other.real)
+    def handle_connect(self):
+        pass
 
-    def __lshift__(self, other):
-        return UInt32(self.real << other.real)
+    def handle_write(self):
+        sent = self.send(self.outbuf)
+        self.outbuf = self.outbuf[sent:]
 
-    def __rshift__(self, other):
-        return UInt32(self.real >> other.real)
+    def handle_read(self):
+        data = self.recv(8192)
+        if data:
+            self.parser.feed(data)
+            self.check_response()
 
-    def __and__(self, other):
-        return UInt32(self.real & other.real)
+    def handle_close(self):
+        try:
+            self.parser.finish()
+            self.check_response()
+        except HTTPError, e:
+            self.fail(e)
+        if not self.finished:
+            self.fail(PairingError('Incomplete pairing response'))
+
+    def handle_error(self):
+        self.fail(sys.exc_info()[1])
+
+    def check_response(self):
+        """Decodes the response as soon as the whole DMAP node has arrived."""
+        parser = self.parser
+        if not parser.headers_complete:
+            return
+        if parser.status != 200:
+            self.fail(PairingError('Remote refused pairing: %d %s' % (
+                parser.status, parser.reason
+            )), retryable=False)
+            return
+
+        body = parser.body
+        if len(body) < 8:
+            return
+        if len(body) < 8 + struct.unpack_from('>l', body, 4)[0]:
+            return
+        try:
+            self.guid = Node.deserialize(body).cmpg[0]
+        except (ValueError, IndexError), e:
+            self.fail(PairingError('Bad pairing response: %s' % e), retryable=False)
+        self.close()
+
+class _Pairing(object):
+    """Retry and timeout state for pairing with one remote."""
+
+    def __init__(self, remote, passcode):
+        self.remote = remote
+        self.hashcode = generate_code(passcode, remote.pairid)
+        self.request = None
+        self.attempts = 0
+        self.start_at = 0
+        self.deadline = None
+        self.result = None
+
+def pair_all(pairings, servicename, timeout=DEFAULT_TIMEOUT,
+             retries=DEFAULT_RETRIES, retry_delay=0.5):
+    """
+    Pairs with several remotes at once, using non-blocking sockets.
 
-    def __or__(self, other):
-        return UInt32(self.real | other.real)
+    pairings = sequence of (TouchRemote, passcode) tuples
+    servicename = name of the _touch_able service being paired with
+    timeout = seconds to wait for each attempt before giving up
+    retries = number of times to retry after a network error or timeout
+    retry_delay = seconds to wait before retrying
 
-    def __xor__(self, other):
-        return UInt32(self.real ^ other.real)
+    Returns a list with the GUID for each remote, in the same order, or the
+    exception describing why pairing with that remote failed.
+    """
 
-    def __invert__(self):
-        return UInt32(0xffffffff - self.real)
+    socket_map = {}
+    pending = [_Pairing(remote, passcode) for (remote, passcode) in pairings]
+    states = list(pending)
+
+    while pending:
+        now = time.time()
+        for state in list(pending):
+            request = state.request
+            if request is None:
+                if now >= state.start_at:
+                    logging.info('Attempting to pair with %s:%d with code %s' % (
+                        state.remote.address, state.remote.port, state.hashcode
+                    ))
+                    state.attempts += 1
+                    state.deadline = now + timeout
+                    state.request = _PairingRequest(state.remote, state.hashcode,
+                                                    servicename, socket_map)
+                continue
+
+            if not request.finished and now >= state.deadline:
+                request.fail(PairingError('Timed out pairing with %s:%d' % (
+                    state.remote.address, state.remote.port
+                )))
+            if not request.finished:
+                continue
+
+            state.request = None
+            if request.guid is not None:
+                logging.info('Pairing successful with GUID %016X' % request.guid)
+                state.result = request.guid
+            elif request.retryable and state.attempts <= retries:
+                logging.info('Pairing attempt failed, retrying: %s' % request.error)
+                state.start_at = now + retry_delay
+                continue
+            else:
+                logging.warning('Pairing failed: %s' % request.error)
+                state.result = request.error
+            pending.remove(state)
+
+        if socket_map:
+            asyncore.loop(timeout=0.05, map=socket_map, count=1)
+        elif pending:
+            time.sleep(0.05)
+
+    return [x.result for x in states]
+
+_code_cache = LRUCache(256)
 
 def generate_code(passcode, pair):
     """
@@ -140,154 +354,29 @@ def generate_code(passcode, pair):
     passcode = 4-digit code (in string format) from the remote
     pair = 'Pair' property from the mdns record broadcast by the remote
     
-    Adapted from the C method found at:
+    The hash is the MD5 digest of the pair value followed by the passcode in
+    UTF-16LE, as described at:
         http://jinxidoru.blogspot.com/2009/06/itunes-remote-pairing-code.html
     """
 
-    rawparam = struct.pack('16s8sB31xB7x', pair, passcode.encode('utf-16')[2:], 0x80, 0xc0)
-    param = [UInt32(x) for x in struct.unpack('16L', rawparam)]
-
-    a = UInt32(0x67452301)
-    b = UInt32(0xefcdab89)
-    c = UInt32(0x98badcfe)
-    d = UInt32(0x10325476)
-
-    a = ((b & c) | (~b & d)) + param[0] + a - 0x28955B88
-    a = ((a << 0x07) | (a >> 0x19)) + b
-    d = ((a & b) | (~a & c)) + param[1] + d - 0x173848AA
-    d = ((d << 0x0c) | (d >> 0x14)) + a
-    c = ((d & a) | (~d & b)) + param[2] + c + 0x242070DB
-    c = ((c << 0x11) | (c >> 0x0f)) + d
-    b = ((c & d) | (~c & a)) + param[3] + b - 0x3E423112
-    b = ((b << 0x16) | (b >> 0x0a)) + c
-    a = ((b & c) | (~b & d)) + param[4] + a - 0x0A83F051
-    a = ((a << 0x07) | (a >> 0x19)) + b
-    d = ((a & b) | (~a & c)) + param[5] + d + 0x4787C62A
-    d = ((d << 0x0c) | (d >> 0x14)) + a
-    c = ((d & a) | (~d & b)) + param[6] + c - 0x57CFB9ED
-    c = ((c << 0x11) | (c >> 0x0f)) + d
-    b = ((c & d) | (~c & a)) + param[7] + b - 0x02B96AFF
-    b = ((b << 0x16) | (b >> 0x0a)) + c
-    a = ((b & c) | (~b & d)) + param[8] + a + 0x698098D8
-    a = ((a << 0x07) | (a >> 0x19)) + b
-    d = ((a & b) | (~a & c)) + param[9] + d - 0x74BB0851
-    d = ((d << 0x0c) | (d >> 0x14)) + a
-    c = ((d & a) | (~d & b)) + param[10] + c - 0x0000A44F
-    c = ((c << 0x11) | (c >> 0x0f)) + d
-    b = ((c & d) | (~c & a)) + param[11] + b - 0x76A32842
-    b = ((b << 0x16) | (b >> 0x0a)) + c
-    a = ((b & c) | (~b & d)) + param[12] + a + 0x6B901122
-    a = ((a << 0x07) | (a >> 0x19)) + b
-    d = ((a & b) | (~a & c)) + param[13] + d - 0x02678E6D
-    d = ((d << 0x0c) | (d >> 0x14)) + a
-    c = ((d & a) | (~d & b)) + param[14] + c - 0x5986BC72
-    c = ((c << 0x11) | (c >> 0x0f)) + d
-    b = ((c & d) | (~c & a)) + param[15] + b + 0x49B40821
-    b = ((b << 0x16) | (b >> 0x0a)) + c
-
-    a = ((b & d) | (~d & c)) + param[1] + a - 0x09E1DA9E
-    a = ((a << 0x05) | (a >> 0x1b)) + b
-    d = ((a & c) | (~c & b)) + param[6] + d - 0x3FBF4CC0
-    d = ((d << 0x09) | (d >> 0x17)) + a
-    c = ((d & b) | (~b & a)) + param[11] + c + 0x265E5A51
-    c = ((c << 0x0e) | (c >> 0x12)) + d
-    b = ((c & a) | (~a & d)) + param[0] + b - 0x16493856
-    b = ((b << 0x14) | (b >> 0x0c)) + c
-    a = ((b & d) | (~d & c)) + param[5] + a - 0x29D0EFA3
-    a = ((a << 0x05) | (a >> 0x1b)) + b
-    d = ((a & c) | (~c & b)) + param[10] + d + 0x02441453
-    d = ((d << 0x09) | (d >> 0x17)) + a
-    c = ((d & b) | (~b & a)) + param[15] + c - 0x275E197F
-    c = ((c << 0x0e) | (c >> 0x12)) + d
-    b = ((c & a) | (~a & d)) + param[4] + b - 0x182C0438
-    b = ((b << 0x14) | (b >> 0x0c)) + c
-    a = ((b & d) | (~d & c)) + param[9] + a + 0x21E1CDE6
-    a = ((a << 0x05) | (a >> 0x1b)) + b
-    d = ((a & c) | (~c & b)) + param[14] + d - 0x3CC8F82A
-    d = ((d << 0x09) | (d >> 0x17)) + a
-    c = ((d & b) | (~b & a)) + param[3] + c - 0x0B2AF279
-    c = ((c << 0x0e) | (c >> 0x12)) + d
-    b = ((c & a) | (~a & d)) + param[8] + b + 0x455A14ED
-    b = ((b << 0x14) | (b >> 0x0c)) + c
-    a = ((b & d) | (~d & c)) + param[13] + a - 0x561C16FB
-    a = ((a << 0x05) | (a >> 0x1b)) + b
-    d = ((a & c) | (~c & b)) + param[2] + d - 0x03105C08
-    d = ((d << 0x09) | (d >> 0x17)) + a
-    c = ((d & b) | (~b & a)) + param[7] + c + 0x676F02D9
-    c = ((c << 0x0e) | (c >> 0x12)) + d
-    b = ((c & a) | (~a & d)) + param[12] + b - 0x72D5B376
-    b = ((b << 0x14) | (b >> 0x0c)) + c
-
-    a = (b ^ c ^ d) + param[5] + a - 0x0005C6BE
-    a = ((a << 0x04) | (a >> 0x1c)) + b
-    d = (a ^ b ^ c) + param[8] + d - 0x788E097F
-    d = ((d << 0x0b) | (d >> 0x15)) + a
-    c = (d ^ a ^ b) + param[11] + c + 0x6D9D6122
-    c = ((c << 0x10) | (c >> 0x10)) + d
-    b = (c ^ d ^ a) + param[14] + b - 0x021AC7F4
-    b = ((b << 0x17) | (b >> 0x09)) + c
-    a = (b ^ c ^ d) + param[1] + a - 0x5B4115BC
-    a = ((a << 0x04) | (a >> 0x1c)) + b
-    d = (a ^ b ^ c) + param[4] + d + 0x4BDECFA9
-    d = ((d << 0x0b) | (d >> 0x15)) + a
-    c = (d ^ a ^ b) + param[7] + c - 0x0944B4A0
-    c = ((c << 0x10) | (c >> 0x10)) + d
-    b = (c ^ d ^ a) + param[10] + b - 0x41404390
-    b = ((b << 0x17) | (b >> 0x09)) + c
-    a = (b ^ c ^ d) + param[13] + a + 0x289B7EC6
-    a = ((a << 0x04) | (a >> 0x1c)) + b
-    d = (a ^ b ^ c) + param[0] + d - 0x155ED806
-    d = ((d << 0x0b) | (d >> 0x15)) + a
-    c = (d ^ a ^ b) + param[3] + c - 0x2B10CF7B
-    c = ((c << 0x10) | (c >> 0x10)) + d
-    b = (c ^ d ^ a) + param[6] + b + 0x04881D05
-    b = ((b << 0x17) | (b >> 0x09)) + c
-    a = (b ^ c ^ d) + param[9] + a - 0x262B2FC7
-    a = ((a << 0x04) | (a >> 0x1c)) + b
-    d = (a ^ b ^ c) + param[12] + d - 0x1924661B
-    d = ((d << 0x0b) | (d >> 0x15)) + a
-    c = (d ^ a ^ b) + param[15] + c + 0x1fa27cf8
-    c = ((c << 0x10) | (c >> 0x10)) + d
-    b = (c ^ d ^ a) + param[2] + b - 0x3B53A99B
-    b = ((b << 0x17) | (b >> 0x09)) + c
-
-    a = ((~d | b) ^ c) + param[0] + a - 0x0BD6DDBC
-    a = ((a << 0x06) | (a >> 0x1a)) + b
-    d = ((~c | a) ^ b) + param[7] + d + 0x432AFF97
-    d = ((d << 0x0a) | (d >> 0x16)) + a
-    c = ((~b | d) ^ a) + param[14] + c - 0x546BDC59
-    c = ((c << 0x0f) | (c >> 0x11)) + d
-    b = ((~a | c) ^ d) + param[5] + b - 0x036C5FC7
-    b = ((b << 0x15) | (b >> 0x0b)) + c
-    a = ((~d | b) ^ c) + param[9] + a + 0x655B59C3
-    a = ((a << 0x06) | (a >> 0x1a)) + b
-    d = ((~c | a) ^ b) + param[3] + d - 0x70F3336E
-    d = ((d << 0x0a) | (d >> 0x16)) + a
-    c = ((~b | d) ^ a) + param[10] + c - 0x00100B83
-    c = ((c << 0x0f) | (c >> 0x11)) + d
-    b = ((~a | c) ^ d) + param[1] + b - 0x7A7BA22F
-    b = ((b << 0x15) | (b >> 0x0b)) + c
-    a = ((~d | b) ^ c) + param[8] + a + 0x6FA87E4F
-    a = ((a << 0x06) | (a >> 0x1a)) + b
-    d = ((~c | a) ^ b) + param[15] + d - 0x01D31920
-    d = ((d << 0x0a) | (d >> 0x16)) + a
-    c = ((~b | d) ^ a) + param[6] + c - 0x5CFEBCEC
-    c = ((c << 0x0f) | (c >> 0x11)) + d
-    b = ((~a | c) ^ d) + param[13] + b + 0x4E0811A1
-    b = ((b << 0x15) | (b >> 0x0b)) + c
-    a = ((~d | b) ^ c) + param[4] + a - 0x08AC817E
-    a = ((a << 0x06) | (a >> 0x1a)) + b
-    d = ((~c | a) ^ b) + param[11] + d - 0x42C50DCB
-    d = ((d << 0x0a) | (d >> 0x16)) + a
-    c = ((~b | d) ^ a) + param[2] + c + 0x2AD7D2BB
-    c = ((c << 0x0f) | (c >> 0x11)) + d
-    b = ((~a | c) ^ d) + param[9] + b - 0x14792C6F
-    b = ((b << 0x15) | (b >> 0x0b)) + c
-
-    a += 0x67452301
-    b += 0xefcdab89
-    c += 0x98badcfe
-    d += 0x10325476
-
-    hashcode = struct.pack('<4L', a.real, b.real, c.real, d.real)
-    return ''.join(['%02X' % ord(x) for x in hashcode])
+    probe = _probe
+    if probe is not None:
+        start = probe.clock()
+
+    key = (passcode, pair)
+    hashcode = _code_cache.get(key)
+    if hashcode is None:
+        data = struct.pack('16s8s', pair, passcode.encode('utf-16-le'))
+        hashcode = hashlib.md5(data).hexdigest().upper()
+        _code_cache[key] = hashcode
+
+    if probe is not None:
+        probe.record('generate_code', 'pair', 24, start)
+    return hashcode
+
+def generate_codes(pairs):
+    """
+    Generates pairing hashes for a sequence of (passcode, pair) tuples (see
+    generate_code), returning them as a list in the same order.
+    """
+    return [generate_code(passcode, pair) for (passcode, pair) in pairs]
@@ -0,0 +1,119 @@
+# The MIT License
+#
+# Copyright (c) 2010 Ryan Bergstrom
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import itertools
+import multiprocessing
+import struct
+
+from types import Container, Node, scan_nodes, tag_type
+
+__all__ = ['deserialize_parallel', 'scan_children']
+
+# Buffer being decoded, inherited by (or passed once to) each worker process
+_shared = None
+
+def _init_worker(data):
+    global _shared
+    _shared = data
+
+def _decode_range(span):
+    start, end = span
+    return Container.deserialize(_shared[start:end]).value
+
+def scan_children(data, start, end):
+    """
+    Returns the offsets of the nodes in data[start:end], reading only their
+    headers. Raises ValueError if the range is not a sequence of complete
+    nodes (in which case Node.deserialize would decode it as a String).
+    """
+    offsets = []
+    if not scan_nodes(data, start, end, offsets):
+        raise ValueError('Range is not a sequence of complete nodes')
+    return offsets
+
+def deserialize_parallel(data, processes=None, min_items=10000):
+    """
+    Decodes a DMAP response like Node.deserialize, but decodes the items of
+    large listings (mlcl, either the response itself or one of its children)
+    in a pool of worker processes.
+
+    Item boundaries are found by scanning the length headers, and each worker
+    is handed only the (start, end) offsets of a contiguous range of items in
+    the shared buffer. Listings with fewer than min_items items are decoded
+    in this process.
+    """
+    if len(data) < 8:
+        return Node.deserialize(data)
+    tag, size = struct.unpack_from('>4sl', data)
+    if tag_type(tag) is not Container or size < 0 or 8 + size > len(data):
+        return Node.deserialize(data)
+
+    try:
+        if tag == 'mlcl':
+            listings = [0]
+            offsets = [0]
+        else:
+            offsets = scan_children(data, 8, 8 + size)
+            listings = [x for x in offsets if data[x:x + 4] == 'mlcl']
+        ranges = {}
+        for pos in listings:
+            length = struct.unpack_from('>l', data, pos + 4)[0]
+            items = scan_children(data, pos + 8, pos + 8 + length)
+            if len(items) >= min_items:
+                ranges[pos] = (items, pos + 8 + length)
+    except ValueError:
+        return Node.deserialize(data[:8 + size])
+    if not ranges:
+        return Node.deserialize(data[:8 + size])
+
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    spans = []
+    for pos in sorted(ranges):
+        items, end = ranges[pos]
+        step = max(1, len(items) // (processes * 4))
+        bounds = items[::step] + [end]
+        spans.extend((pos, x) for x in zip(bounds[:-1], bounds[1:]))
+
+    # Results are consumed in order as they arrive, so only a few decoded
+    # ranges are ever waiting to be unpickled at once.
+    values = dict((pos, []) for pos in ranges)
+    pool = multiprocessing.Pool(processes, _init_worker, (data,))
+    try:
+        results = pool.imap(_decode_range, [x[1] for x in spans])
+        for (pos, span), decoded in itertools.izip(spans, results):
+            values[pos].extend(decoded)
+    finally:
+        pool.close()
+        pool.join()
+
+    if tag == 'mlcl':
+        return Node('mlcl', Container(values[0]))
+    children = []
+    for pos in offsets:
+        if pos in ranges:
+            children.append(Node('mlcl', Container(values[pos])))
+        else:
+            length = struct.unpack_from('>l', data, pos + 4)[0]
+            children.append(Node.deserialize(data[pos:pos + 8 + length]))
+    return Node(tag, Container(children))
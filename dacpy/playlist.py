@@ -0,0 +1,257 @@
+# The MIT License
+#
+# Copyright (c) 2010 Ryan Bergstrom
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import bisect
+import itertools
+
+from encoder import ListingEncoder
+
+__all__ = ['Playlist']
+
+class _Chunk(object):
+    __slots__ = ('ids', 'items')
+
+    def __init__(self, ids, items):
+        self.ids = ids
+        self.items = items
+
+class Playlist(object):
+    """
+    Ordered playlist membership: a sequence of entries, each an item id
+    (miid) with a container item id (mcti) that identifies that entry even
+    when the same item is in the playlist more than once.
+
+    Entries are kept in chunks of at most chunk_size, with a map from each
+    mcti to its chunk, so inserting, moving and deleting entries only
+    touches one or two small chunks rather than the whole list. Ranges can
+    be read for paging, and serialized straight into an apso response.
+
+    Example:
+        playlist = Playlist([101, 102, 103])
+        mcti = playlist.insert(1, 104)
+        playlist.move(mcti, 0)
+        body = playlist.response(0, 50)
+    """
+
+    chunk_size = 512
+
+    def __init__(self, item_ids=(), first_id=1):
+        self._chunks = []
+        self._starts = []
+        self._chunk_of = {}
+        self._next = first_id
+        self.extend(item_ids)
+
+    def __len__(self):
+        if not self._chunks:
+            return 0
+        return self._starts[-1] + len(self._chunks[-1].ids)
+
+    def __iter__(self):
+        for chunk in self._chunks:
+            for entry in itertools.izip(chunk.ids, chunk.items):
+                yield entry
+
+    def __contains__(self, mcti):
+        return mcti in self._chunk_of
+
+    def _new_id(self):
+        mcti = self._next
+        self._next = mcti + 1
+        return mcti
+
+    def _reindex(self, first=0):
+        """Recomputes the start positions of the chunks from first on."""
+        starts = self._starts
+        del starts[first:]
+        pos = 0
+        if first:
+            pos = starts[-1] + len(self._chunks[first - 1].ids)
+        for chunk in self._chunks[first:]:
+            starts.append(pos)
+            pos += len(chunk.ids)
+
+    def _locate(self, index):
+        """Returns (chunk number, offset in chunk) for an index."""
+        number = bisect.bisect_right(self._starts, index) - 1
+        return number, index - self._starts[number]
+
+    def _position(self, mcti):
+        """Returns (chunk number, offset in chunk) for an entry."""
+        chunk = self._chunk_of[mcti]
+        return self._chunks.index(chunk), chunk.ids.index(mcti)
+
+    def index(self, mcti):
+        """Returns the position of an entry."""
+        number, offset = self._position(mcti)
+        return self._starts[number] + offset
+
+    def item_id(self, mcti):
+        """Returns the item id (miid) of an entry."""
+        number, offset = self._position(mcti)
+        return self._chunks[number].items[offset]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return list(self)[index]
+            return self.range(start, stop)
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        number, offset = self._locate(index)
+        chunk = self._chunks[number]
+        return chunk.ids[offset], chunk.items[offset]
+
+    def range(self, start, end):
+        """Returns the (mcti, miid) entries from start up to end, for paging."""
+        start = max(start, 0)
+        end = min(end, len(self))
+        result = []
+        if start >= end:
+            return result
+        number, offset = self._locate(start)
+        while len(result) < end - start:
+            chunk = self._chunks[number]
+            stop = offset + (end - start - len(result))
+            result.extend(zip(chunk.ids[offset:stop], chunk.items[offset:stop]))
+            number += 1
+            offset = 0
+        return result
+
+    def insert(self, index, item_id, mcti=None):
+        """
+        Inserts an item at a position and returns its container item id
+        (a new one unless given).
+        """
+        if mcti is None:
+            mcti = self._new_id()
+        elif mcti in self._chunk_of:
+            raise ValueError('Duplicate container item id %d' % mcti)
+        else:
+            # Keep new ids clear of the ones given explicitly
+            self._next = max(self._next, mcti + 1)
+        length = len(self)
+        if index < 0:
+            index = max(index + length, 0)
+        index = min(index, length)
+
+        if not self._chunks:
+            self._chunks.append(_Chunk([], []))
+            self._starts.append(0)
+        if index == length:
+            number, offset = len(self._chunks) - 1, len(self._chunks[-1].ids)
+        else:
+            number, offset = self._locate(index)
+        chunk = self._chunks[number]
+        chunk.ids.insert(offset, mcti)
+        chunk.items.insert(offset, item_id)
+        self._chunk_of[mcti] = chunk
+
+        if len(chunk.ids) > self.chunk_size:
+            half = len(chunk.ids) // 2
+            new = _Chunk(chunk.ids[half:], chunk.items[half:])
+            del chunk.ids[half:]
+            del chunk.items[half:]
+            for x in new.ids:
+                self._chunk_of[x] = new
+            self._chunks.insert(number + 1, new)
+        self._reindex(number + 1)
+        return mcti
+
+    def append(self, item_id):
+        return self.insert(len(self), item_id)
+
+    def extend(self, item_ids):
+        """Appends several items and returns their container item ids."""
+        if not self._chunks:
+            self._chunks.append(_Chunk([], []))
+            self._starts.append(0)
+        first = len(self._chunks) - 1
+        chunk = self._chunks[-1]
+        result = []
+        for item_id in item_ids:
+            if len(chunk.ids) >= self.chunk_size:
+                chunk = _Chunk([], [])
+                self._chunks.append(chunk)
+            mcti = self._new_id()
+            chunk.ids.append(mcti)
+            chunk.items.append(item_id)
+            self._chunk_of[mcti] = chunk
+            result.append(mcti)
+        self._reindex(first)
+        return result
+
+    def remove(self, mcti):
+        """Removes an entry and returns its item id."""
+        number, offset = self._position(mcti)
+        return self._delete(number, offset)
+
+    def pop(self, index=-1):
+        """Removes the entry at a position and returns (mcti, miid)."""
+        mcti = self[index][0]
+        return mcti, self.remove(mcti)
+
+    def _delete(self, number, offset):
+        chunk = self._chunks[number]
+        del self._chunk_of[chunk.ids[offset]]
+        del chunk.ids[offset]
+        item_id = chunk.items.pop(offset)
+        if not chunk.ids and len(self._chunks) > 1:
+            del self._chunks[number]
+            del self._starts[number]
+        elif number + 1 < len(self._chunks) and \
+                len(chunk.ids) + len(self._chunks[number + 1].ids) <= self.chunk_size // 2:
+            # Merge small neighbours so the number of chunks stays bounded
+            after = self._chunks.pop(number + 1)
+            del self._starts[number + 1]
+            chunk.ids.extend(after.ids)
+            chunk.items.extend(after.items)
+            for x in after.ids:
+                self._chunk_of[x] = chunk
+        self._reindex(number)
+        return item_id
+
+    def move(self, mcti, index):
+        """Moves an entry to a new position (counted after removing it)."""
+        item_id = self.remove(mcti)
+        self.insert(index, item_id, mcti)
+
+    def clear(self):
+        self._chunks = []
+        self._starts = []
+        self._chunk_of = {}
+
+    def response(self, start=0, end=None):
+        """
+        Returns an apso response listing the entries from start up to end,
+        with mtco set to the length of the playlist.
+        """
+        if end is None:
+            end = len(self)
+        rows = self.range(start, end)
+        return _encoder.response(rows, 'apso', len(self))
+
+_encoder = ListingEncoder([(0, 'mcti'), (1, 'miid')])
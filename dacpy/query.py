@@ -0,0 +1,356 @@
+# The MIT License
+#
+# Copyright (c) 2010 Ryan Bergstrom
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import re
+
+from tags import PROPERTIES
+from util import LRUCache
+
+__all__ = ['ItemTable', 'Query', 'QueryError', 'compile_query']
+
+_NUMERIC_TYPES = set([
+    'UByte', 'Byte', 'UShort', 'Short', 'UInt', 'Int', 'ULong', 'Long',
+])
+
+class QueryError(ValueError):
+    pass
+
+class _Term(object):
+    """A single 'property:value' (or 'property!:value') comparison."""
+
+    def __init__(self, prop, value, negate):
+        try:
+            self.tag, typename = PROPERTIES[prop]
+        except KeyError:
+            raise QueryError('Unknown property in query: %s' % prop)
+        self.negate = negate
+        self.pattern = None
+
+        if typename == 'String':
+            value = value.lower()
+            if '*' in value:
+                parts = [re.escape(x) for x in value.split('*')]
+                self.pattern = re.compile('^%s$' % '.*'.join(parts), re.S | re.U)
+            self.key = value
+        elif typename in _NUMERIC_TYPES:
+            try:
+                self.key = int(value)
+            except ValueError:
+                raise QueryError('%s requires a numeric value' % prop)
+        else:
+            raise QueryError('Cannot filter on %s property %s' % (typename, prop))
+
+    def rows(self, table):
+        """Returns the set of rows matching the comparison, ignoring negation."""
+        if self.pattern is None:
+            return table.lookup(self.tag, self.key)
+        match = self.pattern.match
+        rows = set()
+        for key, keyrows in table.index(self.tag).iteritems():
+            if match(key):
+                rows |= keyrows
+        return rows
+
+    def evaluate(self, table):
+        if self.negate:
+            return table.universe() - self.rows(table)
+        return self.rows(table)
+
+class _And(object):
+    def __init__(self, terms):
+        self.terms = terms
+
+    def evaluate(self, table):
+        positive = []
+        negative = []
+        for term in self.terms:
+            if isinstance(term, _Term) and term.negate:
+                negative.append(term)
+            else:
+                positive.append(term.evaluate(table))
+
+        # Intersect starting from the smallest set, and subtract negated terms
+        # afterwards so they never have to be expanded against the universe.
+        if positive:
+            positive.sort(key=len)
+            result = set(positive[0])
+            for rows in positive[1:]:
+                if not result:
+                    break
+                result &= rows
+        else:
+            result = table.universe()
+        for term in negative:
+            if not result:
+                break
+            result -= term.rows(table)
+        return result
+
+class _Or(object):
+    def __init__(self, terms):
+        self.terms = terms
+
+    def evaluate(self, table):
+        result = set()
+        for term in self.terms:
+            result |= term.evaluate(table)
+        return result
+
+class _Parser(object):
+    """Recursive descent parser for the DAAP query syntax."""
+
+    _and_chars = '+ '
+
+    def __init__(self, text):
+        self.text = text
+        self.pos = 0
+
+    def parse(self):
+        expr = self.parse_or()
+        self.skip(self._and_chars)
+        if self.pos != len(self.text):
+            raise QueryError('Unexpected %r at position %d' % (self.text[self.pos], self.pos))
+        return expr
+
+    def skip(self, chars):
+        while self.pos < len(self.text) and self.text[self.pos] in chars:
+            self.pos += 1
+
+    def peek(self):
+        self.skip(' ')
+        try:
+            return self.text[self.pos]
+        except IndexError:
+            return None
+
+    def parse_or(self):
+        terms = [self.parse_and()]
+        while self.peek() == ',':
+            self.pos += 1
+            terms.append(self.parse_and())
+        if len(terms) == 1:
+            return terms[0]
+        return _Or(terms)
+
+    def parse_and(self):
+        terms = [self.parse_atom()]
+        while True:
+            start = self.pos
+            self.skip(self._and_chars)
+            if self.pos == start or self.peek() not in ("'", '('):
+                self.pos = start
+                break
+            terms.append(self.parse_atom())
+        if len(terms) == 1:
+            return terms[0]
+        return _And(terms)
+
+    def parse_atom(self):
+        char = self.peek()
+        if char == '(':
+            self.pos += 1
+            expr = self.parse_or()
+            if self.peek() != ')':
+                raise QueryError('Missing closing parenthesis')
+            self.pos += 1
+            return expr
+        elif char == "'":
+            return self.parse_term()
+        elif char is None:
+            raise QueryError('Unexpected end of query')
+        raise QueryError('Unexpected %r at position %d' % (char, self.pos))
+
+    def parse_term(self):
+        self.pos += 1
+        chars = []
+        while True:
+            try:
+                char = self.text[self.pos]
+            except IndexError:
+                raise QueryError('Unterminated term in query')
+            self.pos += 1
+            if char == '\\':
+                try:
+                    chars.append(self.text[self.pos])
+                except IndexError:
+                    raise QueryError('Unterminated term in query')
+                self.pos += 1
+            elif char == "'":
+                break
+            else:
+                chars.append(char)
+
+        term = u''.join(chars)
+        try:
+            prop, value = term.split(':', 1)
+        except ValueError:
+            raise QueryError('Missing \':\' in query term %r' % term)
+        negate = prop.endswith('!')
+        if negate:
+            prop = prop[:-1]
+        return _Term(prop, value, negate)
+
+class Query(object):
+    """
+    A compiled DAAP query, such as those passed in the 'query' and 'filter'
+    parameters of browse and item requests.
+
+    Terms are combined with '+' (or a space) for AND and ',' for OR, and can
+    be grouped with parentheses. A '!' before the colon negates a term, and
+    '*' in a string value matches any run of characters. String comparisons
+    are case-insensitive.
+
+    Example:
+        Query("'daap.songartist:Foo'+'com.apple.itunes.mediakind:1'")
+        Query("('dmap.itemname:*bar*','daap.songalbum:*bar*')+'daap.songartist!:'")
+    """
+
+    def __init__(self, text):
+        if isinstance(text, str):
+            text = text.decode('utf-8')
+        self.text = text
+        self._expr = _Parser(text).parse()
+
+    def rows(self, table):
+        """Returns the sorted row numbers of the table matched by the query."""
+        return sorted(self._expr.evaluate(table))
+
+    def filter(self, table):
+        """Returns the listing items in the table matched by the query."""
+        items = table.items
+        return [items[x] for x in self.rows(table)]
+
+_query_cache = LRUCache(256)
+
+def compile_query(text):
+    """
+    Returns a compiled Query for the query string, reusing a previously
+    compiled query where possible.
+    """
+    query = _query_cache.get(text)
+    if query is None:
+        query = Query(text)
+        _query_cache[text] = query
+    return query
+
+class ItemTable(object):
+    """
+    Column-oriented copy of a listing (mlcl) for evaluating queries.
+
+    Each leaf value of each listing item is stored in a per-tag column, keyed
+    by row number. Hash indexes from value to rows are built the first time a
+    tag is queried and kept up to date as items are added, so equality terms
+    cost a single lookup and wildcard terms only visit distinct values.
+    """
+
+    def __init__(self, items=()):
+        self.items = []
+        self.columns = {}
+        self._indexes = {}
+        self._universe = None
+        for item in items:
+            self.append(item)
+
+    @classmethod
+    def from_listing(cls, node):
+        """
+        Builds a table from a listing node, or from a response node (such as
+        adbs or apso) containing one.
+        """
+        if node.tag != 'mlcl':
+            node = node.mlcl[0]
+        return cls(node.value)
+
+    def append(self, item):
+        """Adds a listing item (mlit) and returns its row number."""
+        row = len(self.items)
+        self.items.append(item)
+        self._universe = None
+        try:
+            children = item.value.value
+        except AttributeError:
+            return row
+        if not isinstance(children, list):
+            return row
+
+        for child in children:
+            value = child.value.value
+            self.columns.setdefault(child.tag, {})[row] = value
+            try:
+                index = self._indexes[child.tag]
+            except KeyError:
+                continue
+            index.setdefault(self._key(value), set()).add(row)
+        return row
+
+    def _key(self, value):
+        if isinstance(value, basestring):
+            return value.lower()
+        return value
+
+    def __len__(self):
+        return len(self.items)
+
+    def universe(self):
+        """Returns a new set containing every row number."""
+        if self._universe is None:
+            self._universe = frozenset(xrange(len(self.items)))
+        return set(self._universe)
+
+    def index(self, tag):
+        """Returns the {value: set(rows)} index for the tag, building it if needed."""
+        try:
+            return self._indexes[tag]
+        except KeyError:
+            pass
+        index = {}
+        for row, value in self.columns.get(tag, {}).iteritems():
+            index.setdefault(self._key(value), set()).add(row)
+        self._indexes[tag] = index
+        return index
+
+    def lookup(self, tag, value):
+        """Returns the set of rows where the tag has the value (not to be modified)."""
+        return self.index(tag).get(value, frozenset())
+
+    def select(self, query):
+        """Returns the sorted row numbers matching a query string or Query."""
+        if not isinstance(query, Query):
+            query = compile_query(query)
+        return query.rows(self)
+
+    def filter(self, query):
+        """Returns the listing items matching a query string or Query."""
+        return [self.items[x] for x in self.select(query)]
+
+    def distinct(self, tag, rows=None):
+        """
+        Returns the sorted distinct values of the tag for the given rows (or all
+        rows), as needed for browse responses.
+        """
+        column = self.columns.get(tag, {})
+        if rows is None:
+            values = set(column.itervalues())
+        else:
+            values = set([column[x] for x in rows if x in column])
+        return sorted(values)
@@ -0,0 +1,253 @@
+# The MIT License
+#
+# Copyright (c) 2010 Ryan Bergstrom
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import re
+import threading
+
+from http import HTTPError
+from server import Backend
+from types import Node
+from util import LRUCache
+
+__all__ = ['Relay', 'RelayBackend']
+
+# Library requests whose responses only change with the library revision
+_CACHEABLE = re.compile(r'^/databases(/\d+/(items|containers(/\d+/items)?|browse/\w+))?$')
+
+# Read-only requests that identical concurrent callers can share
+_SHAREABLE = re.compile(r'^/(server-info|content-codes|databases(/.*)?|'
+                        r'ctrl-int/1/(getproperty|nowplayingartwork))$')
+
+class _Flight(object):
+    """A fetch in progress, shared by every caller making the same request."""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.body = None
+        self.error = None
+
+class Relay(object):
+    """
+    Forwards DACP requests from many remotes to one server through a
+    (logged in) DACPClient.
+
+    Identical read-only requests that arrive while one is already being
+    fetched wait for that fetch and share its response. Responses to library
+    requests (databases, items, containers, playlist items and browse) are
+    kept per library revision, up to max_entries of them, so remotes
+    opening the library at the same time cause a single fetch.
+
+    The revision is read from /update the first time it is needed. Call
+    wait_for_update() in a loop (e.g. on a separate thread) to follow
+    library changes, or invalidate() when the server's revision is known to
+    have changed.
+
+    Example:
+        client = DACPClient('192.168.0.2')
+        client.login(guid)
+        relay = Relay(client)
+        body = relay.fetch('/databases/1/items', params)
+    """
+
+    def __init__(self, client, max_entries=256):
+        self.client = client
+        self.revision = None
+        self.fetches = 0
+        self.hits = 0
+        self._cache = LRUCache(max_entries)
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def cache_key(self, path, params=None):
+        """Returns the key identifying a request, ignoring the session id."""
+        if hasattr(params, 'items'):
+            params = params.items()
+        return (path, tuple(sorted([(k, unicode(v)) for (k, v) in params or ()
+                                    if k != 'session-id'])))
+
+    def refresh(self):
+        """Reads the server's current library revision."""
+        node = self.client.request('/update', [('revision-number', 1)])
+        self.invalidate(node.musr[0])
+        return self.revision
+
+    def wait_for_update(self, timeout=None):
+        """
+        Waits for the server's library revision to change (a /update
+        long-poll) and returns the new revision.
+        """
+        if self.revision is None:
+            return self.refresh()
+        node = self.client.request('/update', [('revision-number', self.revision)], timeout)
+        self.invalidate(node.musr[0])
+        return self.revision
+
+    def invalidate(self, revision=None):
+        """
+        Drops the cached responses if the revision differs from the current
+        one. With no revision, the cache is always dropped and the revision
+        read again when next needed.
+        """
+        with self._lock:
+            if revision is not None and revision == self.revision:
+                return
+            self.revision = revision
+        self._cache.clear()
+
+    def fetch(self, path, params=None, timeout=None):
+        """Returns the body of the server's response to a request."""
+        if not _SHAREABLE.match(path):
+            return self._fetch(path, params, timeout)
+
+        if _CACHEABLE.match(path):
+            revision = self.revision
+            if revision is None:
+                revision = self.refresh()
+            key = (revision, self.cache_key(path, params))
+            body = self._cache.get(key)
+            if body is not None:
+                with self._lock:
+                    self.hits += 1
+                return body
+        else:
+            key = (None, self.cache_key(path, params))
+
+        with self._lock:
+            flight = self._flights.get(key)
+            owner = flight is None
+            if owner:
+                flight = self._flights[key] = _Flight()
+            else:
+                self.hits += 1
+
+        if not owner:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.body
+
+        try:
+            flight.body = self._fetch(path, params, timeout)
+            if key[0] is not None and key[0] == self.revision:
+                self._cache[key] = flight.body
+            return flight.body
+        except Exception, e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.event.set()
+
+    def _fetch(self, path, params, timeout):
+        # The remote's session means nothing to the server; the client
+        # adds its own
+        if hasattr(params, 'items'):
+            params = params.items()
+        params = [(k, v) for (k, v) in params or () if k != 'session-id']
+        with self._lock:
+            self.fetches += 1
+        return self.client.fetch(path, params, timeout).body
+
+    def request(self, path, params=None, timeout=None):
+        """Returns the server's response to a request as a Node (or None if empty)."""
+        body = self.fetch(path, params, timeout)
+        if not body:
+            return None
+        return Node.deserialize(body, self.client.limits)
+
+class RelayBackend(Backend):
+    """
+    Backend serving the library and player of another server through a
+    Relay, so a DACPServer can stand in front of it for many remotes.
+
+    Call server.library_changed() whenever relay.wait_for_update() returns,
+    so remotes waiting on /update hear about the new revision.
+
+    The methods fetch from the other server synchronously, and DACPServer
+    calls them from its single loop, so every remote waits while a request
+    that misses the cache is fetched. Keep the other server close, and
+    warm the cache (e.g. with relay.fetch() from another thread) after each
+    library change.
+    """
+
+    item_meta = (
+        'dmap.itemid', 'dmap.itemname', 'dmap.persistentid',
+        'daap.songalbum', 'daap.songartist', 'daap.songalbumartist',
+        'daap.songgenre', 'daap.songcomposer', 'daap.songtime',
+        'daap.songtracknumber', 'daap.songdiscnumber', 'daap.songyear',
+        'daap.songalbumid', 'com.apple.itunes.mediakind',
+    )
+
+    container_meta = (
+        'dmap.itemid', 'dmap.itemname', 'dmap.persistentid',
+        'dmap.itemcount', 'dmap.parentcontainerid', 'daap.baseplaylist',
+        'com.apple.itunes.special-playlist',
+    )
+
+    def __init__(self, relay):
+        self.relay = relay
+        self._name = None
+
+    @property
+    def name(self):
+        if self._name is None:
+            self._name = self.relay.request('/server-info').minm[0]
+        return self._name
+
+    @property
+    def revision(self):
+        if self.relay.revision is None:
+            return self.relay.refresh()
+        return self.relay.revision
+
+    def _listing(self, path, meta=None):
+        params = []
+        if meta:
+            params.append(('meta', ','.join(meta)))
+        node = self.relay.request(path, params)
+        return node.mlcl[0].value.value
+
+    def databases(self):
+        return self._listing('/databases')
+
+    def items(self, database_id):
+        return self._listing('/databases/%d/items' % database_id, self.item_meta)
+
+    def containers(self, database_id):
+        return self._listing('/databases/%d/containers' % database_id, self.container_meta)
+
+    def container_items(self, database_id, container_id):
+        return self._listing('/databases/%d/containers/%d/items' % (database_id, container_id),
+                             self.item_meta + ('dmap.containeritemid',))
+
+    def playstatus(self):
+        return self.relay.request('/ctrl-int/1/playstatusupdate', [('revision-number', 1)])
+
+    def ctrl_int(self, command, params):
+        try:
+            return self.relay.request('/ctrl-int/1/%s' % command, params.items())
+        except HTTPError, e:
+            if e.status == 404:
+                raise KeyError(command)
+            raise
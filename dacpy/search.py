@@ -0,0 +1,211 @@
+# The MIT License
+#
+# Copyright (c) 2010 Ryan Bergstrom
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import re
+
+from bisect import bisect_left, insort
+
+__all__ = ['SearchIndex']
+
+_word_start = re.compile(r'(?<!\w)\w', re.U)
+
+class _FieldIndex(object):
+    """
+    Case-folded index of the values of a single String tag.
+
+    Distinct values are mapped to the item ids that carry them. Each distinct
+    value is also entered into a sorted array once per word, as the suffix of
+    the value starting at that word, so prefix searches are a binary search
+    followed by a walk over the matching entries. Trigrams of each distinct
+    value are kept for substring searches.
+    """
+
+    gram = 3
+
+    def __init__(self):
+        self.postings = {}
+        self.words = []
+        self.grams = {}
+
+    def _suffixes(self, value):
+        return [(value[m.start():], value) for m in _word_start.finditer(value)]
+
+    def _grams(self, value):
+        n = self.gram
+        return set([value[i:i + n] for i in xrange(len(value) - n + 1)])
+
+    def add(self, miid, value, presorted=True):
+        try:
+            self.postings[value].add(miid)
+            return
+        except KeyError:
+            self.postings[value] = set([miid])
+
+        if presorted:
+            for entry in self._suffixes(value):
+                insort(self.words, entry)
+        else:
+            self.words.extend(self._suffixes(value))
+        for gram in self._grams(value):
+            self.grams.setdefault(gram, set()).add(value)
+
+    def remove(self, miid, value):
+        try:
+            ids = self.postings[value]
+        except KeyError:
+            return
+        ids.discard(miid)
+        if ids:
+            return
+
+        del self.postings[value]
+        for entry in self._suffixes(value):
+            pos = bisect_left(self.words, entry)
+            if pos < len(self.words) and self.words[pos] == entry:
+                del self.words[pos]
+        for gram in self._grams(value):
+            values = self.grams[gram]
+            values.discard(value)
+            if not values:
+                del self.grams[gram]
+
+    def prefix(self, text):
+        words = self.words
+        pos = bisect_left(words, (text,))
+        values = set()
+        while pos < len(words) and words[pos][0].startswith(text):
+            values.add(words[pos][1])
+            pos += 1
+        return values
+
+    def substring(self, text):
+        if len(text) < self.gram:
+            return set([x for x in self.postings if text in x])
+        candidates = None
+        for gram in sorted(self._grams(text), key=lambda x: len(self.grams.get(x, ()))):
+            values = self.grams.get(gram)
+            if not values:
+                return set()
+            if candidates is None:
+                candidates = set(values)
+            else:
+                candidates &= values
+        return set([x for x in candidates if text in x])
+
+class SearchIndex(object):
+    """
+    Search-as-you-type index over the String fields of listing items.
+
+    Values are case-folded and indexed per tag, and searches return the set of
+    item ids (miid) with a matching value in any of the indexed tags. Prefix
+    searches match the start of any word in a value; substring searches match
+    anywhere in the value.
+
+    Example:
+        index = SearchIndex.from_listing(response)
+        index.search(u'bea')                  # word prefix in any field
+        index.search(u'eatl', substring=True) # substring in any field
+        index.search(u'abbey', tags=['asal'])
+    """
+
+    default_tags = ('minm', 'asar', 'asal', 'ascp')
+
+    def __init__(self, tags=None):
+        self.tags = tuple(tags or self.default_tags)
+        self._fields = dict([(x, _FieldIndex()) for x in self.tags])
+        self._items = {}
+
+    @classmethod
+    def from_listing(cls, node, tags=None):
+        """
+        Builds an index from a listing node, or from a response node (such as
+        adbs or apso) containing one.
+        """
+        index = cls(tags)
+        index.add_listing(node)
+        return index
+
+    def _values(self, item):
+        values = []
+        for child in item.value:
+            if child.tag in self._fields:
+                values.append((child.tag, child.value.value.lower()))
+        return values
+
+    def add_listing(self, node):
+        """Adds every item of a listing node (or a response containing one)."""
+        if node.tag != 'mlcl':
+            node = node.mlcl[0]
+        # New items are appended and sorted once at the end; items already
+        # indexed are replaced afterwards, as removal needs sorted words
+        replaced = []
+        for item in node.value:
+            if item.miid[0] in self._items:
+                replaced.append(item)
+            else:
+                self.add(item, presorted=False)
+        for field in self._fields.itervalues():
+            field.words.sort()
+        for item in replaced:
+            self.add(item)
+
+    def add(self, item, presorted=True):
+        """Adds or replaces a listing item (mlit), which must carry a miid."""
+        miid = item.miid[0]
+        if miid in self._items:
+            self.remove(miid)
+        values = self._values(item)
+        for tag, value in values:
+            self._fields[tag].add(miid, value, presorted)
+        self._items[miid] = values
+
+    def update(self, item):
+        """Re-indexes a listing item after its values have changed."""
+        self.add(item)
+
+    def remove(self, miid):
+        """Removes the item with the given id from the index."""
+        for tag, value in self._items.pop(miid, ()):
+            self._fields[tag].remove(miid, value)
+
+    def __contains__(self, miid):
+        return miid in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+    def search(self, text, tags=None, substring=False):
+        """Returns the set of item ids with a value matching the search text."""
+        if isinstance(text, str):
+            text = text.decode('utf-8')
+        text = text.lower()
+        result = set()
+        for tag in tags or self.tags:
+            field = self._fields[tag]
+            if substring:
+                values = field.substring(text)
+            else:
+                values = field.prefix(text)
+            for value in values:
+                result |= field.postings[value]
+        return result
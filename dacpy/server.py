@@ -0,0 +1,793 @@
+# The MIT License
+#
+# Copyright (c) 2010 Ryan Bergstrom
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import asyncore
+import logging
+import os
+import re
+import socket
+import struct
+import urlparse
+
+from BaseHTTPServer import BaseHTTPRequestHandler
+from collections import deque
+from datetime import datetime
+
+import tags
+
+from artwork import ArtworkCache
+from coalesce import Coalescer
+from http import etag_matches
+from query import ItemTable, QueryError, compile_query
+from session import SessionManager
+from status import StatusBroadcaster
+from types import Container, Node, build_node
+
+__all__ = ['Backend', 'DACPServer', 'Request']
+
+# Buffers smaller than this are joined into a single send() call
+_GATHER_SIZE = 16384
+
+# Maximum size of a request's header block
+_MAX_HEADER_SIZE = 65536
+
+# Maximum size of a request body (DACP requests carry little or none)
+_MAX_BODY_SIZE = 1048576
+
+# Requests read ahead on a connection before waiting for responses
+_MAX_PIPELINE = 16
+
+_BROWSE_FIELDS = {
+    'artists': ('abar', 'asar'),
+    'albums': ('abal', 'asal'),
+    'genres': ('abgn', 'asgn'),
+    'composers': ('abcp', 'ascp'),
+}
+
+class Request(object):
+    """
+    An HTTP request received by a DACPServer.
+
+    A handler answers by calling respond() or respond_node(), either right
+    away or later (for long-polls). Responses on a connection are always
+    sent in the order the requests arrived.
+    """
+
+    def __init__(self, channel, method, target, version, headers):
+        self.channel = channel
+        self.method = method
+        self.target = target
+        self.version = version
+        self.headers = headers
+        self.body = ''
+        self.response = None
+        self._cancel_callbacks = []
+
+        url = urlparse.urlsplit(target)
+        self.path = url.path
+        self.params = dict(urlparse.parse_qsl(url.query, True))
+
+        connection = headers.get('connection', '').lower()
+        if version == 'HTTP/1.0':
+            self.keep_alive = connection == 'keep-alive'
+        else:
+            self.keep_alive = connection != 'close'
+
+    @classmethod
+    def parse(cls, channel, data):
+        lines = data.split('\r\n')
+        try:
+            method, target, version = lines[0].split()
+        except ValueError:
+            raise ValueError('Bad request line: %r' % lines[0])
+        headers = {}
+        for line in lines[1:]:
+            try:
+                name, value = line.split(':', 1)
+            except ValueError:
+                raise ValueError('Bad header line: %r' % line)
+            headers[name.strip().lower()] = value.strip()
+        return cls(channel, method, target, version, headers)
+
+    @property
+    def answered(self):
+        return self.response is not None
+
+    def on_cancel(self, callback):
+        """Calls the callback if the connection closes before the response is sent."""
+        self._cancel_callbacks.append(callback)
+
+    def cancel(self):
+        callbacks, self._cancel_callbacks = self._cancel_callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def respond(self, status, body='', headers=None,
+                content_type='application/x-dmap-tagged'):
+        """Sends the response, unless one has already been sent."""
+        if self.response is not None:
+            return
+        reason = BaseHTTPRequestHandler.responses.get(status, ('',))[0]
+        lines = [
+            'HTTP/1.1 %d %s' % (status, reason),
+            'DAAP-Server: dacpy',
+            'Content-Length: %d' % len(body),
+            'Connection: %s' % (self.keep_alive and 'keep-alive' or 'close'),
+        ]
+        if body:
+            lines.append('Content-Type: %s' % content_type)
+        lines.extend(['%s: %s' % x for x in (headers or {}).iteritems()])
+        head = '\r\n'.join(lines) + '\r\n\r\n'
+        if body:
+            self.response = [head, body]
+        else:
+            self.response = [head]
+        self.channel.flush()
+
+    def respond_node(self, node, status=200, headers=None, revision=None):
+        """
+        Sends a Node, or (tag, value) tuple for build_node, as the response.
+        With a (library) revision, the response gets an ETag made of the
+        revision and the node's digest, and 304 Not Modified is sent instead
+        if the request's If-None-Match matches it.
+        """
+        if not isinstance(node, Node):
+            node = build_node(node)
+        if revision is not None:
+            headers = dict(headers or {})
+            headers['ETag'] = etag = '"%s-%s"' % (revision, node.digest().encode('hex'))
+            if etag_matches(self.headers.get('if-none-match'), etag):
+                self.respond(304, '', headers)
+                return
+        self.respond(status, node.serialize(), headers)
+
+class _Channel(asyncore.dispatcher):
+    """A client connection to a DACPServer."""
+
+    def __init__(self, server, sock, socket_map):
+        asyncore.dispatcher.__init__(self, sock, socket_map)
+        self.server = server
+        self._in = ''
+        self._body_request = None
+        self._pending = deque()
+        self._out = deque()
+        self._offset = 0
+        self._closing = False
+        self._stalled = False
+
+    def readable(self):
+        return not self._closing and len(self._pending) < _MAX_PIPELINE
+
+    def writable(self):
+        return bool(self._out)
+
+    def handle_read(self):
+        data = self.recv(65536)
+        if data:
+            self._in += data
+            self._parse()
+
+    def _parse(self):
+        while not self._closing:
+            if len(self._pending) >= _MAX_PIPELINE:
+                # Resumed by flush once a response has been sent
+                self._stalled = True
+                return
+            if self._body_request is not None:
+                request = self._body_request
+                length = int(request.headers['content-length'])
+                if len(self._in) < length:
+                    return
+                request.body, self._in = self._in[:length], self._in[length:]
+                self._body_request = None
+            else:
+                end = self._in.find('\r\n\r\n')
+                if end < 0:
+                    if len(self._in) > _MAX_HEADER_SIZE:
+                        self._error(413)
+                    return
+                data, self._in = self._in[:end].lstrip('\r\n'), self._in[end + 4:]
+                try:
+                    request = Request.parse(self, data)
+                    length = int(request.headers.get('content-length', 0) or 0)
+                except ValueError:
+                    self._error(400)
+                    return
+                if length > _MAX_BODY_SIZE:
+                    self._error(413)
+                    return
+                if length > 0:
+                    self._body_request = request
+                    continue
+
+            self._pending.append(request)
+            self.server.handle_request(request)
+
+    def _error(self, status):
+        request = Request(self, 'GET', '/', 'HTTP/1.1', {'connection': 'close'})
+        self._pending.append(request)
+        request.respond(status)
+
+    def flush(self):
+        """Queues the responses that are ready, in request order."""
+        pending = self._pending
+        while pending and pending[0].response is not None:
+            request = pending.popleft()
+            self._out.extend(request.response)
+            if not request.keep_alive:
+                self._closing = True
+                pending.clear()
+                break
+        if self._out and self.socket is not None:
+            self.handle_write()
+        if self._stalled and len(pending) < _MAX_PIPELINE:
+            self._stalled = False
+            self._parse()
+
+    def handle_write(self):
+        out = self._out
+        data = out[0]
+        if self._offset:
+            data = buffer(data, self._offset)
+        if len(data) < _GATHER_SIZE and len(out) > 1:
+            parts = [str(data)]
+            size = len(data)
+            for i in xrange(1, len(out)):
+                if size + len(out[i]) > _GATHER_SIZE:
+                    break
+                parts.append(out[i])
+                size += len(out[i])
+            data = ''.join(parts)
+
+        try:
+            sent = self.send(data)
+        except socket.error:
+            self.handle_close()
+            return
+
+        while sent:
+            remaining = len(out[0]) - self._offset
+            if sent < remaining:
+                self._offset += sent
+                break
+            sent -= remaining
+            out.popleft()
+            self._offset = 0
+
+        if not out and self._closing:
+            self.close()
+
+    def handle_close(self):
+        self._closing = True
+        pending, self._pending = self._pending, deque()
+        self._out.clear()
+        self.close()
+        for request in pending:
+            if not request.answered:
+                request.cancel()
+
+    def handle_error(self):
+        logging.exception('Error on DACP connection')
+        self.handle_close()
+
+class _Trigger(asyncore.file_dispatcher):
+    """Wakes the server loop to run callbacks queued by other threads."""
+
+    def __init__(self, socket_map):
+        read_fd, self._write_fd = os.pipe()
+        asyncore.file_dispatcher.__init__(self, read_fd, socket_map)
+        os.close(read_fd)
+        self._calls = deque()
+
+    def writable(self):
+        return False
+
+    def call(self, callback):
+        self._calls.append(callback)
+        os.write(self._write_fd, 'x')
+
+    def handle_read(self):
+        self.recv(8192)
+        while self._calls:
+            callback = self._calls.popleft()
+            try:
+                callback()
+            except Exception:
+                logging.exception('Error in DACP server callback')
+
+    def close(self):
+        asyncore.file_dispatcher.close(self)
+        if self._write_fd is not None:
+            os.close(self._write_fd)
+            self._write_fd = None
+
+class Backend(object):
+    """
+    Library and player interface used by DACPServer. Subclasses override the
+    methods for the features they support.
+
+    Listings are returned as lists of mlit Nodes (see build_node), and items
+    must carry a miid. Player responses are returned as lists of (tag, value)
+    tuples for build_node.
+    """
+
+    name = 'dacpy'
+    revision = 1
+
+    def check_pairing(self, guid):
+        """Returns True if the pairing GUID sent to /login is allowed."""
+        return True
+
+    def pair(self, pairingcode, servicename):
+        """
+        Answers a /pair request when acting as a remote. Returns the pairing
+        GUID, or None if the pairing code is wrong.
+        """
+        return None
+
+    def databases(self):
+        return [build_node(('mlit', [
+            ('miid', 1),
+            ('mper', 1),
+            ('minm', self.name),
+            ('mimc', len(self.items(1))),
+            ('mctc', len(self.containers(1))),
+        ]))]
+
+    def items(self, database_id):
+        raise KeyError(database_id)
+
+    def containers(self, database_id):
+        return []
+
+    def container_items(self, database_id, container_id):
+        raise KeyError(container_id)
+
+    def playstatus(self):
+        """
+        Returns the contents of the cmst (playstatusupdate) response. Called
+        once for each DACPServer.status_changed().
+        """
+        return [('caps', 2), ('cash', 0), ('carp', 0), ('cavc', 1)]
+
+    def nowplaying(self):
+        """Returns the item id (miid) of the current track, or None."""
+        return None
+
+    def artwork(self, item_id, width, height):
+        """
+        Returns (data, content_type) for an item's artwork scaled to fit the
+        size, or None if it has none. Results are cached per library revision.
+        """
+        return None
+
+    def ctrl_int(self, command, params):
+        """
+        Handles a /ctrl-int/1/ command other than playstatusupdate. Returns a
+        (tag, value) tuple for the response, or None for an empty response.
+        The params are the query parameters without session-id. Raises
+        KeyError for unsupported commands.
+        """
+        raise KeyError(command)
+
+def _parse_index(value, total):
+    """Parses a DAAP 'index' parameter ('start-end' or 'start') into a slice."""
+    try:
+        if '-' in value:
+            start, end = [int(x) for x in value.split('-', 1)]
+        else:
+            start = end = int(value)
+    except ValueError:
+        raise QueryError('Bad index: %r' % value)
+    return slice(max(start, 0), min(end + 1, total))
+
+def _meta_tags(value):
+    """Returns the set of tags for a 'meta' parameter, or None for all."""
+    if not value or value == 'all':
+        return None
+    result = set(['miid'])
+    for prop in value.split(','):
+        try:
+            result.add(tags.PROPERTIES[prop][0])
+        except KeyError:
+            pass
+    return result
+
+class DACPServer(asyncore.dispatcher):
+    """
+    Non-blocking DACP/DAAP server for remotes, using a Backend for library
+    and player data.
+
+    All connections are handled by a single asyncore loop (using poll, so
+    there is no select() limit on the number of remotes), and requests on
+    each connection may be pipelined. Item and browse queries are evaluated
+    with dacpy.query over an ItemTable per database and library revision.
+
+    Sessions expire after session_timeout seconds without a request. If a
+    PairingStore is given as pairings, /login only accepts the GUIDs in it;
+    otherwise Backend.check_pairing() decides. A TouchRemoteListener given
+    as listener has its stale remotes expired along with the sessions.
+
+    Call status_changed() whenever the player state changes, and
+    library_changed() after the library revision changes, to answer the
+    remotes long-polling for updates. Both may be called from any thread.
+
+    With a command_window (in seconds), bursts of setproperty commands for
+    the volume or play position are merged by a Coalescer, so the backend
+    gets at most one per window; other ctrl-int commands wait for the
+    merged ones, so they are still run in the order they arrived.
+
+    Example:
+        server = DACPServer(MyBackend(), ('', 3689))
+        server.serve_forever()
+    """
+
+    session_timeout = 1800
+
+    _routes = (
+        (r'^/server-info$', 'do_server_info', False),
+        (r'^/content-codes$', 'do_content_codes', False),
+        (r'^/login$', 'do_login', False),
+        (r'^/pair$', 'do_pair', False),
+        (r'^/logout$', 'do_logout', True),
+        (r'^/update$', 'do_update', True),
+        (r'^/databases$', 'do_databases', True),
+        (r'^/databases/(\d+)/items$', 'do_items', True),
+        (r'^/databases/(\d+)/containers$', 'do_containers', True),
+        (r'^/databases/(\d+)/containers/(\d+)/items$', 'do_container_items', True),
+        (r'^/databases/(\d+)/browse/(\w+)$', 'do_browse', True),
+        (r'^/databases/(\d+)/items/(\d+)/extra_data/artwork$', 'do_artwork', True),
+        (r'^/ctrl-int/1/(\w+)$', 'do_ctrl_int', True),
+    )
+
+    def __init__(self, backend, address=('', 3689), socket_map=None, artwork=None,
+                 pairings=None, command_window=None, listener=None):
+        if socket_map is None:
+            socket_map = {}
+        asyncore.dispatcher.__init__(self, map=socket_map)
+        self.socket_map = socket_map
+        self.backend = backend
+        self.artwork = artwork or ArtworkCache()
+        self.pairings = pairings
+        self.listener = listener
+        self.sessions = SessionManager(self.session_timeout)
+        self._running = False
+        self._tables = {}
+        self._update_waiters = set()
+        self._status = None
+        self._trigger = _Trigger(socket_map)
+        self.commands = None
+        if command_window is not None:
+            self.commands = Coalescer(lambda params: backend.ctrl_int('setproperty', params),
+                                      command_window, self.call_soon)
+        self.routes = [(re.compile(p), getattr(self, n), s) for (p, n, s) in self._routes]
+
+        self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.set_reuse_addr()
+        self.bind(address)
+        self.listen(256)
+
+    @property
+    def address(self):
+        return self.socket.getsockname()
+
+    def handle_accept(self):
+        pair = self.accept()
+        if pair is not None:
+            _Channel(self, pair[0], self.socket_map)
+
+    def handle_error(self):
+        logging.exception('Error accepting DACP connection')
+
+    def serve_forever(self, timeout=0.1):
+        """Handles requests until shutdown() is called."""
+        self._running = True
+        while self._running:
+            asyncore.loop(timeout, True, self.socket_map, 1)
+            self.sessions.expire()
+            if self.listener is not None:
+                self.listener.expire()
+
+    def shutdown(self):
+        """Stops serve_forever() (may be called from another thread)."""
+        self._running = False
+
+    def server_close(self):
+        """Closes the listening socket and all connections."""
+        for channel in self.socket_map.values():
+            channel.close()
+
+    def handle_request(self, request):
+        for pattern, handler, needs_session in self.routes:
+            match = pattern.match(request.path)
+            if match:
+                break
+        else:
+            request.respond(404)
+            return
+
+        if needs_session and not self.check_session(request):
+            request.respond(403)
+            return
+        try:
+            handler(request, *match.groups())
+        except (KeyError, QueryError), e:
+            logging.info('Bad DACP request %s: %r' % (request.target, e))
+            request.respond(404)
+        except Exception:
+            logging.exception('Error handling DACP request %s' % request.target)
+            request.respond(500)
+
+    def check_session(self, request):
+        try:
+            return self.sessions.touch(int(request.params['session-id']))
+        except (KeyError, ValueError):
+            return False
+
+    def call_soon(self, callback):
+        """Runs the callback in the server loop (may be called from any thread)."""
+        self._trigger.call(callback)
+
+    def library_changed(self):
+        """Answers the /update long-polls; call after backend.revision changes."""
+        self.call_soon(self._library_changed)
+
+    def _library_changed(self):
+        waiters, self._update_waiters = self._update_waiters, set()
+        for request in waiters:
+            self._send_update(request)
+
+    @property
+    def status(self):
+        """The StatusBroadcaster for playstatusupdate responses."""
+        if self._status is None:
+            self._status = StatusBroadcaster(self.backend.playstatus())
+        return self._status
+
+    def status_changed(self):
+        """Publishes the backend's new player status to waiting remotes."""
+        self.call_soon(lambda: self.status.publish(self.backend.playstatus()))
+
+    def _listing(self, tag, items, total=None):
+        if total is None:
+            total = len(items)
+        return Node(tag, Container([
+            build_node(('mstt', 200)),
+            build_node(('muty', 0)),
+            build_node(('mtco', total)),
+            build_node(('mrco', len(items))),
+            Node('mlcl', Container(items)),
+        ]))
+
+    def _table(self, database_id):
+        key = (database_id, self.backend.revision)
+        try:
+            return self._tables[key]
+        except KeyError:
+            pass
+        table = ItemTable(self.backend.items(database_id))
+        for old in [x for x in self._tables if x[0] == database_id]:
+            del self._tables[old]
+        self._tables[key] = table
+        return table
+
+    def _select(self, request, table):
+        query = request.params.get('query') or request.params.get('filter')
+        if query:
+            return compile_query(query).rows(table)
+        return range(len(table))
+
+    def do_server_info(self, request):
+        request.respond_node(('msrv', [
+            ('mstt', 200),
+            ('mpro', (2, 0, 6, 0)),
+            ('apro', (3, 0, 8, 0)),
+            ('minm', self.backend.name),
+            ('mslr', 1),
+            ('mstm', self.session_timeout),
+            ('msal', 1),
+            ('msup', 1),
+            ('mspi', 1),
+            ('msex', 1),
+            ('msbr', 1),
+            ('msqy', 1),
+            ('msix', 1),
+            ('msrs', 1),
+            ('msdc', 1),
+            ('mstc', datetime.now),
+            ('msto', 0),
+        ]))
+
+    def do_content_codes(self, request):
+        typecodes = dict([(v, k) for (k, v) in tags.CONTENT_TYPES.iteritems()])
+        codes = []
+        for tag, (name, typename) in sorted(tags.TAGS.iteritems()):
+            if name and typename in typecodes:
+                codes.append(('mdcl', [
+                    ('mcnm', struct.unpack('>L', tag)[0]),
+                    ('mcna', name),
+                    ('mcty', typecodes[typename]),
+                ]))
+        request.respond_node(('mccr', [('mstt', 200)] + codes))
+
+    def do_login(self, request):
+        guid = request.params.get('pairing-guid')
+        if guid is not None:
+            try:
+                guid = int(guid, 16)
+            except ValueError:
+                request.respond(403)
+                return
+            if self.pairings is not None:
+                paired = guid in self.pairings
+            else:
+                paired = self.backend.check_pairing(guid)
+            if not paired:
+                request.respond(403)
+                return
+        session_id = self.sessions.create(guid)
+        request.respond_node(('mlog', [('mstt', 200), ('mlid', session_id)]))
+
+    def do_logout(self, request):
+        self.sessions.remove(int(request.params['session-id']))
+        request.respond(204)
+
+    def do_pair(self, request):
+        guid = self.backend.pair(request.params.get('pairingcode', ''),
+                                 request.params.get('servicename', ''))
+        if guid is None:
+            request.respond(404)
+            return
+        request.respond_node(('cmpa', [
+            ('cmpg', guid),
+            ('cmnm', self.backend.name),
+            ('cmty', 'dacpy'),
+        ]))
+
+    def _send_update(self, request):
+        request.respond_node(('mupd', [('mstt', 200), ('musr', self.backend.revision)]))
+
+    def do_update(self, request):
+        try:
+            revision = int(request.params.get('revision-number', 1))
+        except ValueError:
+            revision = 1
+        if revision == self.backend.revision and 'delta' not in request.params:
+            self._update_waiters.add(request)
+            request.on_cancel(lambda: self._update_waiters.discard(request))
+        else:
+            self._send_update(request)
+
+    def do_databases(self, request):
+        request.respond_node(self._listing('avdb', self.backend.databases()),
+                             revision=self.backend.revision)
+
+    def do_items(self, request, database_id):
+        table = self._table(int(database_id))
+        rows = self._select(request, table)
+        total = len(rows)
+        if 'index' in request.params:
+            rows = rows[_parse_index(request.params['index'], total)]
+
+        wanted = _meta_tags(request.params.get('meta'))
+        items = [table.items[x] for x in rows]
+        if wanted is not None:
+            items = [Node('mlit', Container([c for c in x.value if c.tag in wanted]))
+                     for x in items]
+        request.respond_node(self._listing('adbs', items, total),
+                             revision=self.backend.revision)
+
+    def do_containers(self, request, database_id):
+        request.respond_node(self._listing('aply', self.backend.containers(int(database_id))),
+                             revision=self.backend.revision)
+
+    def do_container_items(self, request, database_id, container_id):
+        items = self.backend.container_items(int(database_id), int(container_id))
+        total = len(items)
+        if 'index' in request.params:
+            items = items[_parse_index(request.params['index'], total)]
+        request.respond_node(self._listing('apso', items, total),
+                             revision=self.backend.revision)
+
+    def do_browse(self, request, database_id, field):
+        listtag, tag = _BROWSE_FIELDS[field]
+        table = self._table(int(database_id))
+        values = [x for x in table.distinct(tag, self._select(request, table)) if x]
+        total = len(values)
+        if 'index' in request.params:
+            values = values[_parse_index(request.params['index'], total)]
+        request.respond_node(('abro', [
+            ('mstt', 200),
+            ('muty', 0),
+            ('mtco', total),
+            ('mrco', len(values)),
+            (listtag, [('mlit', x) for x in values]),
+        ]))
+
+    def _send_artwork(self, request, item_id):
+        try:
+            width = int(request.params.get('mw', 320))
+            height = int(request.params.get('mh', 320))
+        except ValueError:
+            request.respond(400)
+            return
+        key = (item_id, self.backend.revision, width, height)
+        status, headers, body = self.artwork.respond(
+            key, lambda: self.backend.artwork(item_id, width, height),
+            request.headers.get('if-none-match'))
+        content_type = headers.pop('Content-Type', None)
+        request.respond(status, body, headers, content_type)
+
+    def do_artwork(self, request, database_id, item_id):
+        self._send_artwork(request, int(item_id))
+
+    def do_ctrl_int(self, request, command):
+        if command == 'playstatusupdate':
+            self.do_playstatusupdate(request)
+            return
+        elif command == 'nowplayingartwork':
+            item_id = self.backend.nowplaying()
+            if item_id is None:
+                request.respond(204)
+            else:
+                self._send_artwork(request, item_id)
+            return
+        params = dict([(k, v) for (k, v) in request.params.iteritems() if k != 'session-id'])
+        commands = self.commands
+        if commands is None:
+            self._answer_command(request, self.backend.ctrl_int(command, params))
+            return
+        if command == 'setproperty' and commands.coalescable(params):
+            commands.submit(params, lambda node, error: self._answer_command(request, node, error))
+        else:
+            commands.after(lambda: self._run_command(request, command, params))
+
+    def _run_command(self, request, command, params):
+        try:
+            node = self.backend.ctrl_int(command, params)
+        except Exception, e:
+            self._answer_command(request, None, e)
+        else:
+            self._answer_command(request, node)
+
+    def _answer_command(self, request, node, error=None):
+        if isinstance(error, KeyError):
+            logging.info('Bad DACP request %s: %r' % (request.target, error))
+            request.respond(404)
+        elif error is not None:
+            logging.error('Error handling DACP request %s: %r' % (request.target, error))
+            request.respond(500)
+        elif node is None:
+            request.respond(204)
+        else:
+            request.respond_node(node)
+
+    def do_playstatusupdate(self, request):
+        try:
+            revision = int(request.params.get('revision-number', 1))
+        except ValueError:
+            revision = 1
+        status = self.status
+        token = status.wait(revision, lambda revision, data: request.respond(200, data))
+        if token is not None:
+            request.on_cancel(lambda: status.cancel(token))
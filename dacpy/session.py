@@ -0,0 +1,191 @@
+# The MIT License
+#
+# Copyright (c) 2010 Ryan Bergstrom
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import os
+import os.path
+import random
+import tempfile
+import threading
+import time
+
+__all__ = ['PairingStore', 'Session', 'SessionManager']
+
+class Session(object):
+    """A logged in DAAP session."""
+
+    def __init__(self, session_id, guid, deadline):
+        self.id = session_id
+        self.guid = guid
+        self.deadline = deadline
+        self.data = {}
+
+class SessionManager(object):
+    """
+    Registry of DAAP sessions (mlid) that expire after timeout seconds
+    without activity.
+
+    Sessions are looked up in a dict, and expiry is tracked with a hashed
+    timer wheel: each session sits in the slot for the tick it expires on,
+    and touching a session moves it to a later slot. expire() only visits
+    the slots for the ticks that have passed since it last ran, so its cost
+    does not grow with the number of live sessions.
+
+    timeout = seconds of inactivity before a session expires (mstm)
+    resolution = length of a wheel tick in seconds
+    """
+
+    def __init__(self, timeout=1800, resolution=1.0, clock=time.time):
+        self.timeout = timeout
+        self.resolution = resolution
+        self.clock = clock
+        self._sessions = {}
+        self._slots = [set() for i in range(int(timeout / resolution) + 2)]
+        self._tick = self._now()
+        self._lock = threading.RLock()
+
+    def _now(self):
+        return int(self.clock() / self.resolution)
+
+    def _schedule(self, session):
+        session.deadline = self._now() + int(self.timeout / self.resolution) + 1
+        self._slots[session.deadline % len(self._slots)].add(session.id)
+
+    def _unschedule(self, session):
+        self._slots[session.deadline % len(self._slots)].discard(session.id)
+
+    def create(self, guid=None):
+        """Starts a session for a pairing GUID and returns the new session id."""
+        with self._lock:
+            session_id = random.randint(1, 0x7fffffff)
+            while session_id in self._sessions:
+                session_id = random.randint(1, 0x7fffffff)
+            session = Session(session_id, guid, None)
+            self._sessions[session_id] = session
+            self._schedule(session)
+            return session_id
+
+    def get(self, session_id):
+        """Returns the live Session with the id, or None."""
+        session = self._sessions.get(session_id)
+        if session is None or session.deadline <= self._now():
+            return None
+        return session
+
+    def touch(self, session_id):
+        """Restarts a session's timeout. Returns False if it is not live."""
+        with self._lock:
+            session = self.get(session_id)
+            if session is None:
+                return False
+            self._unschedule(session)
+            self._schedule(session)
+            return True
+
+    def remove(self, session_id):
+        """Ends a session (e.g. on /logout)."""
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+            if session is not None:
+                self._unschedule(session)
+
+    def expire(self):
+        """Removes the sessions that have timed out and returns their ids."""
+        expired = []
+        with self._lock:
+            now = self._now()
+            first = max(self._tick + 1, now - len(self._slots) + 1)
+            for tick in xrange(first, now + 1):
+                slot = self._slots[tick % len(self._slots)]
+                for session_id in list(slot):
+                    if self._sessions[session_id].deadline <= now:
+                        slot.discard(session_id)
+                        del self._sessions[session_id]
+                        expired.append(session_id)
+            self._tick = now
+        return expired
+
+    def __contains__(self, session_id):
+        return self.get(session_id) is not None
+
+    def __len__(self):
+        return len(self._sessions)
+
+class PairingStore(object):
+    """
+    Persistent set of paired remote GUIDs (as returned by TouchRemote.pair),
+    so /login?pairing-guid= can be checked with a single lookup.
+
+    GUIDs are kept in a text file, one per line as 16 hex digits followed by
+    an optional remote name. New pairings are appended to the file.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.names = {}
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path, 'rb') as f:
+                for line in f:
+                    parts = line.rstrip('\n').split(' ', 1)
+                    try:
+                        guid = int(parts[0], 16)
+                    except ValueError:
+                        continue
+                    self.names[guid] = len(parts) > 1 and parts[1].decode('utf-8') or None
+
+    def add(self, guid, name=None):
+        with self._lock:
+            if guid in self.names:
+                return
+            self.names[guid] = name
+            if self.path:
+                with open(self.path, 'ab') as f:
+                    f.write(self._line(guid, name))
+
+    def remove(self, guid):
+        with self._lock:
+            if guid not in self.names:
+                return
+            del self.names[guid]
+            if not self.path:
+                return
+            directory = os.path.dirname(os.path.abspath(self.path))
+            fd, tmppath = tempfile.mkstemp(dir=directory)
+            with os.fdopen(fd, 'wb') as f:
+                for guid, name in self.names.iteritems():
+                    f.write(self._line(guid, name))
+            os.rename(tmppath, self.path)
+
+    def _line(self, guid, name):
+        if name:
+            return '%016X %s\n' % (guid, name.encode('utf-8'))
+        return '%016X\n' % guid
+
+    def __contains__(self, guid):
+        return guid in self.names
+
+    def __len__(self):
+        return len(self.names)
+
+    def __iter__(self):
+        return iter(self.names)
@@ -0,0 +1,193 @@
+# The MIT License
+#
+# Copyright (c) 2010 Ryan Bergstrom
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import mmap
+import os
+import os.path
+import struct
+import tempfile
+
+from array import array
+
+from tape import Tape
+from types import Node
+
+__all__ = ['SharedLibrary', 'publish']
+
+_MAGIC = 'DACPYLIB'
+
+# Magic, item size of the columns, revision, number of entries, data length
+_HEADER = struct.Struct('=8sLQQQ')
+
+_ITEMSIZE = array('l').itemsize
+
+class _Region(object):
+    """A read-only window onto part of a buffer, sliced without copying it all."""
+
+    def __init__(self, data, start, length):
+        self.data = data
+        self.start = start
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.length)
+            return self.data[self.start + start:self.start + stop]
+        if not 0 <= index < self.length:
+            raise IndexError(index)
+        return self.data[self.start + index]
+
+    def find(self, sub, start=0, end=None):
+        if end is None:
+            end = self.length
+        pos = self.data.find(sub, self.start + start, self.start + min(end, self.length))
+        if pos >= 0:
+            pos -= self.start
+        return pos
+
+class _Column(object):
+    """A read-only column of native longs in a buffer."""
+
+    _struct = struct.Struct('=l')
+
+    def __init__(self, data, start, length):
+        self.data = data
+        self.start = start
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        if not 0 <= index < self.length:
+            raise IndexError(index)
+        return self._struct.unpack_from(self.data, self.start + index * _ITEMSIZE)[0]
+
+def publish(path, library, revision):
+    """
+    Writes a library (a Node, or a serialized DMAP response) and its tape
+    index to path, stamped with the revision, for SharedLibrary to attach
+    to. The file is replaced atomically, so processes attached to an older
+    revision keep reading it undisturbed.
+
+    Put the file on a memory-backed filesystem (e.g. /dev/shm) so the
+    pages are shared by every attached process without touching disk.
+    """
+    if isinstance(library, Node):
+        data = library.serialize()
+    else:
+        data = str(library)
+    tape = Tape(data)
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmppath = tempfile.mkstemp(dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(_HEADER.pack(_MAGIC, _ITEMSIZE, revision, len(tape), len(data)))
+            f.write(data)
+            f.write(str(tape._tags))
+            for column in (tape.offsets, tape.sizes, tape.parents, tape.siblings):
+                f.write(column.tostring())
+        os.rename(tmppath, path)
+    except (IOError, OSError):
+        try:
+            os.unlink(tmppath)
+        except OSError:
+            pass
+        raise
+
+def _read_header(data, path):
+    if len(data) < _HEADER.size:
+        raise ValueError('%s is not a published library' % path)
+    magic, itemsize, revision, count, length = _HEADER.unpack_from(data)
+    if magic != _MAGIC or itemsize != _ITEMSIZE:
+        raise ValueError('%s is not a published library' % path)
+    return revision, count, length
+
+class SharedLibrary(object):
+    """
+    Read-only view of a library published with publish(), mapped into
+    memory so every process attached to the same file shares one copy.
+
+    Items are read through the tape index (see dacpy.tape): root is a
+    TapeNode for the response, which can be navigated like a Node, and
+    values are decoded straight from the mapping as they are read.
+
+    Example:
+        library = SharedLibrary('/dev/shm/dacpy-library')
+        for item in library.root.mlcl[0].mlit:
+            print item.minm
+        if library.stale():
+            library = library.reattach()
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self.revision, count, length = _read_header(self._map, path)
+            pos = _HEADER.size
+            data = _Region(self._map, pos, length)
+            pos += length
+            tags = _Region(self._map, pos, count * 4)
+            pos += count * 4
+            columns = []
+            for x in range(4):
+                columns.append(_Column(self._map, pos, count))
+                pos += count * _ITEMSIZE
+            if pos > len(self._map):
+                raise ValueError('%s is truncated' % path)
+        except Exception:
+            self._map.close()
+            raise
+        self.data = data
+        self.tape = Tape.from_columns(data, tags, *columns)
+
+    @property
+    def root(self):
+        return self.tape.view(0)
+
+    def current_revision(self):
+        """Returns the revision currently published at the path."""
+        with open(self.path, 'rb') as f:
+            return _read_header(f.read(_HEADER.size), self.path)[0]
+
+    def stale(self):
+        """Returns True if a newer revision has been published."""
+        try:
+            return self.current_revision() != self.revision
+        except (IOError, ValueError):
+            return False
+
+    def reattach(self):
+        """Attaches to the revision now published, and closes this one."""
+        library = SharedLibrary(self.path)
+        self.close()
+        return library
+
+    def close(self):
+        self._map.close()
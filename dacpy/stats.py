@@ -0,0 +1,121 @@
+# The MIT License
+#
+# Copyright (c) 2010 Ryan Bergstrom
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import threading
+import time
+
+import pairing
+import types
+
+__all__ = ['Recorder', 'enable', 'disable']
+
+def _label(value):
+    """Escapes a Prometheus label value."""
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+class Recorder(object):
+    """
+    Collects per-tag call counts, bytes and cumulative time for the encode
+    and decode paths (Node.deserialize, Node.serialize, build_node) and for
+    generate_code.
+
+    Times include nested calls, so the time recorded for a container tag
+    covers the time spent on its children as well.
+    """
+
+    clock = staticmethod(time.time)
+
+    def __init__(self):
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def record(self, operation, tag, size, start):
+        elapsed = self.clock() - start
+        key = (operation, tag)
+        with self._lock:
+            try:
+                stat = self._stats[key]
+            except KeyError:
+                stat = self._stats[key] = [0, 0, 0.0]
+            stat[0] += 1
+            stat[1] += size
+            stat[2] += elapsed
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+    def snapshot(self):
+        """
+        Returns the statistics as a dict:
+            {operation: {tag: {'count': n, 'bytes': n, 'seconds': f}}}
+        """
+        result = {}
+        with self._lock:
+            for (operation, tag), (count, size, seconds) in self._stats.iteritems():
+                result.setdefault(operation, {})[tag] = {
+                    'count': count,
+                    'bytes': size,
+                    'seconds': seconds,
+                }
+        return result
+
+    def prometheus(self, prefix='dacpy'):
+        """Returns the statistics in the Prometheus text exposition format."""
+        with self._lock:
+            stats = sorted(self._stats.items())
+        metrics = (
+            ('calls_total', 'Number of calls', 0),
+            ('bytes_total', 'Encoded bytes processed', 1),
+            ('seconds_total', 'Cumulative time spent, including nested calls', 2),
+        )
+        lines = []
+        for name, description, index in metrics:
+            name = '%s_%s' % (prefix, name)
+            lines.append('# HELP %s %s' % (name, description))
+            lines.append('# TYPE %s counter' % name)
+            for (operation, tag), values in stats:
+                value = values[index]
+                if isinstance(value, float):
+                    value = repr(value)
+                lines.append('%s{operation="%s",tag="%s"} %s' % (
+                    name, operation, _label(tag),
+                    value,
+                ))
+        return '\n'.join(lines) + '\n'
+
+def enable(recorder=None):
+    """
+    Starts recording statistics into the recorder (or a new Recorder), and
+    returns it. While disabled, the hooks cost a single None check per call.
+    """
+    if recorder is None:
+        recorder = Recorder()
+    types._probe = recorder
+    pairing._probe = recorder
+    return recorder
+
+def disable():
+    """Stops recording statistics."""
+    types._probe = None
+    pairing._probe = None
@@ -0,0 +1,104 @@
+# The MIT License
+#
+# Copyright (c) 2010 Ryan Bergstrom
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import itertools
+import threading
+
+from types import Container, Node, build_node
+
+__all__ = ['StatusBroadcaster']
+
+class StatusBroadcaster(object):
+    """
+    Serves playstatusupdate (cmst) responses to long-polling remotes.
+
+    Each published status is given the next revision number and serialized
+    once. Remotes that ask for the current revision wait until the next
+    status is published, at which point every waiter is called with the same
+    serialized buffer. Remotes asking for any other revision are answered
+    straight away with the current status.
+
+    Callbacks are called as callback(revision, data), in the thread that
+    calls wait() or publish().
+
+    Remotes ask for revision 1 on their first request, so revisions start
+    at 2 to make sure that request is answered straight away.
+    """
+
+    def __init__(self, status=(), revision=2):
+        self.revision = revision - 1
+        self.data = None
+        self._waiters = {}
+        self._tokens = itertools.count()
+        self._lock = threading.Lock()
+        self.publish(status)
+
+    def _serialize(self, revision, status):
+        if isinstance(status, Node):
+            children = [x for x in status.value if x.tag not in ('mstt', 'cmsr')]
+        else:
+            children = [build_node(x) for x in status if x[0] not in ('mstt', 'cmsr')]
+        return Node('cmst', Container([
+            build_node(('mstt', 200)),
+            build_node(('cmsr', revision)),
+        ] + children)).serialize()
+
+    def publish(self, status):
+        """
+        Sets the new player status, as (tag, value) tuples for build_node or
+        a cmst Node, and wakes all waiting remotes. Returns the new revision.
+        """
+        with self._lock:
+            revision = self.revision + 1
+            data = self._serialize(revision, status)
+            self.revision = revision
+            self.data = data
+            waiters, self._waiters = self._waiters, {}
+        for callback in waiters.itervalues():
+            callback(revision, data)
+        return revision
+
+    def wait(self, revision, callback):
+        """
+        Calls the callback with the first status newer than the revision. If
+        the revision is not the current one, this happens immediately.
+
+        Returns a token that can be passed to cancel(), or None if the
+        callback has already been called.
+        """
+        with self._lock:
+            if revision == self.revision:
+                token = self._tokens.next()
+                self._waiters[token] = callback
+                return token
+            current, data = self.revision, self.data
+        callback(current, data)
+        return None
+
+    def cancel(self, token):
+        """Stops waiting (e.g. when the remote disconnects)."""
+        with self._lock:
+            self._waiters.pop(token, None)
+
+    def __len__(self):
+        return len(self._waiters)
@@ -227,7 +227,38 @@ _TAG_DATA = (
     ('muty', 'dmap.updatetype', 'UByte'),
 )
 
+# Value type codes used by dmap.contentcodestype (mcty) in /content-codes
+CONTENT_TYPES = {
+    1: 'UByte',
+    2: 'Byte',
+    3: 'UShort',
+    4: 'Short',
+    5: 'UInt',
+    6: 'Int',
+    7: 'ULong',
+    8: 'Long',
+    9: 'String',
+    10: 'DateTime',
+    11: 'Version',
+    12: 'Container',
+}
+
 TAGS = dict([(v[0], (v[1], v[2])) for v in _TAG_DATA])
 PROPERTIES = dict([(v[1], (v[0], v[2])) for v in _TAG_DATA if v[1]])
 
-__all__ = ['TAGS', 'PROPERTIES']
+def register(tag, name, typename, override=False):
+    """
+    Adds a tag definition to TAGS (and PROPERTIES, if it has a name) so it is
+    used for encoding and decoding from then on.
+
+    Existing definitions are left alone unless override is True. Returns
+    True if the definition was added.
+    """
+    if tag in TAGS and not override:
+        return False
+    TAGS[tag] = (name, typename)
+    if name:
+        PROPERTIES[name] = (tag, typename)
+    return True
+
+__all__ = ['TAGS', 'PROPERTIES', 'CONTENT_TYPES', 'register']
@@ -0,0 +1,253 @@
+# The MIT License
+#
+# Copyright (c) 2010 Ryan Bergstrom
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+
+import struct
+
+from array import array
+
+from types import Container, Node, scan_nodes, tag_type
+
+__all__ = ['Tape', 'TapeNode']
+
+class Tape(object):
+    """
+    A flat index of every node in a DMAP buffer, built by reading only the
+    tag and length headers.
+
+    Nodes are numbered in document order, so the descendants of entry i are
+    the entries i+1 up to (but not including) the end of its subtree. For
+    each entry the tape stores the tag, the offset of its header, the length
+    of its data, the index of its parent and the index of its next sibling
+    (-1 where there is none), in arrays rather than per-node objects. Values
+    are only decoded when asked for.
+
+    A container whose data is not a sequence of complete nodes is indexed as
+    a leaf, since Node.deserialize would decode it as a String.
+
+    The buffer can be a str, bytearray, mmap or anything else struct can
+    read from.
+    """
+
+    def __init__(self, data, start=0, end=None):
+        if end is None:
+            end = len(data)
+        if not scan_nodes(data, start, end):
+            raise ValueError('Buffer is not a sequence of complete nodes')
+        self.data = data
+        self._tags = bytearray()
+        self.offsets = array('l')
+        self.sizes = array('l')
+        self.parents = array('l')
+        self.siblings = array('l')
+        self._scan(start, end)
+
+    @classmethod
+    def from_columns(cls, data, tags, offsets, sizes, parents, siblings):
+        """
+        Creates a tape from columns saved from another tape, without
+        scanning the buffer again. The tags are the packed 4-byte tags,
+        and the columns can be any sequences of integers.
+        """
+        tape = cls.__new__(cls)
+        tape.data = data
+        tape._tags = tags
+        tape.offsets = offsets
+        tape.sizes = sizes
+        tape.parents = parents
+        tape.siblings = siblings
+        return tape
+
+    def _scan(self, start, end):
+        data = self.data
+        unpack = struct.Struct('>4sl').unpack_from
+        stack = [[start, end, -1, -1]]
+        while stack:
+            frame = stack[-1]
+            pos, end, parent, previous = frame
+            if pos >= end:
+                stack.pop()
+                continue
+            tag, size = unpack(data, pos)
+            index = len(self.offsets)
+            self._tags.extend(tag)
+            self.offsets.append(pos)
+            self.sizes.append(size)
+            self.parents.append(parent)
+            self.siblings.append(-1)
+            if previous >= 0:
+                self.siblings[previous] = index
+            frame[0] = pos + 8 + size
+            frame[3] = index
+            if (tag_type(tag) is Container and
+                    scan_nodes(data, pos + 8, pos + 8 + size)):
+                stack.append([pos + 8, pos + 8 + size, index, -1])
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def tag(self, index):
+        return str(self._tags[index * 4:index * 4 + 4])
+
+    def parent(self, index):
+        return self.parents[index]
+
+    def next_sibling(self, index):
+        return self.siblings[index]
+
+    def first_child(self, index):
+        child = index + 1
+        if child < len(self.parents) and self.parents[child] == index:
+            return child
+        return -1
+
+    def roots(self):
+        """Returns the indexes of the top-level nodes in the buffer."""
+        return self.children(-1)
+
+    def children(self, index):
+        """Returns the indexes of the direct children of an entry."""
+        if index < 0:
+            child = 0 if len(self) else -1
+        else:
+            child = self.first_child(index)
+        result = []
+        while child >= 0:
+            result.append(child)
+            child = self.siblings[child]
+        return result
+
+    def child(self, index, tag):
+        """Returns the index of the first child with the given tag, or -1."""
+        child = self.first_child(index)
+        while child >= 0:
+            if self._tags[child * 4:child * 4 + 4] == tag:
+                return child
+            child = self.siblings[child]
+        return -1
+
+    def subtree_end(self, index):
+        """Returns the index just past the last descendant of an entry."""
+        while index >= 0:
+            if self.siblings[index] >= 0:
+                return self.siblings[index]
+            index = self.parents[index]
+        return len(self)
+
+    def find(self, tag, start=0, end=None):
+        """
+        Returns the indexes of all entries in [start, end) with the given
+        tag, e.g. find('mlit', i, tape.subtree_end(i)) for every item
+        below entry i.
+        """
+        if end is None:
+            end = len(self)
+        result = []
+        buf = self._tags
+        pos = buf.find(tag, start * 4, end * 4)
+        while pos >= 0:
+            if pos % 4 == 0:
+                result.append(pos // 4)
+                pos = buf.find(tag, pos + 4, end * 4)
+            else:
+                pos = buf.find(tag, pos + 1, end * 4)
+        return result
+
+    def count(self, tag, start=0, end=None):
+        """Returns the number of entries in [start, end) with the given tag."""
+        return len(self.find(tag, start, end))
+
+    def raw(self, index):
+        """Returns the serialized bytes of an entry, header included."""
+        offset = self.offsets[index]
+        return self.data[offset:offset + 8 + self.sizes[index]]
+
+    def value(self, index):
+        """
+        Decodes the value of an entry, as Node.deserialize would. Containers
+        are decoded along with all their descendants.
+        """
+        offset = self.offsets[index] + 8
+        bytes = self.data[offset:offset + self.sizes[index]]
+        return tag_type(self.tag(index)).deserialize(bytes)
+
+    def node(self, index):
+        """Decodes an entry and its descendants into a Node."""
+        return Node(self.tag(index), self.value(index))
+
+    def view(self, index):
+        return TapeNode(self, index)
+
+class TapeNode(object):
+    """
+    A lightweight, read-only view of a tape entry that can be navigated like
+    a Node. Child values are decoded only as they are looked up.
+    """
+
+    def __init__(self, tape, index):
+        self.tape = tape
+        self.index = index
+        self.tag = tape.tag(index)
+        self.length = tape.sizes[index] + 8
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        return iter([TapeNode(self.tape, x) for x in self.tape.children(self.index)])
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        tape = self.tape
+        children = tape.children(self.index)
+        if not children:
+            # An empty container has no such children, like a Node
+            if tape.sizes[self.index] == 0 and tag_type(self.tag) is Container:
+                return []
+            raise AttributeError(name)
+        vals = []
+        for x in children:
+            if tape._tags[x * 4:x * 4 + 4] != name:
+                continue
+            if tape.first_child(x) >= 0:
+                vals.append(TapeNode(tape, x))
+            else:
+                value = tape.value(x)
+                if isinstance(value, Container):
+                    vals.append(TapeNode(tape, x))
+                else:
+                    vals.append(value.value)
+        return vals
+
+    @property
+    def value(self):
+        return self.tape.value(self.index)
+
+    def node(self):
+        return self.tape.node(self.index)
+
+    def __eq__(self, other):
+        return self.node() == other
+
+    def __ne__(self, other):
+        return not self == other
@@ -20,6 +20,7 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
+import hashlib
 import struct
 import time
 
@@ -32,19 +33,63 @@ __all__ = [
     'Binary', 'Container', 'DateTime', 'MultiInt', 'MultiUInt', 'Node',
     'String', 'Version',
 
-    'UnknownTagError',
+    'DecodeLimitError', 'DecodeLimits', 'UnknownTagError',
 
-    'build_node'
+    'build_node', 'diff', 'dump', 'scan_nodes', 'tag_type'
 ]
 
+# Recorder for encode/decode statistics, set by dacpy.stats.enable()
+_probe = None
+
 class UnknownTagError(ValueError):
     pass
 
+class DecodeLimitError(ValueError):
+    """Raised when data being decoded goes over one of its DecodeLimits."""
+    pass
+
+class DecodeLimits(object):
+    """
+    Budgets for Node.deserialize, for decoding data from untrusted peers.
+    Any limit left as None is not checked.
+
+        max_bytes: size of the whole serialized tree
+        max_depth: levels of nested nodes (a lone leaf node has depth 1)
+        max_children: nodes in a single Container
+        max_string: size of a string or binary value, including a
+            Container that falls back to being parsed as a String
+
+    Each limit is checked from the tag headers before the data it covers
+    is copied or decoded, and raises DecodeLimitError.
+    """
+
+    def __init__(self, max_bytes=None, max_depth=None, max_children=None,
+                 max_string=None):
+        self.max_bytes = max_bytes
+        self.max_depth = max_depth
+        self.max_children = max_children
+        self.max_string = max_string
+
 class DAAPType(object):
     """Abstract class to provide utility methods for all DAAP value types."""
 
     value = None
     length = 0
+    # Node holding this value, told when the value is changed in place
+    _owner = None
+
+    def __setattr__(self, name, value):
+        self.__dict__[name] = value
+        if self._owner is not None:
+            self._owner.touch()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('_owner', None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
 
     def __eq__(self, other):
         try:
@@ -98,10 +143,11 @@ class Numeric(DAAPType):
 
     def __init__(self, value):
         try:
-            self.value = int(value)
+            value = int(value)
         except Exception:
             raise TypeError('%s requires a numeric value' % self.__class__.__name__)
-        if self.value < self.min_value or self.value > self.max_value:
+        self.__dict__['value'] = value
+        if value < self.min_value or value > self.max_value:
             raise ValueError('%s requires %d <= value <= %d' % (
                 self.__class__.__name__, self.min_value, self.max_value
             ))
@@ -179,8 +225,9 @@ class MultiNumeric(DAAPType):
     _base_type = None
 
     def __init__(self, value):
-        self.value = tuple([self._base_type(x) for x in value])
-        self.length = len(value) * self._base_type.length
+        attrs = self.__dict__
+        attrs['value'] = tuple([self._base_type(x) for x in value])
+        attrs['length'] = len(value) * self._base_type.length
 
     def serialize(self):
         return ''.join([x.serialize() for x in self.value])
@@ -219,8 +266,9 @@ class DateTime(DAAPType):
     """Datetime type serialized to a standard UNIX timestamp."""
 
     def __init__(self, value):
-        self.value = value
-        self.length = 4
+        attrs = self.__dict__
+        attrs['value'] = value
+        attrs['length'] = 4
 
     def serialize(self):
         if self.value is None:
@@ -243,8 +291,9 @@ class Version(DAAPType):
         Version((3, 0, 1, 2)) = '\x00\x03\x00\x01'
     """
     def __init__(self, value):
-        self.value = value
-        self.length = 4
+        attrs = self.__dict__
+        attrs['value'] = value
+        attrs['length'] = 4
 
     def serialize(self):
         val = (self.value[1], self.value[0], self.value[3], self.value[2])
@@ -267,12 +316,12 @@ class String(DAAPType):
     Serialized as a byte string with no length bytes or null terminator.
     """
     def __init__(self, value, codec='utf-8'):
-        self.codec = codec
-        if isinstance(value, unicode):
-            self.value = value
-        else:
-            self.value = unicode(value, codec)
-        self.length = len(self.serialize())
+        attrs = self.__dict__
+        attrs['codec'] = codec
+        if not isinstance(value, unicode):
+            value = unicode(value, codec)
+        attrs['value'] = value
+        attrs['length'] = len(value.encode(codec))
 
     def serialize(self):
         return self.value.encode(self.codec)
@@ -293,8 +342,9 @@ class Binary(DAAPType):
     at any point, if the actual type becomes known.
     """
     def __init__(self, value):
-        self.value = value
-        self.length = len(self.value)
+        attrs = self.__dict__
+        attrs['value'] = value
+        attrs['length'] = len(value)
 
     def serialize(self):
         return self.value
@@ -306,6 +356,31 @@ class Binary(DAAPType):
     def pprint(self):
         return repr(self.value)
 
+class _NodeList(list):
+    """
+    List of the Nodes in a decoded (or hashed) Container, which tells the
+    Node holding the Container when it is changed in place.
+    """
+    _owner = None
+
+    def __reduce__(self):
+        return (list, (list(self),))
+
+def _modifies(method):
+    def wrapper(self, *args, **kwargs):
+        result = method(self, *args, **kwargs)
+        if self._owner is not None:
+            self._owner.touch()
+        return result
+    wrapper.__name__ = method.__name__
+    return wrapper
+
+for _name in ('__setitem__', '__delitem__', '__setslice__', '__delslice__',
+              '__iadd__', '__imul__', 'append', 'extend', 'insert', 'pop',
+              'remove', 'reverse', 'sort'):
+    setattr(_NodeList, _name, _modifies(getattr(list, _name)))
+del _name
+
 class Container(DAAPType):
     """
     A value that holds either a list of Nodes, or a single String.
@@ -321,11 +396,12 @@ class Container(DAAPType):
     """
 
     def __init__(self, value):
-        self.value = value
-        if isinstance(self.value, String):
-            self.length = len(self.value)
+        attrs = self.__dict__
+        attrs['value'] = value
+        if isinstance(value, String):
+            attrs['length'] = len(value)
         else:
-            self.length = sum([len(x) for x in self.value])
+            attrs['length'] = sum([len(x) for x in value])
 
     def serialize(self):
         if isinstance(self.value, String):
@@ -334,24 +410,57 @@ class Container(DAAPType):
             return ''.join([x.serialize() for x in self.value])
 
     @classmethod
-    def deserialize(cls, bytes):
+    def deserialize(cls, bytes, limits=None, depth=0):
+        """
+        Decodes the child Nodes of a Container. Optional DecodeLimits are
+        checked for the children, which are at depth + 1.
+        """
         pos = 0
+        end = len(bytes)
         values = []
-        while pos < len(bytes):
+        view = type(bytes) in (str, buffer)
+        max_children = None
+        if limits is not None:
+            max_children = limits.max_children
+        while pos < end:
+            # Slice out only this child, not the whole remainder, so long
+            # listings decode in linear time.
+            size = -1
+            if end - pos >= 8:
+                size = struct.unpack_from('>l', bytes, pos + 4)[0]
+            if size < 0 or pos + 8 + size > end:
+                return cls._fallback(bytes, pos, limits)
+            if max_children is not None and len(values) >= max_children:
+                raise DecodeLimitError('Container holds more than %d nodes' % max_children)
+            if view:
+                child = buffer(bytes, pos, 8 + size)
+            else:
+                child = bytes[pos:pos + 8 + size]
             try:
-                val = Node.deserialize(bytes[pos:])
+                if limits is None:
+                    val = Node.deserialize(child)
+                else:
+                    val = Node.deserialize(child, limits, depth + 1)
+            except DecodeLimitError:
+                raise
             except ValueError:
-                return cls(String.deserialize(bytes[pos:]))
-            pos += len(val)
+                return cls._fallback(bytes, pos, limits)
+            pos += 8 + size
             values.append(val)
-        return cls(values)
+        return cls(_NodeList(values))
+
+    @classmethod
+    def _fallback(cls, bytes, pos, limits):
+        # Data that doesn't parse as Nodes is kept as a String
+        if limits is not None:
+            _check_string(limits, 'Container', len(bytes) - pos)
+        return cls(String.deserialize(bytes[pos:]))
 
     def pprint(self, depth=0):
-        sep = (' ' * depth * 4)
-        if isinstance(self.value, String):
-            return sep + unicode(self.value) + '\n'
-        else:
-            return unicode(sep + sep.join([x.pprint(depth) for x in self.value]))
+        from StringIO import StringIO
+        out = StringIO()
+        _dump_container(out.write, self, depth, None)
+        return unicode(out.getvalue())
 
     def __iter__(self):
         return self.value.__iter__()
@@ -379,13 +488,121 @@ class Node(DAAPType):
     
     Example:
         Node('musr', 65535) = 'musr\x00\x00\x00\x04\x00\x00\xff\xff'
+
+    A Node decoded from a string remembers the bytes it was decoded from,
+    and serializes by copying them until it or one of its descendants is
+    changed. Assigning a Node's tag or value, changing a value in place
+    (e.g. node.value.value = u'Foo') or changing the list of a decoded
+    Container is noticed automatically; touch() marks a node as changed
+    by hand.
+
+    digest() hashes a tree from the digests of its subtrees and caches the
+    result on every node, so after a change only the nodes on the path to
+    the root are hashed again.
     """
+
+    # View of the original bytes, or None once the node has been changed
+    _raw = None
+    # Cached result of digest(), or None once the node has been changed
+    _digest = None
+    # Node this one was decoded inside of
+    _parent = None
+
     def __init__(self, tag, value):
-        self.tag = tag
-        self.value = value
-        self.length = self.value.length + 8
+        attrs = self.__dict__
+        attrs['tag'] = tag
+        attrs['value'] = value
+        attrs['length'] = value.length + 8
+
+    def __setattr__(self, name, value):
+        self.__dict__[name] = value
+        if name == 'tag' or name == 'value':
+            if name == 'value' and isinstance(value, DAAPType):
+                value.__dict__['_owner'] = self
+            self.touch()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('_raw', None)
+        state.pop('_parent', None)
+        state.pop('_digest', None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
+    def touch(self):
+        """
+        Marks the node (and so every node it was decoded or hashed inside
+        of) as changed, so it is re-encoded rather than copied when
+        serialized, and hashed again by digest().
+        """
+        node = self
+        while node is not None and (node._raw is not None or node._digest is not None):
+            attrs = node.__dict__
+            attrs['_raw'] = None
+            attrs['_digest'] = None
+            node = node._parent
+
+    def digest(self):
+        """
+        Returns a SHA-1 digest of the node's content. A leaf is hashed from
+        its serialized bytes, a Container node from its tag and the digests
+        of its children, so equal trees have equal digests however they
+        were built. Children hashed here are linked to this node, and the
+        list of a built Container is replaced by a copy that notices
+        changes, so changing them resets the cached digests up to the root;
+        a Node shared by several trees only resets the one it was last
+        hashed in (or the one it was decoded in, while unchanged).
+        """
+        digest = self._digest
+        if digest is not None:
+            return digest
+        # Hash bottom-up without recursing, so deep trees are fine too
+        stack = [self]
+        while stack:
+            node = stack[-1]
+            children = _children(node)
+            if children is None:
+                value = node.value
+                if value._owner is None:
+                    value.__dict__['_owner'] = node
+                node.__dict__['_digest'] = hashlib.sha1(node.serialize()).digest()
+                stack.pop()
+                continue
+            pending = [x for x in children if x._digest is None]
+            if pending:
+                stack.extend(reversed(pending))
+                continue
+            container = node.value
+            if container._owner is None:
+                container.__dict__['_owner'] = node
+            if not isinstance(children, _NodeList):
+                # Track in-place edits of built trees too
+                children = container.__dict__['value'] = _NodeList(children)
+            if children._owner is None:
+                children._owner = node
+            for child in children:
+                # Decoded children stay linked to the node they were
+                # decoded in, whose bytes they are a view of
+                if child._parent is not node and child._raw is None:
+                    child.__dict__['_parent'] = node
+            hasher = hashlib.sha1('\x01' + node.tag)
+            for child in children:
+                hasher.update(child._digest)
+            node.__dict__['_digest'] = hasher.digest()
+            stack.pop()
+        return self._digest
+
+    def etag(self):
+        """Returns the node's digest as a quoted HTTP entity tag."""
+        return '"%s"' % self.digest().encode('hex')
 
     def __getattr__(self, name):
+        # Tags are never dunder names; leave those to the normal protocols
+        # (pickle and copy look up e.g. __getstate__ on instances).
+        if name.startswith('__'):
+            raise AttributeError(name)
         if isinstance(self.value, Container):
             try:
                 vals = []
@@ -416,44 +633,146 @@ class Node(DAAPType):
         return u'<%s value="%s">' % (self.tag, unicode(self.value))
 
     def serialize(self):
+        probe = _probe
+        if probe is not None:
+            start = probe.clock()
+        raw = self._raw
+        if raw is not None:
+            data = str(raw)
+            if probe is not None:
+                probe.record('serialize', self.tag, len(data), start)
+            return data
         data = self.value.serialize()
+        if probe is not None:
+            probe.record('serialize', self.tag, len(data) + 8, start)
         return struct.pack('>4sl', self.tag, len(data)) + data
 
     @classmethod
-    def deserialize(cls, bytes):
+    def deserialize(cls, bytes, limits=None, depth=1):
+        """
+        Decodes a Node tree. If limits (DecodeLimits) are given, data that
+        goes over them raises DecodeLimitError; depth is that of this node.
+        """
+        probe = _probe
+        if probe is not None:
+            start = probe.clock()
         if (len(bytes)) < 8:
             raise ValueError('Not enough data to read tag header')
         (tag, size) = struct.unpack_from('>4sl', bytes)
-        data = bytes[8 : 8 + size]
+        tagtype = tag_type(tag)
+        if limits is not None:
+            _check_limits(limits, tag, tagtype, size, depth, len(bytes))
+
+        # Only keep views of immutable strings, so the original bytes can
+        # be copied back out when serializing
+        passthrough = type(bytes) in (str, buffer) and size >= 0
+        if passthrough and tagtype is Container:
+            data = buffer(bytes, 8, size)
+        else:
+            data = bytes[8 : 8 + size]
         if len(data) != size:
             raise ValueError('Not enough data to deserialize \'%s\' (%d/%d bytes)' % (tag, len(data), size))
-        try:
-            tagtype = globals()[tags.TAGS[tag][1]]
-        except KeyError:
-            tagtype = Binary
 
-        data = tagtype.deserialize(data)
-        return cls(tag, data)
+        if limits is not None and tagtype is Container:
+            data = Container.deserialize(data, limits, depth)
+        else:
+            data = tagtype.deserialize(data)
+        if probe is not None:
+            probe.record('deserialize', tag, size + 8, start)
+        node = cls(tag, data)
+        if passthrough:
+            node.__dict__['_raw'] = buffer(bytes, 0, size + 8)
+            data.__dict__['_owner'] = node
+            if tagtype is Container:
+                if isinstance(data.value, String):
+                    data.value.__dict__['_owner'] = node
+                elif isinstance(data.value, _NodeList):
+                    data.value._owner = node
+                    for child in data.value:
+                        child.__dict__['_parent'] = node
+        return node
 
     def pprint(self, depth=0):
         from StringIO import StringIO
-        try:
-            tagdesc = tags.TAGS[self.tag][0]
-            if tagdesc:
-                tagname = u'%s (%s)' % (self.tag, tagdesc)
-            else:
-                tagname = self.tag
-        except KeyError:
-            tagname = self.tag
         out = StringIO()
-
-        if isinstance(self.value, Container):
-            depth += 1
-            out.write(u'%s --+\n%s' % (tagname, self.value.pprint(depth)))
-        else:
-            out.write(u'%s = %s\n' % (tagname, self.value.pprint()))
+        _dump_node(out.write, self, depth, None, u'')
         return unicode(out.getvalue())
 
+def _check_limits(limits, tag, tagtype, size, depth, available):
+    if limits.max_bytes is not None:
+        if depth == 1 and available > limits.max_bytes:
+            raise DecodeLimitError('%d bytes of data (limit %d)' % (available, limits.max_bytes))
+        if size > limits.max_bytes - 8:
+            raise DecodeLimitError('\'%s\' declares %d bytes (limit %d)' % (
+                tag, size, limits.max_bytes))
+    if limits.max_depth is not None and depth > limits.max_depth:
+        raise DecodeLimitError('\'%s\' is nested %d deep (limit %d)' % (
+            tag, depth, limits.max_depth))
+    if tagtype is String or tagtype is Binary:
+        _check_string(limits, '\'%s\'' % tag, size)
+
+def _check_string(limits, name, size):
+    if limits.max_string is not None and size > limits.max_string:
+        raise DecodeLimitError('%s holds a %d byte string (limit %d)' % (
+            name, size, limits.max_string))
+
+def _children(node):
+    """Returns the list of child Nodes of a Container node, or None."""
+    container = node.value
+    if isinstance(container, Container) and not isinstance(container.value, String):
+        return container.value
+    return None
+
+def diff(old, new, path=()):
+    """
+    Yields (path, old_node, new_node) for each subtree that differs between
+    two Node trees, where path is the tuple of child indexes leading to it.
+    Subtrees with equal digests are skipped without being walked, and
+    children are compared by position; a child missing on one side is
+    given as None.
+
+    Example:
+        for path, before, after in diff(old_response, new_response):
+            print path, before and before.tag, after and after.tag
+    """
+    if old is not None and new is not None:
+        if old.digest() == new.digest():
+            return
+        before, after = _children(old), _children(new)
+        if old.tag == new.tag and before is not None and after is not None:
+            for index in range(max(len(before), len(after))):
+                child_old = index < len(before) and before[index] or None
+                child_new = index < len(after) and after[index] or None
+                for change in diff(child_old, child_new, path + (index,)):
+                    yield change
+            return
+    yield path, old, new
+
+def tag_type(tag):
+    """Returns the DAAPType subclass for a tag, or Binary if it is unknown."""
+    try:
+        return globals()[tags.TAGS[tag][1]]
+    except KeyError:
+        return Binary
+
+def scan_nodes(data, start, end, offsets=None):
+    """
+    Returns whether data[start:end] is a sequence of complete nodes, reading
+    only their headers (if not, Node.deserialize would decode it as a
+    String). The offset of each node is appended to offsets, if given.
+    """
+    pos = start
+    while pos < end:
+        if pos + 8 > end:
+            return False
+        size = struct.unpack_from('>l', data, pos + 4)[0]
+        if size < 0 or pos + 8 + size > end:
+            return False
+        if offsets is not None:
+            offsets.append(pos)
+        pos += 8 + size
+    return True
+
 def build_node(pair):
     """
     Shortcut method to build a DACP Node tree from (tag, value) tuples.
@@ -477,6 +796,10 @@ def build_node(pair):
 
     tag, value = pair
 
+    probe = _probe
+    if probe is not None:
+        start = probe.clock()
+
     if callable(value):
         value = value()
 
@@ -490,7 +813,131 @@ def build_node(pair):
             else:
                 value = String(value)
 
-        return Node(tag, tagtype(value))
+        node = Node(tag, tagtype(value))
     except KeyError:
         raise UnknownTagError(tag)
 
+    if probe is not None:
+        probe.record('build_node', tag, node.length, start)
+    return node
+
+
+def _tagname(tag):
+    try:
+        tagdesc = tags.TAGS[tag][0]
+    except KeyError:
+        tagdesc = None
+    if tagdesc:
+        return u'%s (%s)' % (tag, tagdesc)
+    return unicode(tag, 'latin-1')
+
+def _elided(depth, size):
+    return u'%s... (%d bytes)\n' % (u'    ' * depth, size)
+
+def _dump_node(write, node, depth, max_depth, indent):
+    if not isinstance(node.value, Container):
+        write(u'%s%s = %s\n' % (indent, _tagname(node.tag), node.value.pprint()))
+        return
+    write(u'%s%s --+\n' % (indent, _tagname(node.tag)))
+    _dump_container(write, node.value, depth + 1, max_depth)
+
+def _dump_container(write, container, depth, max_depth):
+    # Walks the tree with a stack of iterators rather than recursion, so
+    # the output is written as it goes, in one pass
+    stack = [(iter([container]), depth - 1)]
+    while stack:
+        try:
+            value = next(stack[-1][0])
+        except StopIteration:
+            stack.pop()
+            continue
+        depth = stack[-1][1] + 1
+        indent = u'    ' * depth
+        if isinstance(value, Node):
+            if not isinstance(value.value, Container):
+                write(u'%s%s = %s\n' % (indent, _tagname(value.tag), value.value.pprint()))
+                continue
+            write(u'%s%s --+\n' % (indent, _tagname(value.tag)))
+            value = value.value
+            depth += 1
+            indent = u'    ' * depth
+        if isinstance(value.value, String):
+            write(u'%s%s\n' % (indent, unicode(value.value)))
+        elif max_depth is not None and depth > max_depth:
+            if value.length:
+                write(_elided(depth, value.length))
+        else:
+            stack.append((iter(value.value), depth - 1))
+
+def _dump_buffer(write, data, max_depth):
+    unpack = struct.Struct('>4sl').unpack_from
+    stack = [[0, len(data), 0]]
+    while stack:
+        frame = stack[-1]
+        pos, end, depth = frame
+        if pos >= end:
+            stack.pop()
+            continue
+        indent = u'    ' * depth
+        if end - pos < 8:
+            size = -1
+        else:
+            tag, size = unpack(data, pos)
+        if size < 0 or pos + 8 + size > end:
+            write(u'%s<%d bytes not parsed>\n' % (indent, end - pos))
+            stack.pop()
+            continue
+        frame[0] = pos + 8 + size
+        tagtype = tag_type(tag)
+
+        if tagtype is not Container:
+            try:
+                value = tagtype.deserialize(data[pos + 8:pos + 8 + size])
+            except (ValueError, struct.error):
+                value = Binary(data[pos + 8:pos + 8 + size])
+            write(u'%s%s = %s\n' % (indent, _tagname(tag), value.pprint()))
+            continue
+
+        write(u'%s%s --+\n' % (indent, _tagname(tag)))
+        child = pos + 8
+        while child < pos + 8 + size:
+            if pos + 8 + size - child < 8:
+                break
+            length = struct.unpack_from('>l', data, child + 4)[0]
+            if length < 0 or child + 8 + length > pos + 8 + size:
+                break
+            child += 8 + length
+        if child != pos + 8 + size:
+            # Not a list of nodes, so decode it as Node.deserialize would
+            try:
+                node = Node.deserialize(data[pos:pos + 8 + size])
+                _dump_container(write, node.value, depth + 1, max_depth)
+            except (ValueError, struct.error):
+                write(u'%s%s\n' % (u'    ' * (depth + 1), Binary(data[pos + 8:pos + 8 + size]).pprint()))
+        elif max_depth is not None and depth + 1 > max_depth:
+            if size:
+                write(_elided(depth + 1, size))
+        else:
+            stack.append([pos + 8, pos + 8 + size, depth + 1])
+
+def dump(node, fileobj, max_depth=None, encoding='utf-8'):
+    """
+    Writes the pprint() form of a Node, or of a serialized DMAP buffer (str,
+    buffer, bytearray or mmap), to a file as it goes.
+
+    Containers more than max_depth levels below the top are summarized by
+    their size. Buffers are decoded one value at a time; values that cannot
+    be decoded are shown as raw bytes, and bytes that do not form complete
+    nodes are skipped with a note, so damaged captures can still be read.
+
+    The output is encoded with the given encoding, or written as unicode if
+    encoding is None.
+    """
+    if encoding is None:
+        write = fileobj.write
+    else:
+        write = lambda text: fileobj.write(text.encode(encoding))
+    if isinstance(node, Node):
+        _dump_node(write, node, 0, max_depth, u'')
+    else:
+        _dump_buffer(write, node, max_depth)
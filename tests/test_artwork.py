@@ -0,0 +1,110 @@
+# coding: utf8
+
+# The MIT License
+#
+# Copyright (c) 2010 Ryan Bergstrom
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from nose import tools
+
+from dacpy.artwork import ArtworkCache
+
+class TestArtworkCache:
+    def setup(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = ArtworkCache(100, self.directory)
+        self.loads = []
+
+    def teardown(self):
+        shutil.rmtree(self.directory)
+
+    def loader(self, key, size=40):
+        def load():
+            self.loads.append(key)
+            return ('%d' % key) * size, 'image/png'
+        return load
+
+    def test_hit(self):
+        data, etag, content_type = self.cache.get(1, self.loader(1))
+        tools.assert_equals(data, '1' * 40)
+        tools.assert_equals(content_type, 'image/png')
+        tools.assert_equals(self.cache.get(1, self.loader(1)), (data, etag, content_type))
+        tools.assert_equals(self.loads, [1])
+
+    def test_eviction_and_spill(self):
+        for key in range(1, 5):
+            self.cache.get(key, self.loader(key))
+        tools.assert_true(self.cache.size <= 100)
+        tools.assert_false(1 in self.cache)
+        tools.assert_true(4 in self.cache)
+
+        data, etag, content_type = self.cache.get(1, self.loader(1))
+        tools.assert_equals(data, '1' * 40)
+        tools.assert_equals(self.loads, [1, 2, 3, 4])
+
+    def test_disk_eviction(self):
+        cache = ArtworkCache(50, self.directory, max_disk_bytes=200)
+        for key in range(1, 7):
+            cache.get(key, self.loader(key))
+        tools.assert_true(cache.disk_size <= 200)
+        tools.assert_equals(len(os.listdir(self.directory)), 2)
+        cache.get(1, self.loader(1))
+        tools.assert_equals(self.loads, [1, 2, 3, 4, 5, 6, 1])
+
+        cache = ArtworkCache(50, self.directory, max_disk_bytes=100)
+        tools.assert_equals(len(os.listdir(self.directory)), 1)
+        tools.assert_true(cache.disk_size <= 100)
+
+    def test_memory_only(self):
+        cache = ArtworkCache(50)
+        cache.get(1, self.loader(1))
+        cache.get(2, self.loader(2))
+        cache.get(1, self.loader(1))
+        tools.assert_equals(self.loads, [1, 2, 1])
+
+    def test_respond(self):
+        status, headers, body = self.cache.respond(1, self.loader(1))
+        tools.assert_equals(status, 200)
+        tools.assert_equals(headers['Content-Type'], 'image/png')
+        status, headers, body = self.cache.respond(1, self.loader(1), headers['ETag'])
+        tools.assert_equals((status, body), (304, ''))
+        tools.assert_equals(self.cache.respond(2, lambda: None), (204, {}, ''))
+
+    def test_coalescing(self):
+        def slow():
+            time.sleep(0.1)
+            self.loads.append(5)
+            return 'data', 'image/jpeg'
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.cache.get(5, slow)))
+                   for i in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        tools.assert_equals(self.loads, [5])
+        tools.assert_equals(len(results), 10)
+        tools.assert_equals(len(set(results)), 1)
@@ -0,0 +1,170 @@
+# coding: utf8
+
+# The MIT License
+#
+# Copyright (c) 2010 Ryan Bergstrom
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import socket
+import threading
+import time
+import urlparse
+
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+from nose import tools
+
+from dacpy.client import *
+from dacpy.types import DecodeLimitError, DecodeLimits, build_node
+
+class StubServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        self.server.connections += 1
+
+    def respond(self, node, status=200):
+        body = node and build_node(node).serialize() or ''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/x-dmap-tagged')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse.urlparse(self.path)
+        params = dict(urlparse.parse_qsl(url.query))
+        self.server.paths.append(self.path)
+
+        if url.path == '/login':
+            self.server.session += 1
+            self.respond(('mlog', [('mstt', 200), ('mlid', self.server.session)]))
+        elif params.get('session-id') != str(self.server.session):
+            self.respond(None, 403)
+        elif url.path == '/ctrl-int/1/getproperty':
+            self.respond(('cmgt', [('mstt', 200), ('cmvo', 42)]))
+        elif url.path == '/databases':
+            self.respond(('avdb', [('mlcl', [('mlit', [('minm', 'x' * 100)])])]))
+        elif url.path == '/ctrl-int/1/nextitem':
+            # Reads the request but never answers it
+            self.server.release.wait(5)
+            self.close_connection = 1
+            return
+        elif url.path == '/ctrl-int/1/setproperty':
+            self.server.properties.append(params)
+            self.respond(None, 204)
+        elif url.path == '/ctrl-int/1/playpause':
+            self.respond(None, 204)
+        else:
+            self.respond(('mstt', 200))
+
+        if self.server.drop_connections:
+            self.close_connection = 1
+
+    def log_message(self, *args):
+        pass
+
+class TestClient:
+    def setup(self):
+        self.server = StubServer(('127.0.0.1', 0), StubHandler)
+        self.server.connections = 0
+        self.server.session = 0
+        self.server.paths = []
+        self.server.drop_connections = False
+        self.server.release = threading.Event()
+        self.server.properties = []
+        thread = threading.Thread(target=self.server.serve_forever, args=(0.05,))
+        thread.daemon = True
+        thread.start()
+        self.client = DACPClient('127.0.0.1', self.server.server_address[1])
+
+    def teardown(self):
+        self.server.release.set()
+        self.client.pool.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_keep_alive(self):
+        tools.assert_equals(self.client.login(0x1234), 1)
+        tools.assert_equals(self.client.getproperty('dmcp.volume').cmvo[0], 42)
+        tools.assert_equals(self.client.ctrl_int('playpause'), None)
+        tools.assert_equals(self.server.connections, 1)
+        tools.assert_equals(self.server.paths[0], '/login?pairing-guid=0x0000000000001234')
+        tools.assert_equals(self.server.paths[1], '/ctrl-int/1/getproperty?properties=dmcp.volume&session-id=1')
+
+    def test_pipeline(self):
+        self.client.login()
+        tools.assert_true(self.client.pool.supports_pipelining('127.0.0.1', self.server.server_address[1]))
+        results = self.client.pipeline([
+            ('/ctrl-int/1/getproperty', [('properties', 'dmcp.volume')]),
+            ('/ctrl-int/1/playpause', None),
+            ('/server-info', None),
+        ])
+        tools.assert_equals(results[0].cmvo[0], 42)
+        tools.assert_equals(results[1], None)
+        tools.assert_equals(results[2].tag, 'mstt')
+        tools.assert_equals(self.server.connections, 1)
+
+    def test_stale_connection(self):
+        self.server.drop_connections = True
+        self.client.login()
+        tools.assert_equals(self.client.getproperty('dmcp.volume').cmvo[0], 42)
+        tools.assert_equals(self.server.connections, 2)
+
+    def test_timeout_not_retried(self):
+        self.client.login()
+        start = time.time()
+        tools.assert_raises(socket.timeout, self.client.ctrl_int, 'nextitem', None, 0.3)
+        tools.assert_true(time.time() - start < 0.6)
+        time.sleep(0.2)
+        tools.assert_equals(len([x for x in self.server.paths if 'nextitem' in x]), 1)
+
+    def test_setproperty(self):
+        self.client.login()
+        tools.assert_equals(self.client.setproperty({'dmcp.volume': 50}), None)
+        self.client.setproperty([('dacp.playingtime', 1000), ('dmcp.volume', 20)])
+        tools.assert_equals(self.server.properties[0], {'dmcp.volume': '50', 'session-id': '1'})
+        tools.assert_equals(self.server.paths[-1],
+                            '/ctrl-int/1/setproperty?dacp.playingtime=1000&dmcp.volume=20&session-id=1')
+
+    def test_session_expiry(self):
+        self.client.login(0x1234)
+        self.server.session += 1
+        tools.assert_equals(self.client.getproperty('dmcp.volume').cmvo[0], 42)
+        tools.assert_equals(self.client.session_id, 3)
+
+    def test_limits(self):
+        self.client.login()
+        tools.assert_equals(self.client.databases().mlcl[0].mlit[0].minm[0], 'x' * 100)
+        self.client.limits = DecodeLimits(max_string=64)
+        tools.assert_raises(DecodeLimitError, self.client.databases)
+        tools.assert_equals(self.client.getproperty('dmcp.volume').cmvo[0], 42)
+
+    def test_error(self):
+        try:
+            self.client.ctrl_int('playpause')
+        except HTTPError, e:
+            tools.assert_equals(e.status, 403)
+        else:
+            raise AssertionError('HTTPError not raised')
@@ -0,0 +1,88 @@
+# coding: utf8
+
+# The MIT License
+#
+# Copyright (c) 2010 Ryan Bergstrom
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import threading
+
+from nose import tools
+
+from dacpy.coalesce import Coalescer
+
+class TestCoalescer:
+    def setup(self):
+        self.sent = []
+        self.volume = 0
+        self.coalescer = Coalescer(self.send, 0.2)
+
+    def send(self, params):
+        self.sent.append(params)
+        if 'dmcp.volume' in params:
+            self.volume = params['dmcp.volume']
+        if params.get('dmcp.volume') == 'bad':
+            raise ValueError('bad volume')
+        return self.volume
+
+    def test_burst(self):
+        tools.assert_equals(self.coalescer.apply({'dmcp.volume': 1}), 1)
+
+        results = []
+        done = threading.Event()
+        def callback(result, error):
+            results.append((result, error))
+            if len(results) == 3:
+                done.set()
+        for volume in (2, 3):
+            self.coalescer.submit({'dmcp.volume': volume}, callback)
+        self.coalescer.submit({'dacp.playingtime': 5000, 'dmcp.volume': 4}, callback)
+        tools.assert_equals(len(self.sent), 1)
+        done.wait(5)
+
+        tools.assert_equals(self.sent, [
+            {'dmcp.volume': 1},
+            {'dmcp.volume': 4, 'dacp.playingtime': 5000},
+        ])
+        tools.assert_equals(results, [(4, None)] * 3)
+        tools.assert_equals(self.coalescer.sent, 2)
+        tools.assert_equals(self.coalescer.coalesced, 2)
+
+    def test_after(self):
+        order = []
+        self.coalescer.after(lambda: order.append('idle'))
+        tools.assert_equals(order, ['idle'])
+
+        self.coalescer.apply({'dmcp.volume': 1})
+        done = threading.Event()
+        self.coalescer.submit({'dmcp.volume': 2}, lambda result, error: order.append(result))
+        self.coalescer.after(lambda: (order.append(self.volume), done.set()))
+        done.wait(5)
+        tools.assert_equals(order, ['idle', 2, 2])
+
+    def test_error(self):
+        tools.assert_raises(ValueError, self.coalescer.apply, {'dmcp.volume': 'bad'})
+        self.coalescer.window = 0
+        tools.assert_equals(self.coalescer.apply({'dmcp.volume': 3}), 3)
+
+    def test_coalescable(self):
+        tools.assert_true(self.coalescer.coalescable({'dmcp.volume': 1}))
+        tools.assert_false(self.coalescer.coalescable({'dmcp.volume': 1, 'dacp.shufflestate': 1}))
+        tools.assert_false(self.coalescer.coalescable({}))
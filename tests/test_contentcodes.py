@@ -0,0 +1,98 @@
+# coding: utf8
+
+# The MIT License
+#
+# Copyright (c) 2010 Ryan Bergstrom
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import shutil
+import struct
+import tempfile
+
+from nose import tools
+
+from dacpy import tags
+from dacpy.contentcodes import *
+from dacpy.types import *
+
+def make_content_codes():
+    return build_node(('mccr', [
+        ('mstt', 200),
+        ('mdcl', [
+            ('mcnm', struct.unpack('>L', 'xxzz')[0]),
+            ('mcna', 'com.example.test-string'),
+            ('mcty', 9),
+        ]),
+        ('mdcl', [
+            ('mcnm', struct.unpack('>L', 'xxzy')[0]),
+            ('mcna', 'com.example.test-short'),
+            ('mcty', 3),
+        ]),
+        ('mdcl', [
+            ('mcnm', struct.unpack('>L', 'minm')[0]),
+            ('mcna', 'dmap.itemname'),
+            ('mcty', 12),
+        ]),
+    ]))
+
+class TestContentCodes:
+    def setup(self):
+        self.tags = dict(tags.TAGS)
+        self.properties = dict(tags.PROPERTIES)
+        self.directory = tempfile.mkdtemp()
+
+    def teardown(self):
+        tags.TAGS.clear()
+        tags.TAGS.update(self.tags)
+        tags.PROPERTIES.clear()
+        tags.PROPERTIES.update(self.properties)
+        shutil.rmtree(self.directory)
+
+    def test_parse(self):
+        codes = parse_content_codes(make_content_codes())
+        tools.assert_equals(codes[0], ('xxzz', 'com.example.test-string', 'String'))
+        tools.assert_equals(codes[1], ('xxzy', 'com.example.test-short', 'UShort'))
+
+    def test_register(self):
+        tools.assert_true(isinstance(Node.deserialize('xxzy\x00\x00\x00\x02\x00\x05').value, Binary))
+        tools.assert_equals(register_content_codes(make_content_codes()), 2)
+        tools.assert_equals(tags.TAGS['minm'], ('dmap.itemname', 'String'))
+        tools.assert_equals(tags.PROPERTIES['com.example.test-short'], ('xxzy', 'UShort'))
+        node = Node.deserialize('xxzy\x00\x00\x00\x02\x00\x05')
+        tools.assert_equals(node.value, UShort(5))
+
+    def test_cache(self):
+        cache = ContentCodesCache(self.directory)
+        tools.assert_false(cache.load(u'Library-2.0.6.0'))
+        cache.store(u'Library-2.0.6.0', make_content_codes())
+        del tags.TAGS['xxzz']
+
+        tools.assert_true(cache.load(u'Library-2.0.6.0'))
+        node = Node.deserialize('xxzz\x00\x00\x00\x03Foo')
+        tools.assert_equals(node.value, String('Foo'))
+
+    def test_server_key(self):
+        node = build_node(('msrv', [
+            ('mstt', 200),
+            ('mpro', (2, 0, 6, 0)),
+            ('apro', (3, 0, 8, 0)),
+            ('minm', 'Library'),
+        ]))
+        tools.assert_equals(server_key(node), u'Library-2.0.6.0-3.0.8.0')
@@ -0,0 +1,83 @@
+# coding: utf8
+
+# The MIT License
+#
+# Copyright (c) 2010 Ryan Bergstrom
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from datetime import datetime
+
+from nose import tools
+
+from dacpy.encoder import ListingEncoder
+from dacpy.types import Container, Node, UnknownTagError, build_node
+
+class TestListingEncoder:
+    def setup(self):
+        self.encoder = ListingEncoder([(0, 'miid'), (1, 'minm'), (2, 'mpro'), (3, 'aeMK')])
+        self.rows = [
+            (1, u'Zem’s', (2, 0, 6, 0), 1),
+            (2, 'Foo', None, True),
+        ]
+
+    def items(self):
+        return [
+            build_node(('mlit', [('miid', 1), ('minm', u'Zem’s'), ('mpro', (2, 0, 6, 0)), ('aeMK', 1)])),
+            build_node(('mlit', [('miid', 2), ('minm', 'Foo'), ('aeMK', 1)])),
+        ]
+
+    def test_listing(self):
+        out, count = self.encoder.listing(self.rows)
+        tools.assert_equals(count, 2)
+        tools.assert_equals(str(out), Node('mlcl', Container(self.items())).serialize())
+
+    def test_response(self):
+        expected = Node('apso', Container([
+            build_node(('mstt', 200)),
+            build_node(('muty', 0)),
+            build_node(('mtco', 10)),
+            build_node(('mrco', 2)),
+            Node('mlcl', Container(self.items())),
+        ]))
+        tools.assert_equals(self.encoder.response(iter(self.rows), 'apso', 10), expected.serialize())
+
+    def test_dict_rows(self):
+        encoder = ListingEncoder([('id', 'miid'), ('added', 'asda')])
+        out, count = encoder.listing([{'id': 3, 'added': datetime(2010, 3, 12)}])
+        tools.assert_equals(Node.deserialize(str(out)), build_node(('mlcl', [
+            ('mlit', [('miid', 3), ('asda', datetime(2010, 3, 12))]),
+        ])))
+
+    def test_errors(self):
+        tools.assert_raises(UnknownTagError, ListingEncoder, [(0, 'xxxx')])
+        tools.assert_raises(ValueError, self.encoder.listing, [(-1, 'Foo', None, 1)])
+        tools.assert_raises(TypeError, self.encoder.listing, [('x', 'Foo', None, 1)])
+
+    def test_failed_row(self):
+        out = bytearray('head')
+        rows = [(1, 'Foo', None, 1), (2, 'Bar', None, 'x')]
+        tools.assert_raises(TypeError, self.encoder.encode_items, iter(rows), out)
+        first = bytearray('head')
+        self.encoder.encode_items(rows[:1], first)
+        tools.assert_equals(out, first)
+
+        out = bytearray('head')
+        tools.assert_raises(TypeError, self.encoder.listing, rows, out)
+        tools.assert_equals(out, bytearray('head'))
@@ -0,0 +1,79 @@
+# coding: utf8
+
+# The MIT License
+#
+# Copyright (c) 2010 Ryan Bergstrom
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import json
+
+from datetime import datetime
+from StringIO import StringIO
+
+from nose import tools
+
+from dacpy import export
+from dacpy.export import export_msgpack, export_ndjson, iter_records
+from dacpy.types import build_node
+
+class TestExport:
+    def setup(self):
+        self.data = build_node(('adbs', [
+            ('mstt', 200),
+            ('mrco', 2),
+            ('mlcl', [
+                ('mlit', [('miid', 1), ('minm', u'Zem’s'), ('asdm', datetime(2010, 3, 12))]),
+                ('mlit', [('miid', 2), ('minm', 'Foo'), ('mpro', (2, 0, 6, 0)), ('ceWM', '\xff')]),
+            ]),
+        ])).serialize()
+
+    def test_records(self):
+        records = list(iter_records(self.data))
+        tools.assert_equals(records, [
+            {'dmap.itemid': 1, 'dmap.itemname': u'Zem’s',
+             'daap.songdatemodified': datetime(2010, 3, 12)},
+            {'dmap.itemid': 2, 'dmap.itemname': u'Foo',
+             'dmap.protocolversion': '2.0.6.0', 'ceWM': '\xff'},
+        ])
+
+    def test_stream(self):
+        records = list(iter_records(StringIO(self.data)))
+        tools.assert_equals([x['dmap.itemid'] for x in records], [1, 2])
+        tools.assert_raises(ValueError, list, iter_records(StringIO(self.data[:-4])))
+
+    def test_browse(self):
+        data = build_node(('abro', [('mstt', 200), ('abar', [('mlit', 'A'), ('mlit', 'B')])])).serialize()
+        tools.assert_equals(list(iter_records(data)), [
+            {'dmap.listingitem': u'A'}, {'dmap.listingitem': u'B'},
+        ])
+
+    def test_ndjson(self):
+        out = StringIO()
+        tools.assert_equals(export_ndjson(self.data, out), 2)
+        lines = out.getvalue().splitlines()
+        tools.assert_equals(json.loads(lines[0])['daap.songdatemodified'], '2010-03-12T00:00:00')
+        tools.assert_equals(json.loads(lines[1])['ceWM'], u'\xff')
+
+    def test_msgpack(self):
+        out = StringIO()
+        if export.msgpack is None:
+            tools.assert_raises(ImportError, export_msgpack, self.data, out)
+        else:
+            tools.assert_equals(export_msgpack(self.data, out), 2)
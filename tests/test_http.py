@@ -0,0 +1,74 @@
+# coding: utf8
+
+# The MIT License
+#
+# Copyright (c) 2010 Ryan Bergstrom
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from nose import tools
+
+from dacpy.http import *
+
+class TestResponseParser:
+    def test_content_length(self):
+        parser = ResponseParser()
+        data = 'HTTP/1.1 200 OK\r\nContent-Length: 5\r\nContent-Type: application/x-dmap-tagged\r\n\r\nHelloHTTP/1.1'
+        tools.assert_equals(parser.feed(data[:20]), '')
+        tools.assert_false(parser.headers_complete)
+        tools.assert_equals(parser.feed(data[20:]), 'HTTP/1.1')
+        tools.assert_true(parser.complete)
+        tools.assert_equals(parser.status, 200)
+        tools.assert_equals(parser.reason, 'OK')
+        tools.assert_equals(parser.headers['content-type'], 'application/x-dmap-tagged')
+        tools.assert_equals(parser.body, 'Hello')
+        tools.assert_true(parser.keep_alive())
+
+    def test_chunked(self):
+        parser = ResponseParser()
+        data = 'HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n5\r\nHello\r\n6;x=y\r\n World\r\n0\r\n\r\n'
+        for char in data:
+            parser.feed(char)
+        tools.assert_true(parser.complete)
+        tools.assert_equals(parser.body, 'Hello World')
+
+    def test_until_close(self):
+        parser = ResponseParser()
+        parser.feed('HTTP/1.0 200 OK\r\n\r\nHello')
+        tools.assert_false(parser.complete)
+        parser.finish()
+        tools.assert_true(parser.complete)
+        tools.assert_equals(parser.body, 'Hello')
+        tools.assert_false(parser.keep_alive())
+
+    def test_no_body(self):
+        parser = ResponseParser()
+        parser.feed('HTTP/1.1 204 No Content\r\n\r\n')
+        tools.assert_true(parser.complete)
+        tools.assert_equals(parser.body, '')
+
+    @tools.raises(HTTPError)
+    def test_truncated(self):
+        parser = ResponseParser()
+        parser.feed('HTTP/1.1 200 OK\r\nContent-Length: 10\r\n\r\nHello')
+        parser.finish()
+
+    @tools.raises(HTTPError)
+    def test_bad_status(self):
+        ResponseParser().feed('garbage\r\n\r\n')
@@ -0,0 +1,67 @@
+# coding: utf8
+
+# The MIT License
+#
+# Copyright (c) 2010 Ryan Bergstrom
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+
+from nose import tools
+
+from dacpy import loadtest
+
+class TestStats:
+    def test_percentile(self):
+        values = range(1, 101)
+        tools.assert_equals(loadtest.percentile(values, 0.5), 50)
+        tools.assert_equals(loadtest.percentile(values, 0.95), 95)
+        tools.assert_equals(loadtest.percentile(values, 0.99), 99)
+        tools.assert_equals(loadtest.percentile([7], 0.99), 7)
+        tools.assert_equals(loadtest.percentile([], 0.5), 0.0)
+
+    def test_summary(self):
+        stats = loadtest.Stats()
+        for x in range(10):
+            stats.record('items', x / 1000.0)
+        stats.error('items')
+        stats.record('login', 0.5)
+        summary = stats.summary(2.0)
+        tools.assert_equals(summary['items']['count'], 10)
+        tools.assert_equals(summary['items']['errors'], 1)
+        tools.assert_equals(summary['items']['rate'], 5.0)
+        tools.assert_equals(summary['total']['count'], 11)
+        tools.assert_equals(summary['total']['p99'], 0.5)
+        report = stats.report(2.0)
+        tools.assert_true(report.splitlines()[-1].startswith('total'))
+
+class TestLoadTest:
+    def test_run_local(self):
+        stats, elapsed = loadtest.run_local(remotes=2, duration=1.0, items=200,
+                                            status_interval=0.2, page_size=10)
+        summary = stats.summary(elapsed)
+        for operation in ('pair', 'login', 'items', 'search', 'getproperty',
+                          'setproperty', 'playstatus', 'long-poll'):
+            tools.assert_true(summary[operation]['count'] > 0, operation)
+            tools.assert_equals(summary[operation]['errors'], 0, operation)
+        commands = sum([summary[x]['count'] for x in loadtest._Remote.commands if x in summary])
+        tools.assert_equals(commands, summary['setproperty']['count'])
+        tools.assert_equals(summary['login']['count'], 2)
+
+    def test_pair_id_required(self):
+        tools.assert_raises(ValueError, loadtest.LoadTest, '127.0.0.1', passcode='1234')
+        tools.assert_raises(SystemExit, loadtest.main, ['--passcode', '1234', '127.0.0.1'])
@@ -22,12 +22,175 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
+import socket
+import threading
+
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
 from nose import tools
 
-from dacpy.pairing import generate_code
+from dacpy.pairing import *
+from dacpy.types import build_node
+
+class PairHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        if not self.path.startswith('/pair?pairingcode=%s&' % generate_code('1234', self.server.pairid)):
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        body = build_node(('cmpa', [
+            ('cmpg', self.server.guid),
+            ('cmnm', 'Test Remote'),
+            ('cmty', 'iPod'),
+        ])).serialize()
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def start_remote(guid, pairid='D06F5B3577C7A001'):
+    server = HTTPServer(('127.0.0.1', 0), PairHandler)
+    server.guid = guid
+    server.pairid = pairid
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,))
+    thread.daemon = True
+    thread.start()
+    remote = TouchRemote('Test', '127.0.0.1', server.server_address[1], pairid)
+    return server, remote
 
 class TestPairingCode:
     def test_code_gen(self):
         code = generate_code('3861', 'D06F5B3577C7A001')
         tools.assert_equals(len(code), 32)
         tools.assert_equals(code, '0BD8D9D49E66BB17F8BD0367A4E42058')
+
+    def test_code_gen_batch(self):
+        codes = generate_codes([
+            ('3861', 'D06F5B3577C7A001'),
+            ('1234', 'D06F5B3577C7A001'),
+            ('3861', 'D06F5B3577C7A001'),
+        ])
+        tools.assert_equals(len(codes), 3)
+        tools.assert_equals(codes[0], '0BD8D9D49E66BB17F8BD0367A4E42058')
+        tools.assert_equals(codes[1], generate_code('1234', 'D06F5B3577C7A001'))
+        tools.assert_equals(codes[2], codes[0])
+
+class TestPairing:
+    def setup(self):
+        self.servers = []
+
+    def teardown(self):
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+
+    def remote(self, guid):
+        server, remote = start_remote(guid)
+        self.servers.append(server)
+        return remote
+
+    def test_pair(self):
+        remote = self.remote(0x0123456789ABCDEFL)
+        tools.assert_equals(remote.pair('1234', 'TestService'), 0x0123456789ABCDEFL)
+
+    @tools.raises(PairingError)
+    def test_bad_code(self):
+        remote = self.remote(1)
+        remote.pair('0000', 'TestService', retries=5)
+
+    def test_pair_all(self):
+        remotes = [self.remote(x) for x in range(1, 6)]
+        pairings = [(x, '1234') for x in remotes] + [(remotes[0], '0000')]
+        results = pair_all(pairings, 'TestService', timeout=5)
+        tools.assert_equals(results[:5], range(1, 6))
+        tools.assert_true(isinstance(results[5], PairingError))
+
+    def test_timeout(self):
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(5)
+        try:
+            remote = TouchRemote('Silent', '127.0.0.1', listener.getsockname()[1], 'D06F5B3577C7A001')
+            results = pair_all([(remote, '1234')], 'TestService', timeout=0.2,
+                               retries=1, retry_delay=0)
+            tools.assert_true(isinstance(results[0], PairingError))
+        finally:
+            listener.close()
+
+class FakeServiceInfo:
+    def __init__(self, port):
+        self.port = port
+
+    def getProperties(self):
+        return {'DvNm': 'Remote %d' % self.port, 'Pair': 'D06F5B3577C7A001'}
+
+    def getAddress(self):
+        return socket.inet_aton('127.0.0.1')
+
+    def getPort(self):
+        return self.port
+
+class FakeZeroconf:
+    def __init__(self):
+        self.lookups = []
+        self.release = threading.Event()
+
+    def getServiceInfo(self, service_type, name, timeout=3000):
+        self.lookups.append(name)
+        self.release.wait(5)
+        if name.startswith('missing'):
+            return None
+        return FakeServiceInfo(len(self.lookups))
+
+class TestTouchRemoteListener:
+    def setup(self):
+        self.mdns = FakeZeroconf()
+        self.listener = TouchRemoteListener(workers=2)
+
+    def teardown(self):
+        self.mdns.release.set()
+        self.listener.close()
+
+    def test_non_blocking_and_coalescing(self):
+        for i in range(3):
+            self.listener.addService(self.mdns, '_touch-remote._tcp.local.', 'remote1')
+        self.listener.addService(self.mdns, '_touch-remote._tcp.local.', 'missing')
+        tools.assert_equals(self.listener.remotes, {})
+        self.mdns.release.set()
+        self.listener.join()
+        tools.assert_equals(sorted(self.mdns.lookups), ['missing', 'remote1'])
+        tools.assert_equals(self.listener.remotes.keys(), ['remote1'])
+        tools.assert_equals(self.listener.remotes['remote1'].address, '127.0.0.1')
+
+        self.listener.addService(self.mdns, '_touch-remote._tcp.local.', 'remote1')
+        self.listener.join()
+        tools.assert_equals(len(self.mdns.lookups), 2)
+
+    def test_ttl_and_remove(self):
+        self.mdns.release.set()
+        self.listener.ttl = 0
+        self.listener.addService(self.mdns, '_touch-remote._tcp.local.', 'remote1')
+        self.listener.join()
+        self.listener.addService(self.mdns, '_touch-remote._tcp.local.', 'remote1')
+        self.listener.join()
+        tools.assert_equals(len(self.mdns.lookups), 2)
+        self.listener.removeService(self.mdns, '_touch-remote._tcp.local.', 'remote1')
+        tools.assert_equals(self.listener.remotes, {})
+
+    def test_expire(self):
+        self.mdns.release.set()
+        self.listener.addService(self.mdns, '_touch-remote._tcp.local.', 'remote1')
+        self.listener.join()
+        tools.assert_equals(self.listener.expire(), [])
+        tools.assert_equals(self.listener.remotes.keys(), ['remote1'])
+        self.listener.ttl = 0
+        tools.assert_equals(self.listener.expire(), ['remote1'])
+        tools.assert_equals(self.listener.remotes, {})
+        self.listener.addService(self.mdns, '_touch-remote._tcp.local.', 'remote1')
+        self.listener.join()
+        tools.assert_equals(len(self.mdns.lookups), 2)
@@ -0,0 +1,69 @@
+# coding: utf8
+
+# The MIT License
+#
+# Copyright (c) 2010 Ryan Bergstrom
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import pickle
+
+from nose import tools
+
+from dacpy.parallel import deserialize_parallel, scan_children
+from dacpy.types import Node, build_node
+
+def listing(count):
+    items = [('mlit', [('miid', i), ('minm', u'Track %d' % i), ('asar', 'Artist')])
+             for i in range(count)]
+    return build_node(('adbs', [('mstt', 200), ('mtco', count),
+                                ('mrco', count), ('mlcl', items)]))
+
+class TestParallel:
+    def test_matches_serial(self):
+        node = listing(50)
+        data = node.serialize()
+        tools.assert_equals(deserialize_parallel(data, 2, 10), node)
+        tools.assert_equals(deserialize_parallel(data, 2, 10), Node.deserialize(data))
+
+    def test_bare_listing(self):
+        node = listing(20).value.value[-1]
+        tools.assert_equals(deserialize_parallel(node.serialize(), 2, 5), node)
+
+    def test_small_listing(self):
+        node = listing(3)
+        tools.assert_equals(deserialize_parallel(node.serialize(), 2), node)
+
+    def test_malformed(self):
+        data = listing(20).serialize()
+        tools.assert_raises(ValueError, deserialize_parallel, data[:-3], 2, 5)
+        # A bad item length inside the listing falls back to a serial decode
+        pos = data.rindex('mlit') + 4
+        bad = data[:pos] + '\x00\x00\x01\x00' + data[pos + 4:]
+        tools.assert_equals(deserialize_parallel(bad, 2, 5), Node.deserialize(bad))
+
+    def test_scan_children(self):
+        data = build_node(('mlcl', [('miid', 1), ('miid', 2)])).serialize()
+        tools.assert_equals(scan_children(data, 8, len(data)), [8, 20])
+        tools.assert_raises(ValueError, scan_children, data, 8, len(data) - 1)
+        tools.assert_raises(ValueError, scan_children, data, 8, 12)
+
+    def test_pickle(self):
+        node = listing(2)
+        tools.assert_equals(pickle.loads(pickle.dumps(node, 2)), node)
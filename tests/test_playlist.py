@@ -0,0 +1,103 @@
+# coding: utf8
+
+# The MIT License
+#
+# Copyright (c) 2010 Ryan Bergstrom
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import random
+
+from nose import tools
+
+from dacpy.playlist import Playlist
+from dacpy.types import Node, build_node
+
+class TestPlaylist:
+    def setup(self):
+        self.playlist = Playlist([101, 102, 103])
+        self.playlist.chunk_size = 4
+
+    def test_basic(self):
+        playlist = self.playlist
+        tools.assert_equals(len(playlist), 3)
+        tools.assert_equals(list(playlist), [(1, 101), (2, 102), (3, 103)])
+        mcti = playlist.insert(1, 104)
+        tools.assert_equals(mcti, 4)
+        tools.assert_equals(playlist.index(mcti), 1)
+        tools.assert_equals(playlist.item_id(mcti), 104)
+        tools.assert_equals(playlist[-1], (3, 103))
+        tools.assert_equals(playlist[1:3], [(4, 104), (2, 102)])
+        playlist.move(3, 0)
+        tools.assert_equals([x[1] for x in playlist], [103, 101, 104, 102])
+        tools.assert_equals(playlist.remove(4), 104)
+        tools.assert_equals(playlist.pop(0), (3, 103))
+        tools.assert_equals(list(playlist), [(1, 101), (2, 102)])
+        tools.assert_false(4 in playlist)
+        tools.assert_raises(KeyError, playlist.remove, 4)
+        tools.assert_raises(ValueError, playlist.insert, 0, 105, 1)
+
+    def test_explicit_ids(self):
+        playlist = Playlist([10, 20])
+        playlist.insert(0, 30, mcti=3)
+        tools.assert_equals(playlist.append(40), 4)
+        tools.assert_equals(playlist.extend([50]), [5])
+        tools.assert_equals(sorted([x[0] for x in playlist]), [1, 2, 3, 4, 5])
+        tools.assert_equals(playlist.remove(3), 30)
+        tools.assert_false(3 in playlist)
+        tools.assert_equals(len(playlist), 4)
+
+    def test_random_edits(self):
+        playlist = self.playlist
+        expected = list(playlist)
+        rand = random.Random(1)
+        for x in range(500):
+            action = rand.randint(0, 2)
+            if action == 0 or not expected:
+                index = rand.randint(0, len(expected))
+                mcti = playlist.insert(index, x)
+                expected.insert(index, (mcti, x))
+            elif action == 1:
+                entry = rand.choice(expected)
+                playlist.remove(entry[0])
+                expected.remove(entry)
+            else:
+                entry = rand.choice(expected)
+                index = rand.randint(0, len(expected) - 1)
+                playlist.move(entry[0], index)
+                expected.remove(entry)
+                expected.insert(index, entry)
+            tools.assert_equals(len(playlist), len(expected))
+        tools.assert_equals(list(playlist), expected)
+        tools.assert_equals(playlist.range(5, 20), expected[5:20])
+        tools.assert_equals([playlist.index(x[0]) for x in expected], range(len(expected)))
+
+    def test_response(self):
+        playlist = Playlist(range(100, 110))
+        expected = build_node(('apso', [
+            ('mstt', 200),
+            ('muty', 0),
+            ('mtco', 10),
+            ('mrco', 2),
+            ('mlcl', [
+                ('mlit', [('mcti', 3), ('miid', 102)]),
+                ('mlit', [('mcti', 4), ('miid', 103)]),
+            ]),
+        ]))
+        tools.assert_equals(Node.deserialize(playlist.response(2, 4)), expected)
@@ -0,0 +1,97 @@
+# coding: utf8
+
+# The MIT License
+#
+# Copyright (c) 2010 Ryan Bergstrom
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from nose import tools
+
+from dacpy.query import *
+from dacpy.types import build_node
+
+def make_listing():
+    return build_node(('adbs', [
+        ('mstt', 200),
+        ('mlcl', [
+            ('mlit', [('miid', 1), ('minm', 'Alpha'), ('asar', 'Foo'), ('aeMK', 1)]),
+            ('mlit', [('miid', 2), ('minm', 'Beta'), ('asar', 'foo'), ('aeMK', 2)]),
+            ('mlit', [('miid', 3), ('minm', 'Gamma'), ('asar', 'Bar'), ('aeMK', 1)]),
+            ('mlit', [('miid', 4), ('minm', 'Alphabet'), ('aeMK', 1)]),
+        ]),
+    ]))
+
+class TestQuery:
+    def setup(self):
+        self.table = ItemTable.from_listing(make_listing())
+
+    def test_equality(self):
+        tools.assert_equals(self.table.select("'daap.songartist:foo'"), [0, 1])
+        tools.assert_equals(self.table.select("'dmap.itemid:3'"), [2])
+
+    def test_and(self):
+        query = "'daap.songartist:Foo'+'com.apple.itunes.mediakind:1'"
+        tools.assert_equals(self.table.select(query), [0])
+        tools.assert_equals(self.table.select(query.replace('+', ' ')), [0])
+
+    def test_or_and_grouping(self):
+        query = "('daap.songartist:Bar','dmap.itemname:Beta')+'com.apple.itunes.mediakind:1'"
+        tools.assert_equals(self.table.select(query), [2])
+
+    def test_negation(self):
+        tools.assert_equals(self.table.select("'daap.songartist!:foo'"), [2, 3])
+        query = "'com.apple.itunes.mediakind:1'+'daap.songartist!:foo'"
+        tools.assert_equals(self.table.select(query), [2, 3])
+
+    def test_wildcard(self):
+        tools.assert_equals(self.table.select("'dmap.itemname:alpha*'"), [0, 3])
+        tools.assert_equals(self.table.select("'dmap.itemname:*a*a*'"), [0, 2, 3])
+
+    def test_escape(self):
+        table = ItemTable([build_node(('mlit', [('minm', "Zem's Library")]))])
+        tools.assert_equals(table.select("'dmap.itemname:zem\\'s*'"), [0])
+
+    def test_incremental_index(self):
+        tools.assert_equals(self.table.select("'daap.songartist:bar'"), [2])
+        self.table.append(build_node(('mlit', [('miid', 5), ('asar', 'BAR')])))
+        tools.assert_equals(self.table.select("'daap.songartist:bar'"), [2, 4])
+        tools.assert_equals(self.table.select("'daap.songartist!:bar'"), [0, 1, 3])
+
+    def test_filter_and_distinct(self):
+        items = self.table.filter("'com.apple.itunes.mediakind:1'")
+        tools.assert_equals([x.miid[0] for x in items], [1, 3, 4])
+        rows = self.table.select("'com.apple.itunes.mediakind:1'")
+        tools.assert_equals(self.table.distinct('asar', rows), [u'Bar', u'Foo'])
+
+    def test_compile_cache(self):
+        query = "'dmap.itemid:1'"
+        tools.assert_true(compile_query(query) is compile_query(query))
+
+    @tools.raises(QueryError)
+    def test_unknown_property(self):
+        Query("'daap.nosuchthing:1'")
+
+    @tools.raises(QueryError)
+    def test_bad_syntax(self):
+        Query("'dmap.itemid:1'+(")
+
+    @tools.raises(QueryError)
+    def test_bad_numeric(self):
+        Query("'dmap.itemid:one'")
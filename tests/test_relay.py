@@ -0,0 +1,129 @@
+# coding: utf8
+
+# The MIT License
+#
+# Copyright (c) 2010 Ryan Bergstrom
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import threading
+
+from nose import tools
+
+from dacpy.http import HTTPError
+from dacpy.relay import Relay, RelayBackend
+from dacpy.types import build_node
+
+class FakeResponse(object):
+    def __init__(self, body):
+        self.body = body
+
+class FakeClient(object):
+    limits = None
+
+    def __init__(self):
+        self.revision = 5
+        self.paths = []
+        self.params = []
+        self.gate = None
+
+    def request(self, path, params=None, timeout=None):
+        return build_node(('mupd', [('mstt', 200), ('musr', self.revision)]))
+
+    def fetch(self, path, params=None, timeout=None):
+        self.paths.append(path)
+        self.params.append(params)
+        if self.gate is not None:
+            self.gate.wait()
+        if path == '/ctrl-int/1/bogus':
+            raise HTTPError('Not found', 404)
+        if path == '/server-info':
+            return FakeResponse(build_node(('msrv', [('minm', 'Library')])).serialize())
+        return FakeResponse(build_node(('adbs', [
+            ('mstt', 200),
+            ('mlcl', [('mlit', [('miid', self.revision), ('minm', path)])]),
+        ])).serialize())
+
+class TestRelay:
+    def setup(self):
+        self.client = FakeClient()
+        self.relay = Relay(self.client)
+
+    def test_cache(self):
+        relay = self.relay
+        first = relay.fetch('/databases/1/items', [('meta', 'dmap.itemid'), ('session-id', 1)])
+        second = relay.fetch('/databases/1/items', {'session-id': 2, 'meta': 'dmap.itemid'})
+        tools.assert_equals(first, second)
+        tools.assert_equals(relay.revision, 5)
+        tools.assert_equals(self.client.paths, ['/databases/1/items'])
+        tools.assert_equals(self.client.params, [[('meta', 'dmap.itemid')]])
+        tools.assert_equals(relay.hits, 1)
+
+        relay.fetch('/databases/1/items', [('meta', 'dmap.itemname')])
+        relay.fetch('/ctrl-int/1/playpause')
+        relay.fetch('/ctrl-int/1/playpause')
+        tools.assert_equals(len(self.client.paths), 4)
+
+    def test_revision(self):
+        relay = self.relay
+        relay.fetch('/databases/1/containers')
+        self.client.revision = 6
+        tools.assert_equals(relay.wait_for_update(), 6)
+        node = relay.request('/databases/1/containers')
+        tools.assert_equals(node.mlcl[0].mlit[0].miid, [6])
+        tools.assert_equals(len(self.client.paths), 2)
+
+        relay.invalidate(6)
+        relay.fetch('/databases/1/containers')
+        tools.assert_equals(len(self.client.paths), 2)
+
+    def test_singleflight(self):
+        relay = self.relay
+        relay.refresh()
+        self.client.gate = threading.Event()
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(relay.fetch('/server-info')))
+                   for x in range(5)]
+        for thread in threads:
+            thread.start()
+        while relay.hits < 4:
+            threading.Event().wait(0.01)
+        self.client.gate.set()
+        for thread in threads:
+            thread.join()
+        tools.assert_equals(len(results), 5)
+        tools.assert_equals(len(set(results)), 1)
+        tools.assert_equals(relay.fetches, 1)
+
+class TestRelayBackend:
+    def setup(self):
+        self.client = FakeClient()
+        self.backend = RelayBackend(Relay(self.client))
+
+    def test_library(self):
+        backend = self.backend
+        tools.assert_equals(backend.name, 'Library')
+        tools.assert_equals(backend.revision, 5)
+        items = backend.items(1)
+        tools.assert_equals([x.miid for x in items], [[5]])
+        tools.assert_equals(backend.items(1), items)
+        tools.assert_equals(self.client.paths, ['/server-info', '/databases/1/items'])
+
+    def test_ctrl_int(self):
+        tools.assert_raises(KeyError, self.backend.ctrl_int, 'bogus', {})
@@ -0,0 +1,81 @@
+# coding: utf8
+
+# The MIT License
+#
+# Copyright (c) 2010 Ryan Bergstrom
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from nose import tools
+
+from dacpy.search import SearchIndex
+from dacpy.types import build_node
+
+def make_item(miid, name, artist, album):
+    return build_node(('mlit', [
+        ('miid', miid), ('minm', name), ('asar', artist), ('asal', album),
+    ]))
+
+class TestSearchIndex:
+    def setup(self):
+        self.index = SearchIndex.from_listing(build_node(('mlcl', [])))
+        self.index.add_listing(build_node(('mlcl', [
+            ('mlit', [('miid', 1), ('minm', 'Come Together'), ('asar', 'The Beatles'), ('asal', 'Abbey Road')]),
+            ('mlit', [('miid', 2), ('minm', 'Something'), ('asar', 'The Beatles'), ('asal', 'Abbey Road')]),
+            ('mlit', [('miid', 3), ('minm', 'Beat It'), ('asar', 'Michael Jackson'), ('asal', 'Thriller')]),
+        ])))
+
+    def test_prefix(self):
+        tools.assert_equals(self.index.search(u'bea'), set([1, 2, 3]))
+        tools.assert_equals(self.index.search(u'BEATL'), set([1, 2]))
+        tools.assert_equals(self.index.search(u'road'), set([1, 2]))
+        tools.assert_equals(self.index.search(u'eat'), set())
+
+    def test_substring(self):
+        tools.assert_equals(self.index.search(u'eatl', substring=True), set([1, 2]))
+        tools.assert_equals(self.index.search(u'ill', substring=True), set([3]))
+        tools.assert_equals(self.index.search(u'th', substring=True), set([1, 2, 3]))
+
+    def test_tags(self):
+        tools.assert_equals(self.index.search(u'th', tags=['minm']), set())
+        tools.assert_equals(self.index.search(u'th', tags=['asal']), set([3]))
+
+    def test_incremental(self):
+        self.index.add(make_item(4, 'Beat Box', 'Art of Noise', 'Who\'s Afraid'))
+        tools.assert_equals(self.index.search(u'beat'), set([1, 2, 3, 4]))
+        self.index.update(make_item(3, 'Billie Jean', 'Michael Jackson', 'Thriller'))
+        tools.assert_equals(self.index.search(u'beat'), set([1, 2, 4]))
+        self.index.remove(1)
+        self.index.remove(2)
+        tools.assert_equals(self.index.search(u'beatles'), set())
+        tools.assert_equals(self.index.search(u'eatl', substring=True), set())
+        tools.assert_equals(len(self.index), 2)
+
+    def test_relisting(self):
+        index = SearchIndex()
+        index.add(build_node(('mlit', [('miid', 1), ('minm', 'Foo')])))
+        index.add_listing(build_node(('mlcl', [
+            ('mlit', [('miid', 2), ('minm', 'Bar')]),
+            ('mlit', [('miid', 1), ('minm', 'Baz')]),
+            ('mlit', [('miid', 2), ('minm', 'Bar Two')]),
+        ])))
+        tools.assert_equals(index.search(u'f'), set())
+        tools.assert_equals(index.search(u'ba'), set([1, 2]))
+        tools.assert_equals(index.search(u'two'), set([2]))
+        tools.assert_equals(len(index), 2)
@@ -0,0 +1,348 @@
+# coding: utf8
+
+# The MIT License
+#
+# Copyright (c) 2010 Ryan Bergstrom
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import socket
+import threading
+import time
+
+from nose import tools
+
+from dacpy.client import DACPClient, HTTPError
+from dacpy.pairing import TouchRemote, generate_code
+from dacpy.server import *
+from dacpy.session import PairingStore
+from dacpy.types import Node, build_node
+
+class StubBackend(Backend):
+    name = 'Test Library'
+
+    def __init__(self):
+        self.state = 3
+        self.commands = []
+        self.volume = 50
+        self._items = [build_node(('mlit', [
+            ('miid', i),
+            ('minm', 'Track %d' % i),
+            ('asar', 'Artist %d' % (i % 3)),
+            ('aeMK', 1),
+        ])) for i in range(1, 11)]
+
+    def playstatus(self):
+        return [('caps', self.state), ('cann', 'Track')]
+
+    def nowplaying(self):
+        return 3
+
+    def artwork(self, item_id, width, height):
+        self.commands.append('artwork')
+        return 'PNG%d-%dx%d' % (item_id, width, height), 'image/png'
+
+    def check_pairing(self, guid):
+        return guid == 0x1234
+
+    def pair(self, pairingcode, servicename):
+        if pairingcode == generate_code('1234', 'D06F5B3577C7A001'):
+            return 0x1234
+
+    def items(self, database_id):
+        if database_id != 1:
+            raise KeyError(database_id)
+        return self._items
+
+    def container_items(self, database_id, container_id):
+        return self._items[:4]
+
+    def ctrl_int(self, command, params):
+        tools.assert_false('session-id' in params)
+        self.commands.append(command)
+        if command == 'getproperty':
+            return ('cmgt', [('mstt', 200), ('cmvo', self.volume)])
+        elif command == 'setproperty':
+            self.volume = int(params['dmcp.volume'])
+            return None
+        elif command in ('playpause', 'nextitem'):
+            return None
+        raise KeyError(command)
+
+class ServerTestCase(object):
+    options = {}
+
+    def setup(self):
+        self.backend = StubBackend()
+        self.server = DACPServer(self.backend, ('127.0.0.1', 0), **self.options)
+        self.thread = threading.Thread(target=self.server.serve_forever, args=(0.02,))
+        self.thread.daemon = True
+        self.thread.start()
+        self.port = self.server.address[1]
+        self.client = DACPClient('127.0.0.1', self.port)
+
+    def teardown(self):
+        self.client.pool.close()
+        self.server.shutdown()
+        self.thread.join()
+        self.server.server_close()
+
+class TestServer(ServerTestCase):
+    def test_login(self):
+        tools.assert_equals(self.client.server_info().minm[0], 'Test Library')
+        tools.assert_true(self.client.login(0x1234) in self.server.sessions)
+        try:
+            self.client.login(0x9999)
+        except HTTPError, e:
+            tools.assert_equals(e.status, 403)
+        else:
+            raise AssertionError('HTTPError not raised')
+
+    def test_pairing_store(self):
+        self.server.pairings = PairingStore()
+        self.server.pairings.add(0x5678)
+        tools.assert_true(self.client.login(0x5678) in self.server.sessions)
+        try:
+            self.client.login(0x1234)
+        except HTTPError, e:
+            tools.assert_equals(e.status, 403)
+        else:
+            raise AssertionError('HTTPError not raised')
+
+    def test_session_required(self):
+        try:
+            self.client.databases()
+        except HTTPError, e:
+            tools.assert_equals(e.status, 403)
+        else:
+            raise AssertionError('HTTPError not raised')
+
+    def test_items(self):
+        self.client.login(0x1234)
+        tools.assert_equals(self.client.databases().mlcl[0].mlit[0].minm[0], 'Test Library')
+        node = self.client.items(1, meta=['dmap.itemname'], index=(2, 4),
+                                 query="'daap.songartist:artist 1'")
+        tools.assert_equals(node.mtco[0], 4)
+        tools.assert_equals(node.mrco[0], 2)
+        tools.assert_equals([x.miid[0] for x in node.mlcl[0].mlit], [7, 10])
+        tools.assert_equals(node.mlcl[0].mlit[0].asar, [])
+        tools.assert_equals(node.mlcl[0].mlit[0].minm[0], 'Track 7')
+
+        node = self.client.request('/databases/1/containers/5/items', [('index', '0-1')])
+        tools.assert_equals(node.tag, 'apso')
+        tools.assert_equals(node.mtco[0], 4)
+        tools.assert_equals(node.mrco[0], 2)
+
+    def test_browse(self):
+        self.client.login(0x1234)
+        node = self.client.request('/databases/1/browse/artists',
+                                   [('filter', "'dmap.itemid!:1'")])
+        artists = [x.value.value.value for x in node.abar[0].mlit]
+        tools.assert_equals(artists, ['Artist 0', 'Artist 1', 'Artist 2'])
+
+    def test_ctrl_int(self):
+        self.client.login(0x1234)
+        tools.assert_equals(self.client.getproperty('dmcp.volume').cmvo[0], 50)
+        tools.assert_equals(self.client.ctrl_int('playpause'), None)
+        tools.assert_equals(self.backend.commands, ['getproperty', 'playpause'])
+        tools.assert_equals(self.client.playstatusupdate().caps[0], 3)
+        try:
+            self.client.ctrl_int('explode')
+        except HTTPError, e:
+            tools.assert_equals(e.status, 404)
+        else:
+            raise AssertionError('HTTPError not raised')
+
+    def test_playstatus_long_poll(self):
+        self.client.login(0x1234)
+        status = self.client.playstatusupdate()
+        revision = status.cmsr[0]
+
+        results = []
+        def poll():
+            client = DACPClient('127.0.0.1', self.port)
+            client.session_id = self.client.session_id
+            results.append(client.playstatusupdate(revision))
+            client.pool.close()
+        threads = [threading.Thread(target=poll) for i in range(10)]
+        for thread in threads:
+            thread.start()
+        while len(self.server.status) < 10:
+            time.sleep(0.01)
+        tools.assert_equals(results, [])
+
+        self.backend.state = 4
+        self.server.status_changed()
+        for thread in threads:
+            thread.join()
+        tools.assert_equals([x.caps[0] for x in results], [4] * 10)
+        tools.assert_equals([x.cmsr[0] for x in results], [revision + 1] * 10)
+
+    def test_update_long_poll(self):
+        self.client.login(0x1234)
+        tools.assert_equals(self.client.request('/update', [('revision-number', 0)]).musr[0], 1)
+        results = []
+        thread = threading.Thread(target=lambda: results.append(
+            self.client.request('/update', [('revision-number', 1)])))
+        thread.start()
+        time.sleep(0.1)
+        tools.assert_equals(results, [])
+        self.backend.revision = 2
+        self.server.library_changed()
+        thread.join()
+        tools.assert_equals(results[0].musr[0], 2)
+
+    def test_artwork(self):
+        self.client.login(0x1234)
+        tools.assert_equals(self.client.nowplaying_artwork(64, 64), 'PNG3-64x64')
+        parser = self.client.fetch('/databases/1/items/3/extra_data/artwork', [('mw', 64), ('mh', 64)])
+        tools.assert_equals(parser.headers['content-type'], 'image/png')
+        tools.assert_equals(self.backend.commands, ['artwork'])
+
+        etag = parser.headers['etag']
+        self.client.headers['If-None-Match'] = etag
+        parser = self.client.fetch('/ctrl-int/1/nowplayingartwork', [('mw', 64), ('mh', 64)])
+        tools.assert_equals(parser.status, 304)
+        tools.assert_equals(parser.body, '')
+
+    def test_listing_etag(self):
+        self.client.login(0x1234)
+        parser = self.client.fetch('/databases/1/items', [('meta', 'dmap.itemname')])
+        tools.assert_equals(parser.status, 200)
+        etag = parser.headers['etag']
+
+        self.client.headers['If-None-Match'] = etag
+        parser = self.client.fetch('/databases/1/items', [('meta', 'dmap.itemname')])
+        tools.assert_equals(parser.status, 304)
+        tools.assert_equals(parser.body, '')
+
+        parser = self.client.fetch('/databases/1/items', [('meta', 'dmap.itemid')])
+        tools.assert_equals(parser.status, 200)
+        tools.assert_not_equals(parser.headers['etag'], etag)
+
+        # Items edited in place, or a new library revision, change the ETag
+        self.backend._items[0].value.value[1].value.value = u'Renamed'
+        parser = self.client.fetch('/databases/1/items', [('meta', 'dmap.itemname')])
+        tools.assert_equals(parser.status, 200)
+        etag = parser.headers['etag']
+        self.client.headers['If-None-Match'] = etag
+        self.backend.revision = 2
+        parser = self.client.fetch('/databases/1/items', [('meta', 'dmap.itemname')])
+        tools.assert_equals(parser.status, 200)
+        tools.assert_true(parser.headers['etag'].startswith('"2-'))
+
+    def test_pipelining(self):
+        self.client.login(0x1234)
+        results = self.client.pipeline([('/ctrl-int/1/nextitem', None)] * 5 +
+                                       [('/databases/1/items', None)])
+        tools.assert_equals(results[:5], [None] * 5)
+        tools.assert_equals(results[5].mtco[0], 10)
+
+    def test_pair(self):
+        remote = TouchRemote('Server', '127.0.0.1', self.port, 'D06F5B3577C7A001')
+        tools.assert_equals(remote.pair('1234', 'Test'), 0x1234)
+
+    def test_content_codes(self):
+        node = self.client.request('/content-codes')
+        names = [x.mcna[0] for x in node.mdcl]
+        tools.assert_true('dmap.itemname' in names)
+
+    def test_concurrent_clients(self):
+        socks = []
+        for i in range(200):
+            sock = socket.create_connection(('127.0.0.1', self.port), 5)
+            sock.sendall('GET /server-info HTTP/1.1\r\nHost: test\r\n\r\n')
+            socks.append(sock)
+        for sock in socks:
+            data = ''
+            while '\r\n\r\n' not in data:
+                data += sock.recv(4096)
+            head, body = data.split('\r\n\r\n', 1)
+            length = int([x for x in head.split('\r\n') if x.startswith('Content-Length')][0].split(':')[1])
+            while len(body) < length:
+                body += sock.recv(4096)
+            tools.assert_true(head.startswith('HTTP/1.1 200'))
+            tools.assert_equals(Node.deserialize(body).tag, 'msrv')
+            sock.close()
+
+    def test_body_too_large(self):
+        sock = socket.create_connection(('127.0.0.1', self.port), 5)
+        sock.sendall('POST /server-info HTTP/1.1\r\nHost: test\r\n'
+                     'Content-Length: 1000000000\r\n\r\n' + 'x' * 4096)
+        data = ''
+        while True:
+            chunk = sock.recv(4096)
+            if not chunk:
+                break
+            data += chunk
+        sock.close()
+        tools.assert_true(data.startswith('HTTP/1.1 413'))
+
+class TestCommandWindow(ServerTestCase):
+    options = {'command_window': 0.2}
+
+    def test_coalesce(self):
+        self.client.login(0x1234)
+        requests = [('/ctrl-int/1/setproperty', [('dmcp.volume', x)]) for x in range(10, 20)]
+        requests.append(('/ctrl-int/1/getproperty', [('properties', 'dmcp.volume')]))
+        results = self.client.pipeline(requests)
+        tools.assert_equals(results[:10], [None] * 10)
+        tools.assert_equals(results[10].cmvo[0], 19)
+        tools.assert_true(self.backend.commands.count('setproperty') < 10)
+        tools.assert_equals(self.backend.commands[-1], 'getproperty')
+        tools.assert_equals(self.server.commands.sent, self.backend.commands.count('setproperty'))
+
+    def test_pipeline_limit(self):
+        from dacpy import server
+        depths = []
+        handle_request = self.server.handle_request
+        def record(request):
+            depths.append(len(request.channel._pending))
+            handle_request(request)
+        self.server.handle_request = record
+        self.client.login(0x1234)
+        requests = [('/ctrl-int/1/setproperty', [('dmcp.volume', x % 100)])
+                    for x in range(server._MAX_PIPELINE * 3)]
+        results = self.client.pipeline(requests)
+        tools.assert_equals(results, [None] * len(requests))
+        tools.assert_equals(max(depths), server._MAX_PIPELINE)
+
+    def test_errors(self):
+        self.client.login(0x1234)
+        tools.assert_equals(self.client.ctrl_int('nextitem'), None)
+        try:
+            self.client.ctrl_int('bogus')
+        except HTTPError, e:
+            tools.assert_equals(e.status, 404)
+        else:
+            raise AssertionError('HTTPError not raised')
+
+class StubListener(object):
+    def __init__(self):
+        self.expired = threading.Event()
+
+    def expire(self):
+        self.expired.set()
+        return []
+
+class TestListener(ServerTestCase):
+    options = {'listener': StubListener()}
+
+    def test_expire(self):
+        tools.assert_true(self.server.listener.expired.wait(5))
@@ -0,0 +1,103 @@
+# coding: utf8
+
+# The MIT License
+#
+# Copyright (c) 2010 Ryan Bergstrom
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import os
+import tempfile
+
+from nose import tools
+
+from dacpy.session import *
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+class TestSessionManager:
+    def setup(self):
+        self.clock = FakeClock()
+        self.sessions = SessionManager(timeout=10, clock=self.clock)
+
+    def test_create_and_lookup(self):
+        sid = self.sessions.create(0x1234)
+        tools.assert_true(sid in self.sessions)
+        tools.assert_equals(self.sessions.get(sid).guid, 0x1234)
+        tools.assert_equals(self.sessions.get(sid + 1), None)
+
+    def test_expiry(self):
+        first = self.sessions.create()
+        self.clock.now += 5
+        second = self.sessions.create()
+        tools.assert_equals(self.sessions.expire(), [])
+
+        self.clock.now += 7
+        tools.assert_false(first in self.sessions)
+        tools.assert_equals(self.sessions.expire(), [first])
+        tools.assert_equals(len(self.sessions), 1)
+
+        self.clock.now += 100
+        tools.assert_equals(self.sessions.expire(), [second])
+        tools.assert_equals(len(self.sessions), 0)
+
+    def test_touch(self):
+        sid = self.sessions.create()
+        for i in range(5):
+            self.clock.now += 8
+            tools.assert_true(self.sessions.touch(sid))
+            tools.assert_equals(self.sessions.expire(), [])
+        self.clock.now += 12
+        tools.assert_false(self.sessions.touch(sid))
+        tools.assert_equals(self.sessions.expire(), [sid])
+
+    def test_remove(self):
+        sid = self.sessions.create()
+        self.sessions.remove(sid)
+        tools.assert_false(sid in self.sessions)
+        self.clock.now += 20
+        tools.assert_equals(self.sessions.expire(), [])
+
+class TestPairingStore:
+    def setup(self):
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+
+    def teardown(self):
+        os.unlink(self.path)
+
+    def test_persistence(self):
+        store = PairingStore(self.path)
+        store.add(0x0123456789ABCDEF, u'Zem’s iPhone')
+        store.add(0x1234)
+        tools.assert_true(0x1234 in store)
+
+        store = PairingStore(self.path)
+        tools.assert_equals(len(store), 2)
+        tools.assert_equals(store.names[0x0123456789ABCDEF], u'Zem’s iPhone')
+
+        store.remove(0x1234)
+        store = PairingStore(self.path)
+        tools.assert_false(0x1234 in store)
+        tools.assert_true(0x0123456789ABCDEF in store)
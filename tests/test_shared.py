@@ -0,0 +1,88 @@
+# coding: utf8
+
+# The MIT License
+#
+# Copyright (c) 2010 Ryan Bergstrom
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+import multiprocessing
+import os.path
+import shutil
+import tempfile
+
+from nose import tools
+
+from dacpy.shared import SharedLibrary, publish
+from dacpy.types import build_node
+
+def _read_names(path, queue):
+    library = SharedLibrary(path)
+    queue.put([x.minm[0] for x in library.root.mlcl[0].mlit])
+    library.close()
+
+class TestSharedLibrary:
+    def setup(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'library')
+        self.node = build_node(('adbs', [
+            ('mstt', 200),
+            ('mlcl', [
+                ('mlit', [('miid', 1), ('minm', u'Zem’s')]),
+                ('mlit', [('miid', 2), ('minm', 'Foo')]),
+            ]),
+        ]))
+        publish(self.path, self.node, 7)
+
+    def teardown(self):
+        shutil.rmtree(self.directory)
+
+    def test_attach(self):
+        library = SharedLibrary(self.path)
+        tools.assert_equals(library.revision, 7)
+        tools.assert_equals(library.root.node(), self.node)
+        items = library.root.mlcl[0].mlit
+        tools.assert_equals([x.miid for x in items], [[1], [2]])
+        tools.assert_equals(library.tape.find('minm'), [5, 8])
+        tools.assert_equals(library.tape.value(5).value, u'Zem’s')
+        library.close()
+
+    def test_revisions(self):
+        library = SharedLibrary(self.path)
+        tools.assert_false(library.stale())
+        publish(self.path, build_node(('adbs', [('mstt', 200), ('mlcl', [])])), 8)
+        tools.assert_true(library.stale())
+        # The old revision stays readable until reattaching
+        tools.assert_equals(library.root.node(), self.node)
+        library = library.reattach()
+        tools.assert_equals(library.revision, 8)
+        tools.assert_equals(library.root.mlcl[0].mlit, [])
+        library.close()
+
+    def test_other_process(self):
+        queue = multiprocessing.Queue()
+        process = multiprocessing.Process(target=_read_names, args=(self.path, queue))
+        process.start()
+        tools.assert_equals(queue.get(timeout=10), [u'Zem’s', u'Foo'])
+        process.join()
+
+    def test_bad_file(self):
+        with open(self.path, 'wb') as f:
+            f.write('not a library at all')
+        tools.assert_raises(ValueError, SharedLibrary, self.path)
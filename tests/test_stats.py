@@ -0,0 +1,67 @@
+# coding: utf8
+
+# The MIT License
+#
+# Copyright (c) 2010 Ryan Bergstrom
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from nose import tools
+
+from dacpy import stats
+from dacpy.pairing import generate_code
+from dacpy.types import Node, build_node
+
+class TestStats:
+    def setup(self):
+        self.recorder = stats.enable()
+
+    def teardown(self):
+        stats.disable()
+
+    def test_snapshot(self):
+        node = build_node(('msrv', [('mstt', 200), ('minm', 'Foo')]))
+        data = node.serialize()
+        Node.deserialize(data)
+        generate_code('3861', 'D06F5B3577C7A001')
+
+        snapshot = self.recorder.snapshot()
+        tools.assert_equals(snapshot['build_node']['mstt']['count'], 1)
+        tools.assert_equals(snapshot['serialize']['msrv']['bytes'], len(data))
+        tools.assert_equals(snapshot['deserialize']['minm'], {
+            'count': 1, 'bytes': 11, 'seconds': snapshot['deserialize']['minm']['seconds'],
+        })
+        tools.assert_equals(snapshot['generate_code']['pair']['count'], 1)
+
+    def test_disable(self):
+        stats.disable()
+        build_node(('mstt', 200))
+        tools.assert_equals(self.recorder.snapshot(), {})
+
+    def test_prometheus(self):
+        Node.deserialize('mstt\x00\x00\x00\x04\x00\x00\x00\xc8')
+        text = self.recorder.prometheus()
+        tools.assert_true('# TYPE dacpy_calls_total counter\n' in text)
+        tools.assert_true('dacpy_calls_total{operation="deserialize",tag="mstt"} 1\n' in text)
+        tools.assert_true('dacpy_bytes_total{operation="deserialize",tag="mstt"} 12\n' in text)
+
+    def test_prometheus_escaping(self):
+        Node.deserialize('"\\\n\t\x00\x00\x00\x00')
+        text = self.recorder.prometheus()
+        tools.assert_true('{operation="deserialize",tag="\\"\\\\\\n\t"} 1\n' in text)
@@ -0,0 +1,62 @@
+# coding: utf8
+
+# The MIT License
+#
+# Copyright (c) 2010 Ryan Bergstrom
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from nose import tools
+
+from dacpy.status import StatusBroadcaster
+from dacpy.types import Node
+
+class TestStatusBroadcaster:
+    def setup(self):
+        self.status = StatusBroadcaster([('caps', 3), ('cann', 'First')])
+        self.calls = []
+
+    def callback(self, revision, data):
+        self.calls.append((revision, data))
+
+    def test_behind(self):
+        tools.assert_equals(self.status.wait(1, self.callback), None)
+        revision, data = self.calls[0]
+        tools.assert_equals(revision, 2)
+        node = Node.deserialize(data)
+        tools.assert_equals(node.cmsr[0], 2)
+        tools.assert_equals(node.cann[0], 'First')
+
+    def test_fan_out(self):
+        for i in range(5):
+            tools.assert_not_equals(self.status.wait(2, self.callback), None)
+        tools.assert_equals(self.calls, [])
+        tools.assert_equals(len(self.status), 5)
+
+        tools.assert_equals(self.status.publish([('caps', 4), ('cann', 'Second')]), 3)
+        tools.assert_equals(len(self.calls), 5)
+        tools.assert_true(all([x[1] is self.calls[0][1] for x in self.calls]))
+        tools.assert_equals(Node.deserialize(self.calls[0][1]).cann[0], 'Second')
+        tools.assert_equals(len(self.status), 0)
+
+    def test_cancel(self):
+        token = self.status.wait(2, self.callback)
+        self.status.cancel(token)
+        self.status.publish([('caps', 4)])
+        tools.assert_equals(self.calls, [])
@@ -0,0 +1,94 @@
+# coding: utf8
+
+# The MIT License
+#
+# Copyright (c) 2010 Ryan Bergstrom
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+from nose import tools
+
+from dacpy.tape import Tape
+from dacpy.types import Node, build_node
+
+class TestTape:
+    def setup(self):
+        self.node = build_node(('adbs', [
+            ('mstt', 200),
+            ('mlcl', [
+                ('mlit', [('miid', 1), ('minm', 'Foo')]),
+                ('mlit', [('miid', 2), ('minm', 'Bar')]),
+            ]),
+            ('mrco', 2),
+        ]))
+        self.data = self.node.serialize()
+        self.tape = Tape(self.data)
+
+    def test_structure(self):
+        tape = self.tape
+        tools.assert_equals(len(tape), 10)
+        tools.assert_equals([tape.tag(x) for x in range(len(tape))], [
+            'adbs', 'mstt', 'mlcl', 'mlit', 'miid', 'minm', 'mlit', 'miid',
+            'minm', 'mrco',
+        ])
+        tools.assert_equals(tape.roots(), [0])
+        tools.assert_equals(tape.children(0), [1, 2, 9])
+        tools.assert_equals(tape.children(2), [3, 6])
+        tools.assert_equals(tape.parent(4), 3)
+        tools.assert_equals(tape.next_sibling(3), 6)
+        tools.assert_equals(tape.next_sibling(6), -1)
+        tools.assert_equals(tape.first_child(1), -1)
+        tools.assert_equals(tape.subtree_end(2), 9)
+        tools.assert_equals(tape.subtree_end(8), 9)
+        tools.assert_equals(tape.subtree_end(9), 10)
+
+    def test_find(self):
+        tape = self.tape
+        tools.assert_equals(tape.find('mlit'), [3, 6])
+        tools.assert_equals(tape.count('miid', 3, tape.subtree_end(3)), 1)
+        tools.assert_equals(tape.child(0, 'mrco'), 9)
+        tools.assert_equals(tape.child(0, 'miid'), -1)
+        # Tags are only matched on entry boundaries
+        tools.assert_equals(tape.find('ttml'), [])
+
+    def test_decode(self):
+        tape = self.tape
+        tools.assert_equals(tape.value(5).value, 'Foo')
+        tools.assert_equals(tape.node(3), self.node.mlcl[0].mlit[0])
+        tools.assert_equals(tape.node(0), self.node)
+        tools.assert_equals(tape.raw(1), build_node(('mstt', 200)).serialize())
+
+    def test_view(self):
+        view = self.tape.view(0)
+        tools.assert_equals(view.mstt, [200])
+        tools.assert_equals([x.minm for x in view.mlcl[0].mlit], [['Foo'], ['Bar']])
+        tools.assert_equals(view, self.node)
+        tools.assert_raises(AttributeError, getattr, self.tape.view(1), 'miid')
+
+    def test_bytearray(self):
+        tape = Tape(bytearray(self.data))
+        tools.assert_equals(tape.node(0), self.node)
+
+    def test_malformed(self):
+        tools.assert_raises(ValueError, Tape, self.data[:-1])
+        # A container that does not hold complete nodes is indexed as a leaf
+        data = 'mlcl\x00\x00\x00\x03Foo'
+        tape = Tape(data)
+        tools.assert_equals(len(tape), 1)
+        tools.assert_equals(tape.node(0), Node.deserialize(data))
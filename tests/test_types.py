@@ -23,6 +23,7 @@
 # THE SOFTWARE.
 
 from datetime import datetime
+from StringIO import StringIO
 from nose import tools
 
 from dacpy.types import *
@@ -166,6 +167,19 @@ class TestContainerType:
         tools.assert_equals(lst.value[1], Node('mlit', String('World')))
         tools.assert_equals(lst.serialize(), bytes)
 
+    def test_scan_nodes(self):
+        bytes = 'mlit\x00\x00\x00\x05Hellomlit\x00\x00\x00\x05World'
+        offsets = []
+        tools.assert_true(scan_nodes(bytes, 0, len(bytes), offsets))
+        tools.assert_equals(offsets, [0, 13])
+        tools.assert_false(scan_nodes(bytes, 0, len(bytes) - 1))
+        tools.assert_false(scan_nodes('Hello', 0, 5))
+
+    def test_tag_type(self):
+        tools.assert_equals(tag_type('mlcl'), Container)
+        tools.assert_equals(tag_type('minm'), String)
+        tools.assert_equals(tag_type('????'), Binary)
+
 class TestNodeType:
     def test_simple_serialize(self):
         node = Node('msup', UByte(255))
@@ -191,12 +205,208 @@ class TestNodeType:
         tools.assert_equals(node.mstt[0], 200)
         tools.assert_equals(node.mlcl[0].minm[0], 'Zem\'s Library')
 
+    def test_passthrough(self):
+        node = build_node(('mlcl', [
+            ('mlit', [('miid', 1), ('minm', 'Foo')]),
+            ('mlit', [('miid', 2), ('minm', 'Bar')]),
+        ]))
+        data = node.serialize()
+        decoded = Node.deserialize(data)
+        tools.assert_equals(decoded.serialize(), data)
+
+        first, second = decoded.value.value
+        first.value.value[1].value = String('Baz')
+        tools.assert_equals(first._raw, None)
+        tools.assert_equals(decoded._raw, None)
+        tools.assert_not_equal(second._raw, None)
+        node.value.value[0].value.value[1].value = String('Baz')
+        tools.assert_equals(decoded.serialize(), node.serialize())
+
+    def test_passthrough_in_place(self):
+        data = build_node(('mlcl', [('mlit', [('minm', 'Foo')]), ('mlit', 'Bar')])).serialize()
+        decoded = Node.deserialize(data)
+        del decoded.value.value[1]
+        tools.assert_equals(decoded.serialize(), build_node(('mlcl', [('mlit', [('minm', 'Foo')])])).serialize())
+
+        decoded = Node.deserialize(data)
+        minm = decoded.value.value[0].value.value[0]
+        minm.value.value = u'Baz'
+        tools.assert_equals(decoded.serialize(), build_node(('mlcl', [('mlit', [('minm', 'Baz')]), ('mlit', 'Bar')])).serialize())
+
+        decoded = Node.deserialize(data)
+        decoded.value.value[1].value.value.value = u'Qux'
+        tools.assert_equals(decoded.serialize(), build_node(('mlcl', [('mlit', [('minm', 'Foo')]), ('mlit', 'Qux')])).serialize())
+
+        decoded = Node.deserialize(data)
+        minm = decoded.value.value[0].value.value[0]
+        minm.value = String('Baz')
+        minm.value.value = u'Quux'
+        tools.assert_equals(decoded.serialize(), build_node(('mlcl', [('mlit', [('minm', 'Quux')]), ('mlit', 'Bar')])).serialize())
+
+    def test_digest(self):
+        pair = ('mlcl', [
+            ('mlit', [('miid', 1), ('minm', 'Foo')]),
+            ('mlit', [('miid', 2), ('minm', 'Bar')]),
+        ])
+        node = build_node(pair)
+        decoded = Node.deserialize(node.serialize())
+        tools.assert_equals(len(node.digest()), 20)
+        tools.assert_equals(decoded.digest(), node.digest())
+        tools.assert_equals(node.etag(), '"%s"' % node.digest().encode('hex'))
+
+        etag = node.etag()
+        node.value.value[1].value.value[1].value = String('Baz')
+        tools.assert_not_equal(node.etag(), etag)
+        decoded.value.value[1].value.value[1].value = String('Baz')
+        tools.assert_equals(decoded.etag(), node.etag())
+
+        minm = node.value.value[0].value.value[1]
+        minm.value.value = u'Qux'
+        tools.assert_not_equal(node.digest(), decoded.digest())
+        decoded.value.value[0].value.value[1].value.value = u'Qux'
+        tools.assert_equals(decoded.digest(), node.digest())
+
+    def test_digest_in_place(self):
+        node = build_node(('mlcl', [('mlit', [('miid', 1), ('minm', 'Foo')])]))
+        etag = node.etag()
+        node.value.value.append(build_node(('mlit', [('miid', 2)])))
+        tools.assert_not_equal(node.etag(), etag)
+
+        etag = node.etag()
+        node.value.value[0].value.value[1] = build_node(('minm', 'Bar'))
+        tools.assert_not_equal(node.etag(), etag)
+        tools.assert_equals(node.etag(), build_node(('mlcl', [
+            ('mlit', [('miid', 1), ('minm', 'Bar')]),
+            ('mlit', [('miid', 2)]),
+        ])).etag())
+
+        etag = node.etag()
+        node.value.value.sort(key=lambda x: -x.miid[0])
+        tools.assert_not_equal(node.etag(), etag)
+
+    def test_digest_shared(self):
+        items = [build_node(('mlit', [('miid', i)])) for i in range(3)]
+        Node('mlcl', Container(items)).digest()
+        node = Node('adbs', Container([Node('mlcl', Container(items))]))
+        etag = node.etag()
+        items[1].value.value[0].value = UInt(7)
+        tools.assert_not_equal(node.etag(), etag)
+
+    def test_diff(self):
+        old = build_node(('adbs', [
+            ('mstt', 200),
+            ('mlcl', [('mlit', [('miid', 1)]), ('mlit', [('miid', 2)])]),
+        ]))
+        new = build_node(('adbs', [
+            ('mstt', 200),
+            ('mlcl', [('mlit', [('miid', 1)]), ('mlit', [('miid', 3)]), ('mlit', [('miid', 4)])]),
+        ]))
+        tools.assert_equals(list(diff(old, old)), [])
+        changes = list(diff(old, new))
+        tools.assert_equals([x[0] for x in changes], [(1, 1, 0), (1, 2)])
+        tools.assert_equals(changes[0][1].value, 2)
+        tools.assert_equals(changes[0][2].value, 3)
+        tools.assert_equals(changes[1][1], None)
+        tools.assert_equals(changes[1][2].miid, [4])
+
     def test_pprint(self):
         node = Node('msrv', Container([
             Node('mstt', UInt(200)),
         ]))
         tools.assert_equals(node.pprint(), 'msrv (dmap.serverinforesponse) --+\n    mstt (dmap.status) = 0x000000C8 == 200\n')
 
+class TestDecodeLimits:
+    def setup(self):
+        self.data = build_node(('mlcl', [
+            ('mlit', [('miid', 1), ('minm', 'Foo' * 10)]),
+            ('mlit', [('miid', 2), ('minm', 'Bar')]),
+            ('mlit', [('miid', 3), ('minm', 'Baz')]),
+        ])).serialize()
+
+    def test_within_limits(self):
+        limits = DecodeLimits(max_bytes=len(self.data), max_depth=3,
+                              max_children=3, max_string=30)
+        tools.assert_equals(Node.deserialize(self.data, limits).serialize(), self.data)
+
+    def test_limits(self):
+        for limits in (DecodeLimits(max_bytes=len(self.data) - 1),
+                       DecodeLimits(max_depth=2),
+                       DecodeLimits(max_children=2),
+                       DecodeLimits(max_string=29)):
+            tools.assert_raises(DecodeLimitError, Node.deserialize, self.data, limits)
+            tools.assert_raises(DecodeLimitError, Node.deserialize, bytearray(self.data), limits)
+
+    def test_declared_size(self):
+        data = 'minm\x7f\xff\xff\xffxxxx'
+        tools.assert_raises(DecodeLimitError, Node.deserialize, data, DecodeLimits(max_string=1024))
+        tools.assert_raises(DecodeLimitError, Node.deserialize, data, DecodeLimits(max_bytes=1024))
+        tools.assert_raises(ValueError, Node.deserialize, data)
+
+    def test_string_fallback(self):
+        data = 'mlcl\x00\x00\x00\x03abc'
+        tools.assert_equals(Node.deserialize(data, DecodeLimits(max_string=3)).value.value, 'abc')
+        tools.assert_raises(DecodeLimitError, Node.deserialize, data, DecodeLimits(max_string=2))
+
+    def test_not_swallowed(self):
+        data = build_node(('mlcl', [('mlit', [('mlit', [('miid', 1)])])])).serialize()
+        try:
+            Node.deserialize(data, DecodeLimits(max_depth=2))
+        except DecodeLimitError, e:
+            tools.assert_true('nested 3 deep' in str(e))
+        else:
+            raise AssertionError('DecodeLimitError not raised')
+
+class TestDump:
+    def setup(self):
+        self.node = build_node(('msrv', [
+            ('mstt', 200),
+            ('mlcl', [('mlit', [('minm', u'Zem\u2019s Library')]), ('mlit', 'Foo')]),
+            ('mlcl', []),
+        ]))
+        self.text = (
+            u'msrv (dmap.serverinforesponse) --+\n'
+            u'    mstt (dmap.status) = 0x000000C8 == 200\n'
+            u'    mlcl (dmap.listing) --+\n'
+            u'        mlit (dmap.listingitem) --+\n'
+            u'            minm (dmap.itemname) = Zem\u2019s Library\n'
+            u'        mlit (dmap.listingitem) --+\n'
+            u'            \'Foo\'\n'
+            u'    mlcl (dmap.listing) --+\n'
+        )
+
+    def test_node(self):
+        tools.assert_equals(self.node.pprint(), self.text)
+        out = StringIO()
+        dump(self.node, out)
+        tools.assert_equals(out.getvalue(), self.text.encode('utf-8'))
+
+    def test_buffer(self):
+        out = StringIO()
+        dump(self.node.serialize(), out, encoding=None)
+        tools.assert_equals(out.getvalue(), self.text)
+
+    def test_max_depth(self):
+        for source in (self.node, self.node.serialize()):
+            out = StringIO()
+            dump(source, out, max_depth=1)
+            tools.assert_equals(out.getvalue(), (
+                'msrv (dmap.serverinforesponse) --+\n'
+                '    mstt (dmap.status) = 0x000000C8 == 200\n'
+                '    mlcl (dmap.listing) --+\n'
+                '        ... (42 bytes)\n'
+                '    mlcl (dmap.listing) --+\n'
+            ))
+
+    def test_damaged(self):
+        data = 'msrv\x00\x00\x00\x0amstt\x00\x00\x00\x02\x00\xc8mstt\x00\x00'
+        out = StringIO()
+        dump(data, out)
+        tools.assert_equals(out.getvalue(), (
+            'msrv (dmap.serverinforesponse) --+\n'
+            '    mstt (dmap.status) = \'\\x00\\xc8\'\n'
+            '<6 bytes not parsed>\n'
+        ))
+
 class TestShorthand:
     def test_build_node(self):
         n1 = build_node(('msrv', [